@@ -0,0 +1,250 @@
+"""In-memory stand-in for the AWS APIs used by the Lambdas.
+
+Every boto3 client created from the default session answers its calls from memory, through botocore's
+before-call event, the same extension point botocore's Stubber uses. Nothing is sent over the network and no
+credentials are needed. Calls are counted per service and operation.
+"""
+import io
+import json
+from collections import Counter
+from hashlib import md5
+
+import boto3
+from botocore.awsrequest import AWSResponse
+from botocore.response import StreamingBody
+
+REGION = "eu-west-1"
+ACCOUNT_ID = "100000000000"
+PAGE_SIZE = 100
+
+
+def _matches(comparisons: list, value, key: str = None) -> bool:
+    """Security Hub filter semantics: EQUALS and PREFIX values are OR'ed, NOT_EQUALS values are AND'ed."""
+    positive, negative = [], []
+    for comparison in comparisons:
+        actual = value.get(comparison["Key"]) if key else value
+        expected = comparison["Value"]
+        if comparison["Comparison"] == "NOT_EQUALS":
+            negative.append(actual != expected)
+        elif comparison["Comparison"] == "PREFIX":
+            positive.append(isinstance(actual, str) and actual.startswith(expected))
+        else:
+            positive.append(actual == expected)
+    return (not positive or any(positive)) and all(negative)
+
+
+# Filter fields used by awsfindingsmanagerlib, mapped to the finding attribute they compare
+_STRING_FILTERS = {
+    "AwsAccountId": lambda finding: finding.get("AwsAccountId"),
+    "ComplianceSecurityControlId": lambda finding: finding.get("Compliance", {}).get("SecurityControlId"),
+    "Id": lambda finding: finding.get("Id"),
+    "ProductName": lambda finding: finding.get("ProductName"),
+    "Region": lambda finding: finding.get("Region"),
+    "Title": lambda finding: finding.get("Title"),
+    "WorkflowStatus": lambda finding: finding.get("Workflow", {}).get("Status"),
+}
+
+
+# Date filters used by incremental sweeps, ISO 8601 timestamps in the same format compare as strings
+_DATE_FILTERS = ("UpdatedAt", "LastObservedAt")
+
+
+def finding_matches_filters(finding: dict, filters: dict) -> bool:
+    for name, comparisons in filters.items():
+        if name in _DATE_FILTERS:
+            if not all(comparison["Start"] <= finding.get(name, "") <= comparison["End"] for comparison in comparisons):
+                return False
+        elif name == "ProductFields":
+            if not _matches(comparisons, finding.get("ProductFields", {}), key="Key"):
+                return False
+        elif name == "ResourceTags":
+            if not any(_matches(comparisons, resource.get("Tags", {}), key="Key")
+                       for resource in finding.get("Resources", [])):
+                return False
+        elif name in _STRING_FILTERS:
+            if not _matches(comparisons, _STRING_FILTERS[name](finding)):
+                return False
+        else:
+            raise NotImplementedError(f"Filter {name} is not supported by the fake Security Hub")
+    return True
+
+
+class FakeAws:
+    """State of the fake AWS account, reset between benchmark scenarios."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.objects = {}
+        self.findings = {}
+        self.messages = []
+        self.items = {}
+        self.secrets = {}
+        self.parameters = {}
+        self.calls = Counter()
+
+    def install(self):
+        """Answers the calls of every client created from the default boto3 session from now on."""
+        boto3.setup_default_session(region_name=REGION)
+        events = boto3.DEFAULT_SESSION.events
+        events.register("before-parameter-build", self._remember_params)
+        events.register("before-call", self._before_call)
+
+    # Seeding helpers
+
+    def put_object(self, bucket: str, key: str, body: bytes):
+        self.objects[(bucket, key)] = (body, f'"{md5(body).hexdigest()}"')
+
+    def put_findings(self, findings: list):
+        self.findings.update((finding["Id"], finding) for finding in findings)
+
+    def put_secret(self, secret_id: str, value: dict):
+        self.secrets[secret_id] = json.dumps(value)
+
+    def pop_messages(self) -> list:
+        messages, self.messages = self.messages, []
+        return messages
+
+    @property
+    def call_count(self) -> int:
+        return sum(self.calls.values())
+
+    # botocore event handlers
+
+    @staticmethod
+    def _remember_params(params, context, **kwargs):
+        context["fake_aws_params"] = dict(params)
+
+    def _before_call(self, model, context, **kwargs):
+        service_name = model.service_model.service_name
+        self.calls[f"{service_name}:{model.name}"] += 1
+        handler = getattr(self, f"_{service_name}_{model.name}", None)
+        if handler is None:
+            raise NotImplementedError(f"{service_name}:{model.name} is not supported by the fake AWS")
+        status_code, parsed = handler(context.get("fake_aws_params", {}))
+        parsed.setdefault("ResponseMetadata", {"HTTPStatusCode": status_code, "RetryAttempts": 0})
+        return AWSResponse(f"https://{service_name}.{REGION}.amazonaws.com", status_code, {}, None), parsed
+
+    @staticmethod
+    def _error(status_code: int, code: str, message: str = "") -> tuple:
+        return status_code, {"Error": {"Code": code, "Message": message}}
+
+    # S3
+
+    def _s3_GetObject(self, params: dict) -> tuple:
+        if (params["Bucket"], params["Key"]) not in self.objects:
+            return self._error(404, "NoSuchKey")
+        body, etag = self.objects[(params["Bucket"], params["Key"])]
+        if params.get("IfNoneMatch") == etag:
+            return self._error(304, "304", "Not Modified")
+        return 200, {"Body": StreamingBody(io.BytesIO(body), len(body)), "ETag": etag, "ContentLength": len(body)}
+
+    def _s3_HeadObject(self, params: dict) -> tuple:
+        if (params["Bucket"], params["Key"]) not in self.objects:
+            return self._error(404, "404", "Not Found")
+        body, etag = self.objects[(params["Bucket"], params["Key"])]
+        return 200, {"ETag": etag, "ContentLength": len(body)}
+
+    def _s3_PutObject(self, params: dict) -> tuple:
+        body = params["Body"] if isinstance(params["Body"], bytes) else params["Body"].read()
+        self.put_object(params["Bucket"], params["Key"], body)
+        return 200, {"ETag": self.objects[(params["Bucket"], params["Key"])][1]}
+
+    # SQS
+
+    def _sqs_SendMessageBatch(self, params: dict) -> tuple:
+        successful = []
+        for entry in params["Entries"]:
+            message_id = f"message-{len(self.messages)}"
+            self.messages.append({"messageId": message_id, "body": entry["MessageBody"]})
+            successful.append({"Id": entry["Id"], "MessageId": message_id, "MD5OfMessageBody": ""})
+        return 200, {"Successful": successful, "Failed": []}
+
+    # Security Hub
+
+    def _securityhub_ListFindingAggregators(self, params: dict) -> tuple:
+        arn = f"arn:aws:securityhub:{REGION}:{ACCOUNT_ID}:finding-aggregator/benchmark"
+        return 200, {"FindingAggregators": [{"FindingAggregatorArn": arn}]}
+
+    def _securityhub_GetFindings(self, params: dict) -> tuple:
+        matching = [finding for finding in self.findings.values()
+                    if finding_matches_filters(finding, params.get("Filters", {}))]
+        start = int(params.get("NextToken") or 0)
+        page_size = params.get("MaxResults", PAGE_SIZE)
+        response = {"Findings": matching[start:start + page_size]}
+        if start + page_size < len(matching):
+            response["NextToken"] = str(start + page_size)
+        return 200, response
+
+    def _securityhub_BatchUpdateFindings(self, params: dict) -> tuple:
+        processed, unprocessed = [], []
+        for identifier in params["FindingIdentifiers"]:
+            finding = self.findings.get(identifier["Id"])
+            if finding is None:
+                unprocessed.append({"FindingIdentifier": identifier, "ErrorCode": "FindingNotFound",
+                                    "ErrorMessage": "Finding not found"})
+                continue
+            if "Workflow" in params:
+                finding["Workflow"] = dict(params["Workflow"])
+            if "Note" in params:
+                finding["Note"] = dict(params["Note"])
+            processed.append(identifier)
+        return 200, {"ProcessedFindings": processed, "UnprocessedFindings": unprocessed}
+
+    # EC2, used by awsfindingsmanagerlib to validate its region
+
+    def _ec2_DescribeRegions(self, params: dict) -> tuple:
+        return 200, {"Regions": [{"RegionName": REGION, "OptInStatus": "opt-in-not-required"}]}
+
+    # DynamoDB, used by the idempotency store of the worker and the claims of the Jira Lambda
+
+    def _dynamodb_BatchGetItem(self, params: dict) -> tuple:
+        responses = {}
+        for table_name, request in params["RequestItems"].items():
+            responses[table_name] = [self.items[(table_name, key["id"]["S"])] for key in request["Keys"]
+                                     if (table_name, key["id"]["S"]) in self.items]
+        return 200, {"Responses": responses, "UnprocessedKeys": {}}
+
+    def _dynamodb_BatchWriteItem(self, params: dict) -> tuple:
+        for table_name, requests in params["RequestItems"].items():
+            for request in requests:
+                item = request["PutRequest"]["Item"]
+                self.items[(table_name, item["id"]["S"])] = item
+        return 200, {"UnprocessedItems": {}}
+
+    def _dynamodb_GetItem(self, params: dict) -> tuple:
+        item = self.items.get((params["TableName"], params["Key"]["id"]["S"]))
+        return 200, {"Item": item} if item else {}
+
+    def _dynamodb_PutItem(self, params: dict) -> tuple:
+        key = (params["TableName"], params["Item"]["id"]["S"])
+        # Only the condition of the claims of the Jira Lambda is supported: the item is absent or expired
+        if "ConditionExpression" in params and key in self.items:
+            now = int(params["ExpressionAttributeValues"][":now"]["N"])
+            if int(self.items[key]["expiration"]["N"]) > now:
+                return self._error(400, "ConditionalCheckFailedException", "The conditional request failed")
+        self.items[key] = params["Item"]
+        return 200, {}
+
+    def _dynamodb_DeleteItem(self, params: dict) -> tuple:
+        key = (params["TableName"], params["Key"]["id"]["S"])
+        # Only the condition of the claims of the Jira Lambda is supported: the item is owned by the owner
+        if "ConditionExpression" in params:
+            owner = params["ExpressionAttributeValues"][":owner"]["S"]
+            if key not in self.items or self.items[key]["owner"]["S"] != owner:
+                return self._error(400, "ConditionalCheckFailedException", "The conditional request failed")
+        self.items.pop(key, None)
+        return 200, {}
+
+    # Secrets Manager and SSM, used by the Jira Lambda
+
+    def _secretsmanager_GetSecretValue(self, params: dict) -> tuple:
+        if params["SecretId"] not in self.secrets:
+            return self._error(400, "ResourceNotFoundException")
+        return 200, {"ARN": params["SecretId"], "SecretString": self.secrets[params["SecretId"]]}
+
+    def _ssm_GetParameter(self, params: dict) -> tuple:
+        if params["Name"] not in self.secrets:
+            return self._error(400, "ParameterNotFound")
+        return 200, {"Parameter": {"Name": params["Name"], "Value": self.secrets[params["Name"]]}}
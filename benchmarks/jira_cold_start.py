@@ -0,0 +1,120 @@
+"""Import time and cold start benchmark of the Jira Lambda.
+
+Every run starts a fresh interpreter, imports the handler and invokes it once with an event for an excluded
+account, which needs neither AWS nor Jira. The benchmark fails when the median cold start exceeds the budget,
+or when the invocation loaded modules that should only be loaded on first use.
+
+Usage:
+    python benchmarks/jira_cold_start.py [--runs 10] [--budget-ms 400] [--top 15]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(ROOT_DIR, "files", "lambda-artifacts", "findings-manager-jira")
+SHARED_DIR = os.path.join(ROOT_DIR, "files", "lambda-artifacts", "shared")
+
+# Modules that an invocation skipping the finding must not load. Powertools imports the botocore package itself
+# for its user agent, which is cheap, so botocore is checked on its client module instead.
+LAZY_MODULES = ("boto3", "botocore.client", "jira", "requests")
+
+EXCLUDED_ACCOUNT_ID = "111111111111"
+ENVIRONMENT = {
+    "AWS_DEFAULT_REGION": "eu-west-1",
+    "EXCLUDE_ACCOUNT_FILTER": json.dumps([EXCLUDED_ACCOUNT_ID]),
+    "JIRA_INSTANCES_CONFIG": json.dumps({}),
+    "LOG_LEVEL": "ERROR",
+    "POWERTOOLS_SERVICE_NAME": "securityhub-findings-manager-jira",
+}
+
+HARNESS = f"""
+import json, sys, time
+started = time.perf_counter()
+import findings_manager_jira
+imported = time.perf_counter()
+
+class Context:
+    function_name = "securityhub-findings-manager-jira"
+    memory_limit_in_mb = 256
+    invoked_function_arn = "arn:aws:lambda:eu-west-1:{EXCLUDED_ACCOUNT_ID}:function:securityhub-findings-manager-jira"
+    aws_request_id = "benchmark"
+
+findings_manager_jira.lambda_handler(
+    {{"detail": {{"findings": [{{"Id": "benchmark", "AwsAccountId": "{EXCLUDED_ACCOUNT_ID}"}}]}}}}, Context()
+)
+invoked = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - started) * 1000,
+    "cold_start_ms": (invoked - started) * 1000,
+    "loaded_lazy_modules": sorted(set(sys.modules) & set({LAZY_MODULES!r})),
+}}))
+"""
+
+
+def _environment() -> dict:
+    return {**os.environ, **ENVIRONMENT, "PYTHONPATH": os.pathsep.join([LAMBDA_DIR, SHARED_DIR])}
+
+
+def import_times(top: int) -> list:
+    """The handler module and its direct imports with the highest cumulative import time, per python -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import findings_manager_jira"],
+        env=_environment(), capture_output=True, text=True, check=True,
+    )
+    modules, children = [], []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        # Imports are reported after their own imports, each nesting level indents the name by two spaces
+        if level == 1:
+            children.append((int(cumulative) / 1000, name.strip()))
+        elif level == 0:
+            if name.strip() == "findings_manager_jira":
+                modules = [(int(cumulative) / 1000, name.strip()), *children]
+            children = []
+    return sorted(modules, reverse=True)[:top]
+
+
+def cold_start() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", HARNESS], env=_environment(), capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=400.0)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    print("Slowest imports of findings_manager_jira (cumulative ms):")
+    for milliseconds, name in import_times(args.top):
+        print(f"  {milliseconds:8.1f}  {name}")
+
+    runs = [cold_start() for _ in range(args.runs)]
+    import_ms = statistics.median(run["import_ms"] for run in runs)
+    cold_start_ms = statistics.median(run["cold_start_ms"] for run in runs)
+    loaded_lazy_modules = sorted({name for run in runs for name in run["loaded_lazy_modules"]})
+    print(f"Median over {args.runs} run(s): import {import_ms:.1f} ms, cold start {cold_start_ms:.1f} ms "
+          f"(budget {args.budget_ms:.1f} ms).")
+
+    failed = False
+    if cold_start_ms > args.budget_ms:
+        print(f"FAIL: median cold start exceeds the budget by {cold_start_ms - args.budget_ms:.1f} ms.")
+        failed = True
+    if loaded_lazy_modules:
+        print(f"FAIL: skipped finding loaded {', '.join(loaded_lazy_modules)}, these should load on first use.")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
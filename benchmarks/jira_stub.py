@@ -0,0 +1,148 @@
+"""Local HTTP stand-in for the Jira REST API calls made by the Jira Lambda."""
+import json
+import re
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROJECT_KEY = "SEC"
+ISSUE_TYPE = {"id": "10001", "name": "Security Advisory"}
+# Workflow of the project, closing an open issue takes the intermediate "Review" transition first
+STATUSES = {"1": "Open", "3": "In Review", "6": "Done"}
+TRANSITIONS = {
+    "1": [{"id": "21", "name": "Review", "to": "3"}],
+    "3": [{"id": "31", "name": "Done", "to": "6"}, {"id": "41", "name": "Reopen", "to": "1"}],
+    "6": [{"id": "41", "name": "Reopen", "to": "1"}],
+}
+
+
+def _status(status_id: str) -> dict:
+    return {"id": status_id, "name": STATUSES[status_id]}
+
+
+class JiraStub:
+    """Jira server on a free local port, keeping its issues in memory and counting requests per endpoint."""
+
+    def __init__(self):
+        self.issues = {}
+        self.calls = Counter()
+        self.request_bytes = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def call_count(self) -> int:
+        return sum(self.calls.values())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.issues.clear()
+            self.calls.clear()
+            self.request_bytes = 0
+
+    def _issue_json(self, key: str) -> dict:
+        issue = self.issues[key]
+        return {"id": issue["id"], "key": key, "self": f"{self.url}/rest/api/2/issue/{issue['id']}",
+                "fields": issue["fields"]}
+
+    def _create_issue(self, body: dict) -> tuple:
+        with self._lock:
+            number = len(self.issues) + 1
+            key = f"{PROJECT_KEY}-{number}"
+            self.issues[key] = {"id": str(10000 + number), "fields": {
+                **body["fields"], "project": {"key": PROJECT_KEY}, "issuetype": ISSUE_TYPE, "status": _status("1")
+            }}
+        return 201, {"id": self.issues[key]["id"], "key": key, "self": f"{self.url}/rest/api/2/issue/{key}"}
+
+    def _create_issues(self, body: dict) -> tuple:
+        issues = [self._create_issue(issue)[1] for issue in body["issueUpdates"]]
+        return 201, {"issues": issues, "errors": []}
+
+    def create_issue(self) -> str:
+        """Creates an open issue directly, for scenarios that close issues."""
+        return self._create_issue({"fields": {"summary": "Benchmark issue"}})[1]["key"]
+
+    def _transitions(self, key: str) -> list:
+        return [{"id": t["id"], "name": t["name"], "to": _status(t["to"])}
+                for t in TRANSITIONS[self.issues[key]["fields"]["status"]["id"]]]
+
+    def _route(self, method: str, path: str, body: dict) -> tuple:
+        path = path.split("?", 1)[0]
+        if method == "GET" and path == "/rest/api/2/serverInfo":
+            return 200, {"baseUrl": self.url, "version": "9.12.0", "versionNumbers": [9, 12, 0],
+                         "deploymentType": "Server", "serverTitle": "Jira stub"}
+        if method == "POST" and path == "/rest/api/2/issue":
+            return self._create_issue(body)
+        if method == "POST" and path == "/rest/api/2/issue/bulk":
+            return self._create_issues(body)
+        match = re.fullmatch(r"/rest/api/2/issue/([^/]+)(/transitions|/comment|/attachments)?", path)
+        if not match:
+            return 404, {"errorMessages": [f"No stub for {method} {path}"]}
+        key = next((key for key, issue in self.issues.items() if match.group(1) in (key, issue["id"])), None)
+        if key is None:
+            return 404, {"errorMessages": ["Issue does not exist"]}
+        if match.group(2) is None and method == "GET":
+            return 200, self._issue_json(key)
+        if match.group(2) == "/transitions" and method == "GET":
+            return 200, {"transitions": self._transitions(key)}
+        if match.group(2) == "/transitions" and method == "POST":
+            transition = next((t for t in self._transitions(key) if t["id"] == str(body["transition"]["id"])), None)
+            if transition is None:
+                return 400, {"errorMessages": ["It seems that you have tried to perform a workflow operation that is not valid."]}
+            self.issues[key]["fields"]["status"] = transition["to"]
+            return 204, None
+        if match.group(2) == "/attachments" and method == "POST":
+            return 200, [{"id": "1", "filename": "attachment", "size": body["size"],
+                          "self": f"{self.url}/rest/api/2/attachment/1"}]
+        if match.group(2) == "/comment" and method == "POST":
+            return 201, {"id": "1", "body": body.get("body", ""), "self": f"{self.url}/rest/api/2/issue/{key}/comment/1"}
+        return 405, {"errorMessages": [f"No stub for {method} {path}"]}
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def _handle(self, method: str):
+                length = int(self.headers.get("Content-Length") or 0)
+                data = self.rfile.read(length) if length else b""
+                stub.request_bytes += length
+                # Attachments are sent as multipart form data, only their size matters
+                is_json = self.headers.get("Content-Type", "").startswith("application/json")
+                body = (json.loads(data or b"{}") if is_json else {"size": length}) if length else {}
+                endpoint = re.sub(r"/issue/(?!bulk$)[^/]+", "/issue/{key}", self.path.split("?", 1)[0])
+                stub.calls[f"{method} {endpoint}"] += 1
+                status_code, response = stub._route(method, self.path, body)
+                payload = json.dumps(response).encode() if response is not None else b""
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
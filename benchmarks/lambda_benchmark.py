@@ -0,0 +1,372 @@
+"""Offline benchmark of the findings manager and Jira Lambda handlers.
+
+The handlers run in-process against in-memory stand-ins: fake_aws answers the S3, SQS, Security Hub, DynamoDB and
+Secrets Manager calls, jira_stub serves the Jira REST API on a local port. Findings and rulebooks are generated by
+synthetic at the requested sizes. For every scenario the benchmark reports invocations per second, p50 and p99
+latency, AWS and Jira calls per finding, the KiB sent to Jira per finding and the peak Python memory of a replay of
+the scenario under tracemalloc.
+
+The Security Hub client side rate limiter is disabled unless --rate-limit is given, so the numbers show the cost
+of the handlers themselves.
+
+Usage:
+    python benchmarks/lambda_benchmark.py [--handlers events,trigger,worker,jira,jira-large,jira-queue,autoclose] [--rules 10,100,1000]
+        [--findings-per-event 1,10,100] [--invocations 20] [--json results.json]
+        [--baseline baseline.json --tolerance 0.25]
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+LAMBDA_ARTIFACTS_DIR = os.path.join(ROOT_DIR, "files", "lambda-artifacts")
+
+BUCKET_NAME = "securityhub-findings-manager-benchmark"
+OBJECT_NAME = "rules.yaml"
+SECRET_ARN = "arn:aws:secretsmanager:eu-west-1:100000000000:secret:jira-benchmark"
+ENVIRONMENT = {
+    "AWS_DEFAULT_REGION": "eu-west-1",
+    "EXCLUDE_ACCOUNT_FILTER": json.dumps([]),
+    "IDEMPOTENCY_TABLE_NAME": "securityhub-findings-manager-worker-idempotency",
+    "JIRA_INSTANCES_CONFIG": json.dumps({
+        "benchmark": {"default_instance": True, "credentials_secretsmanager_arn": SECRET_ARN, "project_key": "SEC",
+                      "include_intermediate_transition": "Review"}
+    }),
+    "LOG_LEVEL": "ERROR",
+    "POWERTOOLS_LOGGER_LOG_EVENT": "false",
+    "POWERTOOLS_SERVICE_NAME": "securityhub-findings-manager-benchmark",
+    "S3_BUCKET_NAME": BUCKET_NAME,
+    "S3_OBJECT_NAME": OBJECT_NAME,
+    "SQS_QUEUE_NAME": "SecurityHubFindingsManagerRuleQueue",
+}
+
+# The handlers print their metrics as EMF log lines, they are written to devnull so their cost is still measured
+METRICS_OUTPUT = open(os.devnull, "w")
+
+# The handlers read their configuration at import time, so the environment and the fake AWS are set up first
+os.environ.update({key: os.environ.get(key, value) for key, value in ENVIRONMENT.items()})
+sys.path[:0] = [BENCHMARKS_DIR] + [os.path.join(LAMBDA_ARTIFACTS_DIR, name)
+                                   for name in ("securityhub-findings-manager", "findings-manager-jira", "shared")]
+
+from fake_aws import FakeAws  # noqa: E402
+from jira_stub import JiraStub  # noqa: E402
+import synthetic  # noqa: E402
+
+FAKE_AWS = FakeAws()
+FAKE_AWS.install()
+
+import finding_fingerprint  # noqa: E402
+import findings_manager_jira  # noqa: E402
+import helpers  # noqa: E402
+import issue_claims  # noqa: E402
+import rulebook  # noqa: E402
+import securityhub_client  # noqa: E402
+import securityhub_events  # noqa: E402
+import securityhub_trigger  # noqa: E402
+import securityhub_trigger_worker  # noqa: E402
+import strategize_findings_manager  # noqa: E402
+
+
+class Context:
+    function_name = "securityhub-findings-manager-benchmark"
+    memory_limit_in_mb = 256
+    invoked_function_arn = "arn:aws:lambda:eu-west-1:100000000000:function:securityhub-findings-manager-benchmark"
+    aws_request_id = "benchmark"
+
+    @staticmethod
+    def get_remaining_time_in_millis() -> int:
+        return 60000
+
+
+def reset_containers():
+    """Drops the state the handlers keep across warm invocations, so every scenario starts with a cold container."""
+    strategize_findings_manager._RULES_CACHE.update(etag=None, findings_manager=None, validated_at=0.0)
+    helpers._jira_clients.clear()
+    helpers._transition_graphs.clear()
+    helpers._jira_resume_at.clear()
+    findings_manager_jira._jira_routing = None
+    finding_fingerprint._STORE = None
+    issue_claims._store = None
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+class Scenario:
+    """A handler invoked once for every prepared event, against freshly seeded stand-ins."""
+
+    def __init__(self, name: str, rules: int, findings_per_event, invocations: int, jira: JiraStub):
+        self.name = name
+        self.rules = rules
+        self.findings_per_event = findings_per_event
+        self.invocations = invocations
+        self.jira = jira
+
+    def prepare(self) -> tuple:
+        """Seeds the stand-ins, returns the handler, the events and the number of findings they cover."""
+        raise NotImplementedError
+
+    def run(self, trace_memory: bool = False) -> dict:
+        FAKE_AWS.reset()
+        self.jira.reset()
+        reset_containers()
+        handler, events, findings = self.prepare()
+        FAKE_AWS.calls.clear()
+        self.jira.calls.clear()
+
+        if trace_memory:
+            tracemalloc.start()
+        latencies = []
+        started = time.perf_counter()
+        for event in events:
+            invoked = time.perf_counter()
+            with redirect_stdout(METRICS_OUTPUT):
+                handler(event, Context())
+            latencies.append(time.perf_counter() - invoked)
+        elapsed = time.perf_counter() - started
+        peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+
+        return {
+            "handler": self.name,
+            "rules": self.rules,
+            "findings_per_event": self.findings_per_event,
+            "invocations": len(latencies),
+            "invocations_per_second": len(latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "aws_calls_per_finding": FAKE_AWS.call_count / max(findings, 1),
+            "jira_calls_per_finding": self.jira.call_count / max(findings, 1),
+            "jira_request_kib_per_finding": self.jira.request_bytes / 1024 / max(findings, 1),
+            "peak_memory_mib": peak_memory / 2 ** 20 if peak_memory is not None else None,
+            "aws_calls": dict(FAKE_AWS.calls),
+            "jira_calls": dict(self.jira.calls),
+        }
+
+
+class EventsScenario(Scenario):
+    def prepare(self) -> tuple:
+        rules_yaml = synthetic.rules_yaml(synthetic.generate_rules(self.rules))
+        FAKE_AWS.put_object(BUCKET_NAME, OBJECT_NAME, rules_yaml)
+        # As compiled by the trigger Lambda when the rules object was deployed, from the version it uploaded
+        etag = FAKE_AWS.objects[(BUCKET_NAME, OBJECT_NAME)][1]
+        FAKE_AWS.put_object(BUCKET_NAME, strategize_findings_manager.S3_COMPILED_OBJECT_NAME,
+                            rulebook.dump_rulebook(rulebook.compile_rulebook(rules_yaml, etag)))
+        events = []
+        for invocation in range(self.invocations):
+            findings = synthetic.generate_findings(self.findings_per_event, self.rules, seed=invocation,
+                                                   start=invocation * self.findings_per_event)
+            FAKE_AWS.put_findings(findings)
+            events.append(synthetic.imported_event(findings))
+        return securityhub_events.lambda_handler, events, self.invocations * self.findings_per_event
+
+
+class TriggerScenario(Scenario):
+    def prepare(self) -> tuple:
+        FAKE_AWS.put_object(BUCKET_NAME, OBJECT_NAME, synthetic.rules_yaml(synthetic.generate_rules(self.rules)))
+        event = {"Records": [{"s3": {"bucket": {"name": BUCKET_NAME}, "object": {"key": OBJECT_NAME}}}]}
+
+        def first_deploy(event, context):
+            # Without the manifest of the previous invocation every invocation puts all rules on SQS
+            FAKE_AWS.objects.pop((BUCKET_NAME, strategize_findings_manager.S3_MANIFEST_OBJECT_NAME), None)
+            return securityhub_trigger.lambda_handler(event, context)
+
+        # Findings do not apply to the trigger, calls are reported per rule instead
+        return first_deploy, [event] * self.invocations, self.invocations * self.rules
+
+
+class WorkerScenario(Scenario):
+    def __init__(self, *args, hub_findings: int, batch_size: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hub_findings = hub_findings
+        self.batch_size = batch_size
+
+    def prepare(self) -> tuple:
+        FAKE_AWS.put_object(BUCKET_NAME, OBJECT_NAME, synthetic.rules_yaml(synthetic.generate_rules(self.rules)))
+        with redirect_stdout(METRICS_OUTPUT):
+            securityhub_trigger.lambda_handler({}, Context())
+        messages = FAKE_AWS.pop_messages()
+        FAKE_AWS.put_findings(synthetic.generate_findings(self.hub_findings, self.rules))
+        events = [{"Records": messages[start:start + self.batch_size]}
+                  for start in range(0, len(messages), self.batch_size)]
+        # Every batch of rules is swept once, the sweep as a whole covers the findings in the hub
+        return securityhub_trigger_worker.lambda_handler, events[:self.invocations], self.hub_findings
+
+
+class JiraScenario(Scenario):
+    def __init__(self, *args, vulnerabilities: int = 0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.vulnerabilities = vulnerabilities
+
+    def prepare(self) -> tuple:
+        FAKE_AWS.put_secret(SECRET_ARN, {"url": self.jira.url, "apiuser": "benchmark", "apikey": "benchmark"})
+        events = []
+        for invocation in range(self.invocations):
+            findings = synthetic.generate_findings(self.findings_per_event, 1, seed=invocation,
+                                                   start=invocation * self.findings_per_event)
+            if self.vulnerabilities:
+                findings = [synthetic.add_vulnerabilities(finding, self.vulnerabilities) for finding in findings]
+            FAKE_AWS.put_findings(findings)
+            events.append(synthetic.imported_event(findings))
+        return findings_manager_jira.lambda_handler, events, self.invocations * self.findings_per_event
+
+
+class JiraQueueScenario(Scenario):
+    def prepare(self) -> tuple:
+        FAKE_AWS.put_secret(SECRET_ARN, {"url": self.jira.url, "apiuser": "benchmark", "apikey": "benchmark"})
+        events = []
+        for invocation in range(self.invocations):
+            findings = synthetic.generate_findings(self.findings_per_event, 1, seed=invocation,
+                                                   start=invocation * self.findings_per_event)
+            FAKE_AWS.put_findings(findings)
+            # As sent to the queue by the Step Function, one message per finding and a batch per invocation
+            events.append({"Records": [
+                {"messageId": finding["Id"], "body": json.dumps({"detail": {"findings": [finding]}, "suppressed": False})}
+                for finding in findings
+            ]})
+        return findings_manager_jira.lambda_handler, events, self.invocations * self.findings_per_event
+
+
+class JiraBurstScenario(Scenario):
+    def prepare(self) -> tuple:
+        FAKE_AWS.put_secret(SECRET_ARN, {"url": self.jira.url, "apiuser": "benchmark", "apikey": "benchmark"})
+        findings = synthetic.generate_findings(self.findings_per_event, 1, seed=0)
+        FAKE_AWS.put_findings(findings)
+        # Every invocation receives the same new findings, as when Security Hub emits them again before the note of
+        # their issue is written, only the first invocation claims them
+        issue_claims._store = issue_claims.InMemoryClaimStore()
+        events = [synthetic.imported_event(findings) for _ in range(self.invocations)]
+        return findings_manager_jira.lambda_handler, events, self.invocations * self.findings_per_event
+
+
+class AutocloseScenario(Scenario):
+    def prepare(self) -> tuple:
+        FAKE_AWS.put_secret(SECRET_ARN, {"url": self.jira.url, "apiuser": "benchmark", "apikey": "benchmark"})
+        events = []
+        for invocation in range(self.invocations):
+            findings = synthetic.generate_findings(self.findings_per_event, 1, seed=invocation,
+                                                   start=invocation * self.findings_per_event)
+            for finding in findings:
+                # Resolved findings of a ticket that was created earlier, closed through the "Review" transition
+                finding["Workflow"]["Status"] = "NOTIFIED"
+                finding["Compliance"]["Status"] = "PASSED"
+                finding["Note"] = {"Text": json.dumps({"jiraIssue": self.jira.create_issue(), "jiraInstance": "benchmark"}),
+                                   "UpdatedBy": "benchmark", "UpdatedAt": finding["UpdatedAt"]}
+            FAKE_AWS.put_findings(findings)
+            events.append(synthetic.imported_event(findings))
+        return findings_manager_jira.lambda_handler, events, self.invocations * self.findings_per_event
+
+
+def scenarios(args, jira: JiraStub) -> list:
+    result = []
+    for handler in args.handlers:
+        if handler == "events":
+            result += [EventsScenario("events", rules, findings, args.invocations, jira)
+                       for rules in args.rules for findings in args.findings_per_event]
+        elif handler == "trigger":
+            result += [TriggerScenario("trigger", rules, None, args.invocations, jira) for rules in args.rules]
+        elif handler == "worker":
+            result += [WorkerScenario("worker", rules, None, args.invocations, jira,
+                                      hub_findings=args.hub_findings, batch_size=args.sqs_batch_size)
+                       for rules in args.rules]
+        elif handler == "jira":
+            result += [JiraScenario("jira", 0, findings, args.invocations, jira) for findings in args.findings_per_event]
+        elif handler == "jira-large":
+            # Inspector package vulnerability findings, their full event is attached instead of put in the description
+            result += [JiraScenario("jira-large", 0, findings, args.invocations, jira, vulnerabilities=200)
+                       for findings in args.findings_per_event]
+        elif handler == "jira-queue":
+            result += [JiraQueueScenario("jira-queue", 0, findings, args.invocations, jira)
+                       for findings in args.findings_per_event]
+        elif handler == "jira-burst":
+            result += [JiraBurstScenario("jira-burst", 0, findings, args.invocations, jira)
+                       for findings in args.findings_per_event]
+        elif handler == "autoclose":
+            result += [AutocloseScenario("autoclose", 0, findings, args.invocations, jira)
+                       for findings in args.findings_per_event]
+        else:
+            raise ValueError(f"Unknown handler {handler}")
+    return result
+
+
+def regressions(results: list, baseline: list, tolerance: float) -> list:
+    """Scenarios whose latency or calls per finding grew by more than the tolerance compared to the baseline."""
+    baseline_results = {(r["handler"], r["rules"], r["findings_per_event"]): r for r in baseline}
+    found = []
+    for result in results:
+        previous = baseline_results.get((result["handler"], result["rules"], result["findings_per_event"]))
+        if not previous:
+            continue
+        for metric in ("p50_ms", "aws_calls_per_finding", "jira_calls_per_finding"):
+            if result[metric] > previous[metric] * (1 + tolerance) and result[metric] - previous[metric] > 1e-9:
+                found.append(f"{result['handler']} rules={result['rules']} findings_per_event="
+                             f"{result['findings_per_event']}: {metric} {previous[metric]:.3f} -> {result[metric]:.3f}")
+    return found
+
+
+def print_results(results: list):
+    header = (f"{'handler':<10} {'rules':>6} {'findings':>8} {'inv':>5} {'inv/s':>9} {'p50 ms':>9} {'p99 ms':>9} "
+              f"{'aws/f':>7} {'jira/f':>7} {'KiB/f':>7} {'peak MiB':>9}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        peak_memory = f"{r['peak_memory_mib']:9.1f}" if r["peak_memory_mib"] is not None else f"{'-':>9}"
+        print(f"{r['handler']:<10} {r['rules']:>6} {r['findings_per_event'] or '-':>8} {r['invocations']:>5} "
+              f"{r['invocations_per_second']:9.1f} {r['p50_ms']:9.2f} {r['p99_ms']:9.2f} "
+              f"{r['aws_calls_per_finding']:7.2f} {r['jira_calls_per_finding']:7.2f} "
+              f"{r['jira_request_kib_per_finding']:7.1f} {peak_memory}")
+
+
+def main() -> int:
+    def int_list(value: str) -> list:
+        return [int(item) for item in value.split(",")]
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--handlers", type=lambda value: value.split(","), default=["events", "trigger", "worker", "jira", "jira-large", "jira-queue", "jira-burst", "autoclose"])
+    parser.add_argument("--rules", type=int_list, default=[10, 100, 1000])
+    parser.add_argument("--findings-per-event", type=int_list, default=[1, 10, 100])
+    parser.add_argument("--invocations", type=int, default=20)
+    parser.add_argument("--hub-findings", type=int, default=1000, help="findings in Security Hub for the worker")
+    parser.add_argument("--sqs-batch-size", type=int, default=30, help="SQS records per worker invocation")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the Security Hub client side rate limiter")
+    parser.add_argument("--skip-memory", action="store_true", help="skip the tracemalloc replay of every scenario")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="fail on regressions compared to the results in this file")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    if not args.rate_limit:
+        securityhub_client.TokenBucket.acquire = lambda self: 0.0
+
+    results = []
+    with JiraStub() as jira:
+        for scenario in scenarios(args, jira):
+            result = scenario.run()
+            if not args.skip_memory:
+                result["peak_memory_mib"] = scenario.run(trace_memory=True)["peak_memory_mib"]
+            results.append(result)
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            found = regressions(results, json.load(file), args.tolerance)
+        for regression in found:
+            print(f"REGRESSION: {regression}")
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""Synthetic Security Hub findings and rulebooks for the offline benchmarks."""
+import random
+from datetime import datetime, timezone
+
+import yaml
+
+ACCOUNT_IDS = [f"{number:012d}" for number in range(100000000001, 100000000021)]
+REGIONS = ["eu-west-1", "eu-central-1", "us-east-1"]
+PRODUCT_NAME = "Security Hub"
+PRODUCT_ARN = "arn:aws:securityhub:eu-west-1::product/aws/securityhub"
+SEVERITIES = [("LOW", 1), ("MEDIUM", 40), ("HIGH", 70), ("CRITICAL", 90)]
+
+
+def control_id(number: int) -> str:
+    return f"BENCH.{number}"
+
+
+def generate_rules(count: int, seed: int = 0) -> list:
+    """Rules for distinct security controls, mixing the match_on attributes found in real rulebooks."""
+    rng = random.Random(seed)
+    rules = []
+    for number in range(count):
+        match_on = {"security_control_id": control_id(number)}
+        kind = rng.random()
+        if kind < 0.2:
+            match_on["resource_id_regexps"] = [f"^arn:aws:s3:::.*-{rng.choice(['dev', 'acc', 'tst'])}$"]
+        elif kind < 0.3:
+            match_on["regions"] = rng.sample(REGIONS, 2)
+        elif kind < 0.4:
+            match_on["tags"] = [{"key": "ManagedBy", "value": "Terraform"}]
+        rules.append({"note": f"Benchmark rule {number}", "action": "SUPPRESSED", "match_on": match_on})
+    return rules
+
+
+def rules_yaml(rules: list) -> bytes:
+    return yaml.safe_dump({"Rules": rules}, sort_keys=False).encode()
+
+
+def generate_finding(number: int, control_count: int, rng: random.Random, workflow_status: str = "NEW") -> dict:
+    """A Security Hub finding in ASFF, for one of the first control_count controls."""
+    now = datetime.now(timezone.utc).isoformat()
+    account_id = rng.choice(ACCOUNT_IDS)
+    region = rng.choice(REGIONS)
+    label, normalized = rng.choice(SEVERITIES)
+    security_control_id = control_id(rng.randrange(max(control_count, 1)))
+    resource_id = f"arn:aws:s3:::bucket-{number}-{rng.choice(['dev', 'acc', 'prd'])}"
+    tags = {"ManagedBy": rng.choice(["Terraform", "CFN", "Console"])}
+    return {
+        "SchemaVersion": "2018-10-08",
+        "Id": f"arn:aws:securityhub:{region}:{account_id}:finding/{number:08d}",
+        "ProductArn": PRODUCT_ARN,
+        "ProductName": PRODUCT_NAME,
+        "CompanyName": "AWS",
+        "GeneratorId": f"security-control/{security_control_id}",
+        "AwsAccountId": account_id,
+        "AwsAccountName": f"account-{account_id[-4:]}",
+        "Region": region,
+        "Types": ["Software and Configuration Checks/Industry and Regulatory Standards"],
+        "FindingProviderFields": {"Types": ["Software and Configuration Checks"]},
+        "CreatedAt": now,
+        "UpdatedAt": now,
+        "FirstObservedAt": now,
+        "LastObservedAt": now,
+        "Severity": {"Label": label, "Normalized": normalized},
+        "Title": f"Benchmark control {security_control_id}",
+        "Description": f"Synthetic finding {number} for control {security_control_id}.",
+        "ProductFields": {"ControlId": security_control_id, "aws/securityhub/ProductName": PRODUCT_NAME},
+        "Resources": [{"Type": "AwsS3Bucket", "Id": resource_id, "Region": region, "Tags": tags}],
+        "Compliance": {"Status": "FAILED", "SecurityControlId": security_control_id},
+        "Workflow": {"Status": workflow_status},
+        "WorkflowState": workflow_status,
+        "RecordState": "ACTIVE",
+    }
+
+
+def generate_findings(count: int, control_count: int, seed: int = 0, start: int = 0) -> list:
+    """Findings spread over twice as many controls as there are rules, so about half of them match a rule."""
+    rng = random.Random(seed)
+    return [generate_finding(number, control_count * 2, rng) for number in range(start, start + count)]
+
+
+def add_vulnerabilities(finding: dict, count: int, packages_per_vulnerability: int = 5) -> dict:
+    """Turns a finding into one with the large Vulnerabilities block of an Inspector package vulnerability finding."""
+    finding["Vulnerabilities"] = [{
+        "Id": f"CVE-2026-{number:05d}",
+        "Cvss": [{"BaseScore": 7.5, "BaseVector": "CVSS:3.1/AV:N/AC:L/PR:N/UI:N/S:U/C:N/I:N/A:H", "Version": "3.1"}],
+        "FixAvailable": "YES",
+        "ReferenceUrls": [f"https://nvd.nist.gov/vuln/detail/CVE-2026-{number:05d}"],
+        "VulnerablePackages": [{"Name": f"package-{number}-{package}", "Version": "1.0.0", "Epoch": "0",
+                                "PackageManager": "OS", "FixedInVersion": "1.0.1", "Remediation": "Upgrade"}
+                               for package in range(packages_per_vulnerability)],
+    } for number in range(count)]
+    return finding
+
+
+def imported_event(findings: list) -> dict:
+    """An EventBridge "Security Hub Findings - Imported" event holding the findings."""
+    return {
+        "version": "0",
+        "id": "benchmark",
+        "detail-type": "Security Hub Findings - Imported",
+        "source": "aws.securityhub",
+        "account": findings[0]["AwsAccountId"] if findings else ACCOUNT_IDS[0],
+        "region": "eu-west-1",
+        "resources": [finding["Id"] for finding in findings],
+        "detail": {"findings": findings},
+    }
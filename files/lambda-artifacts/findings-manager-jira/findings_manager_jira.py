@@ -1,15 +1,16 @@
 import json
 import os
-import boto3
+from concurrent.futures import ThreadPoolExecutor
 from aws_lambda_powertools import Logger
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from jira.exceptions import JIRAError
+from finding_fingerprint import remember_findings, unchanged_findings
+from issue_claims import IssueClaimed, claim_issue, release_issue_claim
+from jira_eligibility import is_new_finding, is_resolved_finding
+from observability import add_count, instrument_handler, timed
 import helpers
 
+# AWS clients and the jira package are loaded on first use by helpers, see helpers.get_boto3_client
 logger = Logger()
-securityhub = boto3.client('securityhub')
-secretsmanager = boto3.client('secretsmanager')
-ssm = boto3.client('ssm')
 
 REQUIRED_ENV_VARS = [
     'EXCLUDE_ACCOUNT_FILTER',
@@ -19,20 +20,32 @@ REQUIRED_ENV_VARS = [
 DEFAULT_JIRA_AUTOCLOSE_COMMENT = 'Security Hub finding has been resolved. Autoclosing the issue.'
 DEFAULT_JIRA_AUTOCLOSE_TRANSITION = 'Done'
 
-STATUS_NEW = 'NEW'
 STATUS_NOTIFIED = 'NOTIFIED'
 STATUS_RESOLVED = 'RESOLVED'
 STATUS_SUPPRESSED = 'SUPPRESSED'
-COMPLIANCE_STATUS_FAILED = 'FAILED'
-COMPLIANCE_STATUS_NOT_AVAILABLE = 'NOT_AVAILABLE'
-COMPLIANCE_STATUS_PASSED = 'PASSED'
-COMPLIANCE_STATUS_WARNING = 'WARNING'
-COMPLIANCE_STATUS_MISSING = 'MISSING'
-RECORD_STATE_ACTIVE = 'ACTIVE'
-RECORD_STATE_ARCHIVED = 'ARCHIVED'
+FINGERPRINT_SCOPE = 'jira'
+# Threads processing the findings of a queued batch, the calls per Jira instance are limited by its call slots
+JIRA_QUEUE_WORKERS = int(os.getenv('JIRA_QUEUE_WORKERS', '8'))
+# Milliseconds of the invocation kept free, a queued finding not started before is returned to the queue instead
+JIRA_QUEUE_DEADLINE_MARGIN_MS = 15000
+
+# Module level state survives across warm invocations of the same Lambda container
+_jira_routing = None
+
+
+def get_jira_routing() -> helpers.JiraRouting:
+    """Parse and validate the Jira instances configuration once per container."""
+    global _jira_routing
+    if _jira_routing is None:
+        _jira_routing = helpers.build_jira_routing(
+            json.loads(os.environ.get('JIRA_INSTANCES_CONFIG', '{}')),
+            json.loads(os.environ['EXCLUDE_ACCOUNT_FILTER'])
+        )
+    return _jira_routing
 
 
 @logger.inject_lambda_context
+@instrument_handler
 def lambda_handler(event: dict, context: LambdaContext):
     # Validate required environment variables
     try:
@@ -41,95 +54,365 @@ def lambda_handler(event: dict, context: LambdaContext):
         logger.error(f"Environment variable validation failed: {e}")
         raise RuntimeError("Required environment variables are missing.") from e
 
-    # Get finding account ID (needed for instance lookup)
-    event_detail = event['detail']
-    finding = event_detail['findings'][0]
-    finding_account_id = finding['AwsAccountId']
-    
+    # In queued mode the findings arrive in batches of SQS messages instead of one Step Function invocation each
+    if 'Records' in event:
+        return process_queued_findings(event['Records'], context)
+
     # Extract global settings
+    event_detail = event['detail']
     jira_autoclose_comment = os.getenv('JIRA_AUTOCLOSE_COMMENT', DEFAULT_JIRA_AUTOCLOSE_COMMENT)
     jira_autoclose_transition = os.getenv('JIRA_AUTOCLOSE_TRANSITION', DEFAULT_JIRA_AUTOCLOSE_TRANSITION)
-    exclude_account_filter = json.loads(os.environ['EXCLUDE_ACCOUNT_FILTER'])
-    
-    if finding_account_id in exclude_account_filter:
-        logger.info(
-            f"Account {finding_account_id} is in the global exclude list. Skipping Jira ticket creation."
-        )
-        return
-    
+
     # Load multi-instance configuration
-    instances_config = json.loads(os.environ.get('JIRA_INSTANCES_CONFIG', '{}'))
+    jira_routing = get_jira_routing()
 
-    # Find which instance matches this account
-    instance_name, instance_config = helpers.find_instance_for_account(finding_account_id, instances_config)
+    # Re-imports identical to a finding that was already processed need no Secrets Manager, Jira or Security Hub call,
+    # findings of excluded accounts are skipped without looking up their fingerprint
+    unchanged = unchanged_findings(
+        FINGERPRINT_SCOPE,
+        [finding for finding in event_detail['findings']
+         if finding.get('AwsAccountId') not in jira_routing.excluded_account_ids],
+        logger
+    )
+    if unchanged:
+        logger.info(f"Skipping {len(unchanged)} finding(s) unchanged since they were last processed.")
+        add_count('FindingsUnchanged', len(unchanged))
 
-    if not instance_config:
-        logger.info(f"No Jira instance configured for account {finding_account_id}")
-        return
+    # An event can hold up to 100 findings, process all of them and don't let one failing finding stop the others
+    errors = {}
+    processed = []
+    for finding in event_detail['findings']:
+        if finding.get('Id') in unchanged:
+            continue
+        try:
+            remember = process_finding(finding, {**event_detail, 'findings': [finding]}, jira_routing,
+                                       jira_autoclose_comment, jira_autoclose_transition)
+            if finding.get('AwsAccountId') not in jira_routing.excluded_account_ids:
+                if remember:
+                    processed.append(finding)
+                add_count('FindingsProcessed', ProductName=finding_product_name(finding))
+        except IssueClaimed:
+            # Not remembered, a retry of the invocation holding the claim must not skip the finding as unchanged
+            logger.info(f"Jira issue for finding {finding.get('Id')} is created by another invocation. Skipping.")
+        except Exception as e:
+            logger.error(f"Failed to process finding {finding.get('Id')}: {e}")
+            errors[finding.get('Id')] = e
+            add_count('FindingsFailed', ProductName=finding_product_name(finding))
+    remember_findings(FINGERPRINT_SCOPE, processed, logger)
 
-    # Extract instance-specific configuration
-    jira_issue_custom_fields = instance_config.get('issue_custom_fields', {})
-    jira_issue_type = instance_config.get('issue_type', 'Security Advisory')
-    jira_project_key = instance_config['project_key']
-    jira_secret_arn = instance_config.get('credentials_secretsmanager_arn') or instance_config.get('credentials_ssm_secret_arn')
-    jira_secret_type = 'SECRETSMANAGER' if instance_config.get('credentials_secretsmanager_arn') else 'SSM'
+    if len(errors) == 1:
+        raise next(iter(errors.values()))
+    if errors:
+        raise RuntimeError(f"Failed to process findings: {', '.join(errors)}.")
+
+
+def finding_product_name(finding: dict) -> str:
+    """The product that reported the finding, older findings only carry it in their product fields."""
+    return finding.get('ProductName', finding.get('ProductFields', {}).get('aws/securityhub/ProductName', 'Unknown'))
+
+
+def is_new_actionable_finding(finding: dict) -> bool:
+    """
+    Check whether a Jira issue is to be created for a finding.
 
-    # Parse custom fields
+    An issue is created when the Workflow Status is NEW and the Compliance Status is FAILED, WARNING or missing from
+    the finding (case with e.g. Inspector findings). The compliance status check is necessary because some findings
+    from AWS Config can have Workflow Status NEW but Compliance Status NOT_AVAILABLE, such findings are not actionable.
+    The rules are shared with the Choice rule of the Step Function, see jira_eligibility.NEW_FINDING.
+    """
+    return is_new_finding(finding)
+
+
+def issue_settings(instance_config: dict) -> tuple:
+    """The project key, issue type and custom fields of the issues created on a Jira instance."""
     try:
-        jira_issue_custom_fields = {k: {"value": v} for k, v in jira_issue_custom_fields.items()}
+        jira_issue_custom_fields = {k: {"value": v} for k, v in instance_config.get('issue_custom_fields', {}).items()}
     except Exception as e:
         logger.error(f"Failed to parse custom fields: {e}.")
         raise ValueError(f"Invalid custom fields format: {e}") from e
+    return instance_config['project_key'], instance_config.get('issue_type', 'Security Advisory'), jira_issue_custom_fields
 
-    # Retrieve Jira client
-    try:
-        if jira_secret_arn:
-            if jira_secret_type == 'SECRETSMANAGER':
-                jira_secret = helpers.get_secret(secretsmanager, jira_secret_arn)
-            elif jira_secret_type == "SSM":
-                jira_secret = helpers.get_ssm_secret(ssm, jira_secret_arn)
+
+def notified_note(issue_key: str, instance_name: str) -> str:
+    """The Security Hub note of a notified finding, it tracks the instance of the issue for proper autoclose handling."""
+    return json.dumps({
+        'jiraIssue': issue_key,
+        'jiraInstance': instance_name
+    })
+
+
+def process_queued_findings(records: list, context: LambdaContext) -> dict:
+    """
+    Process a batch of SQS messages, each holding a finding the Step Function found eligible for the Jira integration.
+
+    The issues of new findings are created in bulk per Jira instance, the other findings are processed one by one.
+    Both run on a thread pool, in the call slots of their Jira instance, which also wait out the Retry-After delay
+    of a throttled instance. The messages of findings that failed, or that could not be started in time, are
+    returned to the queue to be retried.
+
+    Args:
+        records (list): The SQS records of the batch.
+        context (LambdaContext): The context of the invocation.
+
+    Returns:
+        dict: The message ids of the failed messages, as partial batch response.
+    """
+    jira_autoclose_comment = os.getenv('JIRA_AUTOCLOSE_COMMENT', DEFAULT_JIRA_AUTOCLOSE_COMMENT)
+    jira_autoclose_transition = os.getenv('JIRA_AUTOCLOSE_TRANSITION', DEFAULT_JIRA_AUTOCLOSE_TRANSITION)
+    jira_routing = get_jira_routing()
+
+    failed_message_ids = []
+    messages = []
+    for record in records:
+        try:
+            event_detail = json.loads(record['body'])['detail']
+            messages.append((record['messageId'], event_detail['findings'][0], event_detail))
+        except Exception as e:
+            logger.error(f"Failed to read finding from message {record['messageId']}: {e}")
+            failed_message_ids.append(record['messageId'])
+
+    unchanged = unchanged_findings(
+        FINGERPRINT_SCOPE,
+        [finding for _, finding, _ in messages if finding.get('AwsAccountId') not in jira_routing.excluded_account_ids],
+        logger
+    )
+    if unchanged:
+        logger.info(f"Skipping {len(unchanged)} finding(s) unchanged since they were last processed.")
+        add_count('FindingsUnchanged', len(unchanged))
+
+    # New findings are grouped per Jira instance to be created in bulk, the others go through process_finding
+    creates = {}
+    others = []
+    for message in messages:
+        message_id, finding, _ = message
+        if finding.get('Id') in unchanged or finding.get('AwsAccountId') in jira_routing.excluded_account_ids:
+            continue
+        try:
+            instance_name = None
+            if is_new_actionable_finding(finding):
+                instance_name, _ = helpers.find_instance_for_account(finding['AwsAccountId'], jira_routing)
+            if instance_name:
+                creates.setdefault(instance_name, []).append(message)
             else:
-                raise ValueError(
-                    f"Invalid JIRA_SECRET_TYPE {jira_secret_type}. Must be SECRETSMANAGER or SSM.")
+                others.append(message)
+        except Exception as e:
+            logger.error(f"Failed to process finding {finding.get('Id')}: {e}")
+            failed_message_ids.append(message_id)
+            add_count('FindingsFailed', ProductName=finding_product_name(finding))
+
+    def within_deadline(instance_name: str = None) -> bool:
+        delay = helpers.jira_instance_delay(instance_name) if instance_name else 0.0
+        return context.get_remaining_time_in_millis() - delay * 1000 > JIRA_QUEUE_DEADLINE_MARGIN_MS
+
+    def create_batch(instance_name: str, batch: list) -> list:
+        if not within_deadline(instance_name):
+            logger.warning(f"Returning {len(batch)} finding(s) for instance '{instance_name}' to the queue, "
+                           "not enough time left to process them.")
+            return [(message, False) for message in batch]
+        return create_queued_issues(instance_name, jira_routing.instances[instance_name], batch)
+
+    def process_other(message: tuple) -> list:
+        _, finding, event_detail = message
+        # The instance of an issue to close is only known once its note is read, closing again is harmless
+        if not within_deadline():
+            return [(message, False)]
+        try:
+            # A finding whose issue could not be closed is done like before, but not remembered
+            remember = process_finding(finding, event_detail, jira_routing, jira_autoclose_comment,
+                                       jira_autoclose_transition)
+            return [(message, True if remember else None)]
+        except Exception as e:
+            logger.error(f"Failed to process finding {finding.get('Id')}: {e}")
+            return [(message, False)]
+
+    with ThreadPoolExecutor(max_workers=JIRA_QUEUE_WORKERS) as executor:
+        futures = [
+            executor.submit(create_batch, instance_name, batch[start:start + helpers.JIRA_BULK_CREATE_MAX_ISSUES])
+            for instance_name, batch in creates.items()
+            for start in range(0, len(batch), helpers.JIRA_BULK_CREATE_MAX_ISSUES)
+        ] + [executor.submit(process_other, message) for message in others]
+        results = [result for future in futures for result in future.result()]
+
+    processed = []
+    for (message_id, finding, _), succeeded in results:
+        if succeeded:
+            processed.append(finding)
+            add_count('FindingsProcessed', ProductName=finding_product_name(finding))
+        elif succeeded is None:
+            # Done without being remembered: its issue is created by another invocation, or could not be closed
+            continue
+        else:
+            failed_message_ids.append(message_id)
+            add_count('FindingsFailed', ProductName=finding_product_name(finding))
+    remember_findings(FINGERPRINT_SCOPE, processed, logger)
+
+    add_count('MessagesFailed', len(failed_message_ids))
+    if failed_message_ids:
+        logger.error(f"Failed to process the finding(s) of {len(failed_message_ids)} message(s), returning them to the queue.")
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failed_message_ids]}
+
+
+def create_queued_issues(instance_name: str, instance_config: dict, batch: list) -> list:
+    """
+    Create the Jira issues of a batch of new findings in one bulk create request and mark the findings NOTIFIED.
+
+    Args:
+        instance_name (str): The name of the Jira instance.
+        instance_config (dict): The configuration of the Jira instance.
+        batch (list): The (message id, finding, event detail) of at most JIRA_BULK_CREATE_MAX_ISSUES findings.
+
+    Returns:
+        list: Per message of the batch, the message and whether its finding was processed successfully, None for a
+            finding whose issue is created by another invocation.
+    """
+    # Findings claimed by another invocation, or by an earlier message of the batch, are done without a Jira call
+    results = []
+    claimed = []
+    for message in batch:
+        if claim_issue(message[1], logger):
+            claimed.append(message)
         else:
-            raise ValueError(f"JIRA SECRET ARN {jira_secret_arn} is set to empty. Cannot proceed without JIRA Credentials.")
-        jira_client = helpers.get_jira_client(jira_secret)
+            logger.info(f"Jira issue for finding {message[1]['Id']} is created by another invocation. Skipping.")
+            add_count('JiraIssueClaimsLost', Instance=instance_name)
+            results.append((message, None))
+    if not claimed:
+        return results
+
+    try:
+        jira_project_key, jira_issue_type, jira_issue_custom_fields = issue_settings(instance_config)
+        field_list, attachments = zip(*[
+            helpers.build_jira_issue_fields(jira_project_key, jira_issue_type, event_detail, jira_issue_custom_fields)
+            for _, _, event_detail in claimed
+        ])
+        # A client that cannot be initialized fails the batch before any issue is created
+        helpers.get_instance_jira_client(instance_name, instance_config)
+    except Exception as e:
+        logger.error(f"Failed to create {len(claimed)} Jira issue(s) on instance '{instance_name}': {e}")
+        for message in claimed:
+            release_issue_claim(message[1], logger)
+        return results + [(message, False) for message in claimed]
+
+    try:
+        with timed('CreateJiraIssues', Instance=instance_name):
+            issues = helpers.call_with_instance_jira_client(
+                instance_name, instance_config,
+                lambda jira_client: helpers.create_jira_issues(jira_client, list(field_list)))
+    except Exception as e:
+        logger.error(f"Failed to create {len(claimed)} Jira issue(s) on instance '{instance_name}': {e}")
+        # Only a request Jira rejected is known to have created no issue. After a timeout or server error some issues
+        # may exist, their claims are kept until they expire so the retry of the messages does not create them twice
+        if helpers.is_jira_rejection(e):
+            for message in claimed:
+                release_issue_claim(message[1], logger)
+        else:
+            logger.warning(f"Keeping the claims on {len(claimed)} finding(s), their Jira issues may have been created.")
+        return results + [(message, False) for message in claimed]
+
+    for message, issue, attachment in zip(claimed, issues, attachments):
+        finding = message[1]
+        if issue['status'] != 'Success':
+            logger.error(f"Failed to create Jira issue for finding {finding['Id']}: {issue['error']}")
+            release_issue_claim(finding, logger)
+            results.append((message, False))
+            continue
+        add_count('JiraIssuesCreated', Instance=instance_name)
+        if attachment:
+            try:
+                helpers.call_with_instance_jira_client(
+                    instance_name, instance_config,
+                    lambda jira_client: helpers.attach_finding(jira_client, issue['issue'].key, attachment))
+            except Exception as e:
+                # The issue exists, failing the message would create it again
+                logger.warning(f"Failed to attach the full finding to Jira issue {issue['issue'].key}. Original error: {e}")
+        # Every note holds the key of its own issue and BatchUpdateFindings sets a single note for all the findings
+        # of a call, so the findings are updated one by one, through the rate limited Security Hub client
+        try:
+            helpers.update_security_hub(
+                helpers.get_boto3_client('securityhub'), finding['Id'], finding['ProductArn'], STATUS_NOTIFIED,
+                notified_note(issue['issue'].key, instance_name))
+            results.append((message, True))
+        except Exception as e:
+            # The claim is kept, the retry of the message skips the finding instead of creating its issue again
+            logger.error(f"Created Jira issue {issue['issue'].key} but failed to update finding {finding['Id']}: {e}")
+            results.append((message, False))
+    return results
+
+
+def process_finding(finding: dict, event_detail: dict, jira_routing: helpers.JiraRouting,
+                    jira_autoclose_comment: str, jira_autoclose_transition: str) -> bool:
+    """
+    Create the Jira issue of a new finding, or close the Jira issue of a resolved finding.
+
+    Args:
+        finding (dict): The Security Hub finding.
+        event_detail (dict): The detail of the event holding the finding.
+        jira_routing (JiraRouting): The routing table of the Jira instances.
+        jira_autoclose_comment (str): The comment added to a closed issue.
+        jira_autoclose_transition (str): The transition that closes an issue.
+
+    Returns:
+        bool: False when the Jira issue of a resolved finding could not be closed, the finding must not be remembered
+            as processed so a next event of the finding retries the close. True otherwise.
+    """
+    # Get finding account ID (needed for instance lookup)
+    finding_account_id = finding['AwsAccountId']
+
+    if finding_account_id in jira_routing.excluded_account_ids:
+        logger.info(
+            f"Account {finding_account_id} is in the global exclude list. Skipping Jira ticket creation."
+        )
+        return True
+
+    # Find which instance matches this account
+    instance_name, instance_config = helpers.find_instance_for_account(finding_account_id, jira_routing)
+
+    if not instance_config:
+        logger.info(f"No Jira instance configured for account {finding_account_id}")
+        return True
+
+    # Extract instance-specific configuration
+    jira_project_key, jira_issue_type, jira_issue_custom_fields = issue_settings(instance_config)
+
+    # Retrieve Jira client, cached per instance across warm invocations
+    try:
+        helpers.get_instance_jira_client(instance_name, instance_config)
     except Exception as e:
         logger.error(f"Failed to retrieve Jira client: {e}")
         raise RuntimeError("Could not initialize Jira client.") from e
 
-    # Get remaining Security Hub finding details
     workflow_status = finding['Workflow']['Status']
-    compliance_status = finding['Compliance']['Status'] if 'Compliance' in finding else COMPLIANCE_STATUS_MISSING
-    record_state = finding['RecordState']
-
-    # Handle new findings
-    # Ticket is created when Workflow Status is NEW and Compliance Status is FAILED, WARNING or is missing from the finding (case with e.g. Inspector findings)
-    # Compliance status check is necessary because some findings from AWS Config can have Workflow Status NEW but Compliance Status NOT_AVAILABLE
-    # In such case, we don't want to create a Jira ticket, because the finding is not actionable
-    if (workflow_status == STATUS_NEW
-            and compliance_status in [COMPLIANCE_STATUS_FAILED,
-                                      COMPLIANCE_STATUS_WARNING,
-                                      COMPLIANCE_STATUS_MISSING]
-            and record_state == RECORD_STATE_ACTIVE):
+
+    # Handle new findings, see is_new_actionable_finding
+    if is_new_actionable_finding(finding):
 
         # Create Jira issue and updates Security Hub status to NOTIFIED
         # and adds Jira issue key to note (in JSON format)
-        # Note: Duplicate prevention is handled by Step Function filter before Lambda invocation
+        # Note: Duplicate prevention is handled by Step Function filter before Lambda invocation, the claim covers the
+        # events of the same finding that pass that filter before the note of the first issue is written
+        if not claim_issue(finding, logger):
+            add_count('JiraIssueClaimsLost', Instance=instance_name)
+            raise IssueClaimed(finding['Id'])
         try:
-            issue = helpers.create_jira_issue(
-                jira_client, jira_project_key, jira_issue_type, event_detail, jira_issue_custom_fields)
-            # Create note with instance tracking for proper autoclose handling
-            note = json.dumps({
-                'jiraIssue': issue.key,
-                'jiraInstance': instance_name
-            })
-            helpers.update_security_hub(
-                securityhub, finding["Id"], finding["ProductArn"], STATUS_NOTIFIED, note)
+            with timed('CreateJiraIssue', Instance=instance_name):
+                issue = helpers.call_with_instance_jira_client(
+                    instance_name, instance_config,
+                    lambda jira_client: helpers.create_jira_issue(
+                        jira_client, jira_project_key, jira_issue_type, event_detail, jira_issue_custom_fields))
         except Exception as e:
+            release_issue_claim(finding, logger)
             logger.error(
                 f"Error processing new finding for findingID {finding['Id']}: {e}")
-            raise RuntimeError(f"Failed to create Jira issue or update Security Hub for finding ID {finding['Id']}.") from e
+            raise RuntimeError(f"Failed to create Jira issue for finding ID {finding['Id']}.") from e
+        add_count('JiraIssuesCreated', Instance=instance_name)
+        try:
+            helpers.update_security_hub(
+                helpers.get_boto3_client('securityhub'), finding["Id"], finding["ProductArn"], STATUS_NOTIFIED,
+                notified_note(issue.key, instance_name))
+        except Exception as e:
+            # The claim is kept, a retry would create the issue again
+            logger.error(
+                f"Created Jira issue {issue.key} but failed to update finding {finding['Id']}: {e}")
+            raise RuntimeError(f"Failed to update Security Hub for finding ID {finding['Id']}.") from e
 
     # Handle resolved findings - Close Jira issue when:
     # 1. Workflow status is RESOLVED (finding explicitly resolved)
@@ -140,12 +423,8 @@ def lambda_handler(event: dict, context: LambdaContext):
     #    - Record state is ARCHIVED
     # Note: Findings closed from NOTIFIED status are automatically marked as RESOLVED in SecurityHub.
     #       SecurityHub will reopen and create a new ticket if the finding becomes relevant again.
-    elif (workflow_status == STATUS_RESOLVED
-            or workflow_status == STATUS_SUPPRESSED
-            or (workflow_status == STATUS_NOTIFIED
-                and (compliance_status in [COMPLIANCE_STATUS_PASSED,
-                                           COMPLIANCE_STATUS_NOT_AVAILABLE]
-                     or record_state == RECORD_STATE_ARCHIVED))):
+    # The rules are shared with the Choice rule of the Step Function, see jira_eligibility.RESOLVED_FINDING.
+    elif is_resolved_finding(finding):
         # Close Jira issue if finding is resolved.
         # Note text should contain Jira issue key in JSON format
         try:
@@ -159,51 +438,49 @@ def lambda_handler(event: dict, context: LambdaContext):
             autoclose_instance_config = None
             autoclose_instance_name = None
 
-            if note_instance_name and note_instance_name in instances_config:
+            if note_instance_name and note_instance_name in jira_routing.instances:
                 # Use the instance that created the ticket
-                autoclose_instance_config = instances_config[note_instance_name]
+                autoclose_instance_config = jira_routing.instances[note_instance_name]
                 autoclose_instance_name = note_instance_name
                 logger.info(f"Using Jira instance '{note_instance_name}' from note for autoclose")
             else:
                 # Fallback to default instance for old notes without jiraInstance field
-                for inst_name, inst_config in instances_config.items():
-                    if inst_config.get('enabled', True) and inst_config.get('default_instance', False):
-                        autoclose_instance_config = inst_config
-                        autoclose_instance_name = inst_name
-                        logger.info(f"Using default Jira instance '{inst_name}' for autoclose (note has no jiraInstance field)")
-                        break
+                if jira_routing.default_instance_name:
+                    autoclose_instance_name = jira_routing.default_instance_name
+                    autoclose_instance_config = jira_routing.instances[autoclose_instance_name]
+                    logger.info(f"Using default Jira instance '{autoclose_instance_name}' for autoclose (note has no jiraInstance field)")
 
                 if not autoclose_instance_config:
                     logger.error(f"Cannot autoclose: jiraInstance '{note_instance_name}' not found in config and no default instance configured")
-                    return
+                    return False
 
-            # Get credentials from the autoclose instance
-            autoclose_secret_arn = autoclose_instance_config.get('credentials_secretsmanager_arn') or autoclose_instance_config.get('credentials_ssm_secret_arn')
-            autoclose_secret_type = 'SECRETSMANAGER' if autoclose_instance_config.get('credentials_secretsmanager_arn') else 'SSM'
             autoclose_intermediate_transition = autoclose_instance_config.get('include_intermediate_transition', '')
 
-            # Initialize Jira client with the autoclose instance's credentials
+            # Initialize Jira client with the autoclose instance's credentials, cached per instance
             try:
-                if autoclose_secret_type == 'SECRETSMANAGER':
-                    autoclose_secret = helpers.get_secret(secretsmanager, autoclose_secret_arn)
-                elif autoclose_secret_type == "SSM":
-                    autoclose_secret = helpers.get_ssm_secret(ssm, autoclose_secret_arn)
-                else:
-                    raise ValueError(f"Invalid secret type {autoclose_secret_type} for instance '{autoclose_instance_name}'")
-                autoclose_jira_client = helpers.get_jira_client(autoclose_secret)
+                helpers.get_instance_jira_client(autoclose_instance_name, autoclose_instance_config)
             except Exception as e:
                 logger.error(f"Failed to get credentials for autoclose instance '{autoclose_instance_name}': {e}")
                 raise RuntimeError(f"Could not initialize Jira client for autoclose.") from e
 
             if jira_issue_id:
+                # jira is already loaded by the autoclose client
+                from jira.exceptions import JIRAError
                 try:
-                    issue = autoclose_jira_client.issue(jira_issue_id)
+                    issue = helpers.call_with_instance_jira_client(
+                        autoclose_instance_name, autoclose_instance_config,
+                        lambda jira_client: jira_client.issue(jira_issue_id, fields=helpers.CLOSE_ISSUE_FIELDS))
                 except JIRAError as e:
                     logger.error(
                         f"Failed to retrieve Jira issue {jira_issue_id}: {e}. Cannot autoclose.")
-                    return  # Skip further processing for this finding
-                helpers.close_jira_issue(
-                    autoclose_jira_client, issue, jira_autoclose_transition, jira_autoclose_comment, autoclose_intermediate_transition)
+                    return False  # Skip further processing for this finding
+                with timed('CloseJiraIssue', Instance=autoclose_instance_name):
+                    helpers.call_with_instance_jira_client(
+                        autoclose_instance_name, autoclose_instance_config,
+                        lambda jira_client: helpers.close_jira_issue(
+                            jira_client, issue, jira_autoclose_transition, jira_autoclose_comment, autoclose_intermediate_transition,
+                            autoclose_instance_name))
+                add_count('JiraIssuesClosed', Instance=autoclose_instance_name)
 
                 # Update note to prevent re-processing: remove 'jiraIssue' to prevent Step Function filter match
                 # Add 'jiraClosedIssue' for audit trail, preserving all other note content
@@ -218,7 +495,7 @@ def lambda_handler(event: dict, context: LambdaContext):
                 if workflow_status in [STATUS_NOTIFIED, STATUS_SUPPRESSED]:
                     target_status = STATUS_RESOLVED if workflow_status == STATUS_NOTIFIED else STATUS_SUPPRESSED
                     helpers.update_security_hub(
-                        securityhub, finding["Id"], finding["ProductArn"], target_status, updated_note)
+                        helpers.get_boto3_client('securityhub'), finding["Id"], finding["ProductArn"], target_status, updated_note)
                     
         except json.JSONDecodeError as e:
             logger.error(
@@ -227,8 +504,10 @@ def lambda_handler(event: dict, context: LambdaContext):
         except Exception as e:
             logger.error(
                 f"Error processing resolved finding for findingId {finding['Id']}: {e}. Cannot autoclose.")
-            return
+            return False
 
     else:
         logger.info(
-            f"Finding {finding['Id']} is not in a state to be processed. Workflow status: {workflow_status}, Compliance status: {compliance_status}, Record state: {record_state}")
+            f"Finding {finding['Id']} is not in a state to be processed. Workflow status: {workflow_status}, "
+            f"Compliance status: {finding.get('Compliance', {}).get('Status', 'MISSING')}, Record state: {finding['RecordState']}")
+    return True
@@ -1,16 +1,78 @@
+from __future__ import annotations
+
 import base64
+import io
 import json
 import os
-from typing import List, Dict
+import threading
+import time
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Callable, Dict, FrozenSet, Iterator, List, Mapping, NamedTuple, Optional
 
 from aws_lambda_powertools import Logger
-from botocore.client import BaseClient
-from botocore.exceptions import ClientError
-from jira import JIRA
-from jira.resources import Issue
+from aws_lambda_powertools.metrics import MetricUnit
+from issue_rendering import FINDING_ATTACHMENT_NAME, issue_labels, render_issue
+from observability import add_count, add_metric
+
+# boto3, botocore and jira are imported on first use, they make up most of the cold start of this Lambda
+# and invocations that skip the finding, for example for an excluded account, never need them
+if TYPE_CHECKING:
+    from botocore.client import BaseClient
+    from jira import JIRA
+    from jira.resources import Issue
 
 logger = Logger()
 
+# Seconds a cached secret and Jira client are reused, so rotated credentials are picked up after at most this delay
+JIRA_CLIENT_CACHE_TTL_SECONDS = float(os.getenv('JIRA_CLIENT_CACHE_TTL_SECONDS', '900'))
+JIRA_AUTH_ERROR_STATUS_CODES = (401, 403)
+# Seconds a learned workflow transition graph is reused, a rejected cached transition invalidates it earlier
+JIRA_TRANSITION_CACHE_TTL_SECONDS = float(os.getenv('JIRA_TRANSITION_CACHE_TTL_SECONDS', '3600'))
+# Transitions an issue goes through to be closed at most, the intermediate transition and the close transition
+MAX_CLOSE_TRANSITIONS = 2
+# Fields of an issue needed to close it, fetched instead of the whole issue
+CLOSE_ISSUE_FIELDS = 'status,project,issuetype'
+# Jira calls made to the same instance at the same time at most, by the threads of a queued batch
+JIRA_MAX_CONCURRENCY_PER_INSTANCE = int(os.getenv('JIRA_MAX_CONCURRENCY_PER_INSTANCE', '4'))
+# Seconds calls to an instance are paused after it throttled a request without a usable Retry-After header
+JIRA_DEFAULT_RETRY_AFTER_SECONDS = 10.0
+# Issues Jira creates in one bulk create request at most
+JIRA_BULK_CREATE_MAX_ISSUES = 50
+
+# Module level state survives across warm invocations of the same Lambda container
+_boto3_clients = {}
+_jira_clients = {}
+_transition_graphs = {}
+# Per Jira instance, the semaphore limiting concurrent calls and the time.monotonic() calls may resume at after a 429
+_jira_slots = {}
+_jira_resume_at = {}
+_jira_slots_lock = threading.Lock()
+_jira_clients_lock = threading.Lock()
+
+
+def get_boto3_client(service_name: str) -> BaseClient:
+    """
+    Get a boto3 client, created on first use and reused across warm invocations.
+
+    Security Hub clients come from the shared, rate limited Security Hub client module.
+
+    Args:
+        service_name (str): The name of the AWS service.
+
+    Returns:
+        BaseClient: A boto3 client instance for the service.
+    """
+
+    if service_name not in _boto3_clients:
+        if service_name == 'securityhub':
+            import securityhub_client
+            _boto3_clients[service_name] = securityhub_client.get_client()
+        else:
+            import boto3
+            _boto3_clients[service_name] = boto3.client(service_name)
+    return _boto3_clients[service_name]
+
 
 def validate_env_vars(env_vars: List[str]) -> None:
     """
@@ -55,6 +117,7 @@ def get_jira_client(jira_secret: Dict[str, str]) -> JIRA:
     if not jira_url or not jira_user or not jira_password:
         raise ValueError("Jira connection details are not valid!")
 
+    from jira import JIRA
     return JIRA(server=jira_url, basic_auth=(jira_user, jira_password))
 
 
@@ -76,8 +139,7 @@ def get_secret(client: BaseClient, secret_arn: str) -> Dict[str, str]:
 
     # Validate that the client is an instance of botocore.client.SecretsManager
     if client.meta.service_model.service_name != 'secretsmanager':
-        raise ValueError(f"Client must be an instance of botocore.client.SecretsManager. Got {
-                         type(client)} instead.")
+        raise ValueError(f"Client must be an instance of botocore.client.SecretsManager. Got {type(client)} instead.")
 
     try:
         response = client.get_secret_value(SecretId=secret_arn)
@@ -108,6 +170,9 @@ def get_ssm_secret(client: BaseClient, ssm_secret_arn: str) -> Dict[str, str]:
         ClientError: If there is an error retrieving the secret.
     """
 
+    # botocore is already loaded by the client that was passed in
+    from botocore.exceptions import ClientError
+
     # Validate that the client is an instance of botocore.client.SecretsManager
     if client.meta.service_model.service_name != 'ssm':
         raise ValueError(f"Client must be an instance of botocore.client.SSM. Got {type(client)} instead.")
@@ -129,111 +194,442 @@ def get_ssm_secret(client: BaseClient, ssm_secret_arn: str) -> Dict[str, str]:
         logger.error(f"Unexpected error retrieving parameter from ARN {ssm_secret_arn}: {e}")
         raise e
 
-def create_jira_issue(jira_client: JIRA, project_key: str, issue_type: str, event: dict, custom_fields: dict) -> Issue:
+def get_instance_jira_client(instance_name: str, instance_config: dict) -> JIRA:
     """
-    Create a Jira issue based on a Security Hub event.
+    Get an authenticated Jira client for a Jira instance, reusing the cached client of earlier invocations.
+
+    The cached client keeps its HTTP session, so warm invocations reuse its connection pool and skip the
+    secret retrieval and the server info request made by the JIRA constructor.
 
     Args:
-        jira_client (JIRA): An authenticated Jira client instance.
-        project_key (str): The key of the Jira project.
-        issue_type (str): The type of the Jira issue.
-        event (Dict): The Security Hub event data.
-        custom_fields (Dict): The custom fields to include in the Jira issue.
+        instance_name (str): The name of the Jira instance, used as cache key.
+        instance_config (dict): The configuration of the Jira instance.
 
     Returns:
-        Issue: The created Jira issue.
+        JIRA: A Jira client instance.
 
     Raises:
-        Exception: If there is an error creating the Jira issue.
+        ValueError: If no credentials are configured for the instance.
     """
 
-    finding = event['findings'][0]
-    finding_account_id = finding['AwsAccountId']
-    finding_account_name = finding['AwsAccountName']
-    finding_title = finding['Title']
+    cached = _cached_instance_jira_client(instance_name)
+    if cached:
+        return cached
+
+    # Threads of a queued batch needing the same missing client wait for the first one to create it
+    with _jira_clients_lock:
+        return _cached_instance_jira_client(instance_name) or _create_instance_jira_client(instance_name, instance_config)
+
+
+def _cached_instance_jira_client(instance_name: str) -> Optional[JIRA]:
+    cached = _jira_clients.get(instance_name)
+    if cached and time.monotonic() - cached['created_at'] < JIRA_CLIENT_CACHE_TTL_SECONDS:
+        return cached['client']
+    return None
+
+
+def _create_instance_jira_client(instance_name: str, instance_config: dict) -> JIRA:
+    secretsmanager_arn = instance_config.get('credentials_secretsmanager_arn')
+    ssm_secret_arn = instance_config.get('credentials_ssm_secret_arn')
+    if secretsmanager_arn:
+        jira_secret = get_secret(get_boto3_client('secretsmanager'), secretsmanager_arn)
+    elif ssm_secret_arn:
+        jira_secret = get_ssm_secret(get_boto3_client('ssm'), ssm_secret_arn)
+    else:
+        raise ValueError(f"No Jira credentials configured for instance '{instance_name}'. Cannot proceed without JIRA Credentials.")
+
+    jira_client = get_jira_client(jira_secret)
+    # Every request of the client's session, retries and pagination included, counts towards the instance's metrics
+    jira_client._session.hooks['response'].append(
+        lambda response, *args, **kwargs: record_jira_api_call(instance_name, response))
+    _jira_clients[instance_name] = {'client': jira_client, 'created_at': time.monotonic()}
+    logger.info(f"Created Jira client for instance '{instance_name}'")
+    return jira_client
+
+
+def record_jira_api_call(instance_name: str, response) -> None:
+    """
+    Record a Jira API call and its latency as metrics of the Jira instance, and pause the instance when it throttled.
+
+    The Jira client retries a throttled request itself after the Retry-After delay, the pause makes the other
+    threads calling the same instance wait out that delay too instead of adding to the throttling.
+
+    Args:
+        instance_name (str): The name of the Jira instance that served the request.
+        response (requests.Response): The response of the request.
+    """
+    add_count('JiraApiCalls', Instance=instance_name)
+    add_metric('JiraApiLatency', MetricUnit.Milliseconds, response.elapsed.total_seconds() * 1000,
+               Instance=instance_name)
+    if response.status_code == 429:
+        add_count('JiraApiThrottled', Instance=instance_name)
+        defer_jira_instance(instance_name, retry_after_seconds(response))
+
+
+def retry_after_seconds(response) -> float:
+    """
+    Get the delay a throttled Jira response asks for in its Retry-After header.
+
+    Args:
+        response (requests.Response): The throttled response.
+
+    Returns:
+        float: The delay in seconds, JIRA_DEFAULT_RETRY_AFTER_SECONDS when the header is missing or not in seconds.
+    """
+
+    try:
+        return max(float(response.headers['Retry-After']), 0.0)
+    except (KeyError, TypeError, ValueError):
+        return JIRA_DEFAULT_RETRY_AFTER_SECONDS
+
+
+def defer_jira_instance(instance_name: str, seconds: float) -> None:
+    """
+    Pause the calls to a Jira instance for a number of seconds, an earlier pause that lasts longer is kept.
+
+    Args:
+        instance_name (str): The name of the Jira instance.
+        seconds (float): The seconds to pause the calls for.
+    """
+
+    resume_at = time.monotonic() + seconds
+    with _jira_slots_lock:
+        if resume_at > _jira_resume_at.get(instance_name, 0.0):
+            _jira_resume_at[instance_name] = resume_at
+            logger.warning(f"Jira instance '{instance_name}' throttled a request, pausing its calls for {seconds:.1f}s")
+
+
+def jira_instance_delay(instance_name: str) -> float:
+    """
+    Get the seconds left before a paused Jira instance may be called again.
+
+    Args:
+        instance_name (str): The name of the Jira instance.
+
+    Returns:
+        float: The seconds left, 0 when the instance is not paused.
+    """
+
+    return max(_jira_resume_at.get(instance_name, 0.0) - time.monotonic(), 0.0)
+
+
+@contextmanager
+def jira_instance_slot(instance_name: str) -> Iterator[None]:
+    """
+    Hold one of the JIRA_MAX_CONCURRENCY_PER_INSTANCE call slots of a Jira instance, once it is no longer paused.
+
+    Args:
+        instance_name (str): The name of the Jira instance.
+    """
+
+    with _jira_slots_lock:
+        slot = _jira_slots.setdefault(instance_name, threading.BoundedSemaphore(JIRA_MAX_CONCURRENCY_PER_INSTANCE))
+    with slot:
+        delay = jira_instance_delay(instance_name)
+        while delay:
+            time.sleep(delay)
+            delay = jira_instance_delay(instance_name)
+        yield
+
+
+def invalidate_instance_jira_client(instance_name: str) -> None:
+    """
+    Drop the cached Jira client of a Jira instance, so the next call retrieves the secret again.
+
+    Args:
+        instance_name (str): The name of the Jira instance.
+    """
+
+    if _jira_clients.pop(instance_name, None):
+        logger.info(f"Invalidated cached Jira client for instance '{instance_name}'")
 
-    issue_title = f"Security Hub ({finding_title}) detected in {
-        finding_account_id} ({finding_account_name})"
 
-    issue_description = f"""
-      {finding['Description']}
+def is_jira_auth_error(error: Exception) -> bool:
+    """
+    Check whether an error was caused by rejected Jira credentials.
+
+    Args:
+        error (Exception): The error raised by a Jira call.
+
+    Returns:
+        bool: True if Jira rejected the credentials.
+    """
+
+    # jira is already loaded by the client that raised the error
+    from jira.exceptions import JIRAError
+    return isinstance(error, JIRAError) and error.status_code in JIRA_AUTH_ERROR_STATUS_CODES
+
+
+def is_jira_rejection(error: Exception) -> bool:
+    """
+    Check whether an error is Jira rejecting a request, which then made no changes.
+
+    Args:
+        error (Exception): The error raised by a Jira call.
+
+    Returns:
+        bool: True if Jira answered with a client error, False for timeouts, connection and server errors.
+    """
+
+    # jira is already loaded by the client that raised the error
+    from jira.exceptions import JIRAError
+    return isinstance(error, JIRAError) and error.status_code is not None and 400 <= error.status_code < 500
+
 
-      A Security Hub finding has been detected:
-      {{code}}{json.dumps(event, indent=2, sort_keys=True)}{{code}}
+def call_with_instance_jira_client(instance_name: str, instance_config: dict, func: Callable[[JIRA], object]):
     """
+    Call a function with the cached Jira client of a Jira instance, in one of the call slots of the instance.
+
+    When Jira rejects the credentials of the cached client, for example after a secret rotation, the client is
+    invalidated and the function is retried once with a client built from a freshly retrieved secret.
+
+    Args:
+        instance_name (str): The name of the Jira instance.
+        instance_config (dict): The configuration of the Jira instance.
+        func (Callable[[JIRA], object]): The function to call with the Jira client.
+
+    Returns:
+        object: The return value of the function.
+    """
+
+    with jira_instance_slot(instance_name):
+        # Only a client from an unexpired cache entry can hold outdated credentials, a new client is not retried
+        cached = _cached_instance_jira_client(instance_name)
+        try:
+            return func(cached or get_instance_jira_client(instance_name, instance_config))
+        except Exception as e:
+            if not is_jira_auth_error(e):
+                raise
+            invalidate_instance_jira_client(instance_name)
+            if cached is None:
+                raise
+            logger.warning(f"Jira rejected the cached credentials for instance '{instance_name}', retrying with a new client")
+            return func(get_instance_jira_client(instance_name, instance_config))
+
+
+def build_jira_issue_fields(project_key: str, issue_type: str, event: dict, custom_fields: dict) -> tuple:
+    """
+    Build the fields of the Jira issue of a Security Hub event.
+
+    Args:
+        project_key (str): The key of the Jira project.
+        issue_type (str): The type of the Jira issue.
+        event (Dict): The Security Hub event data.
+        custom_fields (Dict): The custom fields to include in the Jira issue.
 
-    issue_labels = [
-        finding["Region"],
-        finding_account_id,
-        finding_account_name,
-        finding['Severity']['Label'].lower(),
-        *[finding['ProductFields'][key].replace(" ", "")
-          for key in ["RuleId", "ControlId", "aws/securityhub/ProductName"]
-          if key in finding['ProductFields']]
-    ]
+    Returns:
+        tuple: The fields of the issue and the attachment holding the full event, None when it fits the description.
+    """
 
+    finding = event['findings'][0]
+    rendered = render_issue(event)
     issue_dict = {
         **custom_fields,
         'project': {'key': project_key},
         'issuetype': {'name': issue_type},
-        'summary': issue_title,
-        'description': issue_description,
-        'labels': issue_labels,
+        'summary': f"Security Hub ({finding['Title']}) detected in {finding['AwsAccountId']} ({finding['AwsAccountName']})",
+        'description': rendered.description,
+        'labels': issue_labels(finding),
     }
+    return issue_dict, rendered.attachment
+
+
+def attach_finding(jira_client: JIRA, issue_key: str, attachment: bytes) -> None:
+    """
+    Attach the full event of a finding that did not fit the description to its Jira issue.
+
+    The issue already exists, so a failed attachment is logged instead of raised, raising would create the issue again.
+
+    Args:
+        jira_client (JIRA): An authenticated Jira client instance.
+        issue_key (str): The key of the Jira issue.
+        attachment (bytes): The gzip compressed event.
+    """
+
+    try:
+        jira_client.add_attachment(issue=issue_key, attachment=io.BytesIO(attachment), filename=FINDING_ATTACHMENT_NAME)
+        logger.info(f"Attached the full finding to Jira issue {issue_key}")
+    except Exception as e:
+        logger.warning(f"Failed to attach the full finding to Jira issue {issue_key}. Original error: {e}")
+
+
+def create_jira_issue(jira_client: JIRA, project_key: str, issue_type: str, event: dict, custom_fields: dict) -> Issue:
+    """
+    Create a Jira issue based on a Security Hub event.
+
+    Args:
+        jira_client (JIRA): An authenticated Jira client instance.
+        project_key (str): The key of the Jira project.
+        issue_type (str): The type of the Jira issue.
+        event (Dict): The Security Hub event data.
+        custom_fields (Dict): The custom fields to include in the Jira issue.
 
+    Returns:
+        Issue: The created Jira issue.
+
+    Raises:
+        Exception: If there is an error creating the Jira issue.
+    """
+
+    issue_dict, attachment = build_jira_issue_fields(project_key, issue_type, event, custom_fields)
     try:
         issue = jira_client.create_issue(fields=issue_dict)
         logger.info(f"Created Jira issue: {issue.key}")
-        return issue
     except Exception as e:
-        logger.error(f"Failed to create Jira issue for finding {finding['Id']}: {e}")
+        logger.error(f"Failed to create Jira issue for finding {event['findings'][0]['Id']}: {e}")
         raise e
+    if attachment:
+        attach_finding(jira_client, issue.key, attachment)
+    return issue
+
+
+def create_jira_issues(jira_client: JIRA, field_list: List[dict]) -> List[dict]:
+    """
+    Create up to JIRA_BULK_CREATE_MAX_ISSUES Jira issues in one bulk create request.
+
+    Jira creates the valid issues of the request and reports the others as failed, so one invalid issue does not
+    fail the others.
+
+    Args:
+        jira_client (JIRA): An authenticated Jira client instance.
+        field_list (List[dict]): The fields of every issue, see build_jira_issue_fields.
+
+    Returns:
+        List[dict]: Per issue, in the order of the field list, its 'status' ("Success" or "Error"), the created
+            'issue' and the 'error'.
+
+    Raises:
+        Exception: If the bulk create request itself fails.
+    """
+
+    # Without prefetching, the created issues are not fetched again one by one, they are only needed for their key
+    results = jira_client.create_issues(field_list=field_list, prefetch=False)
+    created = [result['issue'].key for result in results if result['status'] == 'Success']
+    logger.info(f"Created {len(created)} of {len(field_list)} Jira issue(s) in bulk: {', '.join(created)}")
+    return results
+
+
+def get_transition_graph(instance_name: str, issue: Issue) -> dict:
+    """
+    Get the cached workflow transition graph of the project and issue type of an issue on a Jira instance.
+
+    The graph maps a status id to the transitions available from that status, by name, as (transition id, status id
+    after the transition). It is learned from the transitions Jira lists for issues and shared by all issues of the
+    same project and issue type, which share their workflow.
+
+    Args:
+        instance_name (str): The name of the Jira instance.
+        issue (Issue): An issue of the project and issue type, fetched with at least the CLOSE_ISSUE_FIELDS.
+
+    Returns:
+        dict: The transition graph, empty until transitions are learned.
+    """
+
+    key = (instance_name, issue.fields.project.key, issue.fields.issuetype.id)
+    cached = _transition_graphs.get(key)
+    if not cached or time.monotonic() - cached['created_at'] >= JIRA_TRANSITION_CACHE_TTL_SECONDS:
+        cached = _transition_graphs[key] = {'graph': {}, 'created_at': time.monotonic()}
+    return cached['graph']
+
+
+def invalidate_transition_graph(graph: dict) -> None:
+    """
+    Forget the learned transitions of a workflow, so the next close looks them up live again.
+
+    Args:
+        graph (dict): The transition graph to invalidate.
+    """
+
+    graph.clear()
+
+
+def get_transitions(jira_client: JIRA, issue_key: str, status_id: Optional[str], graph: dict) -> Dict[str, tuple]:
+    """
+    Get the transitions available from the status of an issue, from the transition graph or else from Jira.
+
+    Transitions looked up in Jira are added to the graph under the status they are available from.
+
+    Args:
+        jira_client (JIRA): An authenticated Jira client instance.
+        issue_key (str): The key of the issue.
+        status_id (Optional[str]): The id of the current status of the issue, None when it is not known.
+        graph (dict): The transition graph of the issue's workflow.
+
+    Returns:
+        Dict[str, tuple]: The (transition id, status id after the transition) of every available transition by name.
+    """
+
+    if status_id is not None and status_id in graph:
+        return graph[status_id]
+    transitions = {
+        t['name']: (t['id'], t.get('to', {}).get('id'))
+        for t in jira_client.transitions(issue_key)
+    }
+    if status_id is not None:
+        graph[status_id] = transitions
+    return transitions
 
 
-def close_jira_issue(jira_client: JIRA, issue: Issue, transition_name: str, comment: str, intermediate_transition: str = '') -> None:
+def close_jira_issue(jira_client: JIRA, issue: Issue, transition_name: str, comment: str, intermediate_transition: str = '',
+                     instance_name: str = '') -> None:
     """
     Close a Jira issue, intelligently handling transitions based on available options.
-    
+
     If the direct close transition is not available, but an intermediate transition is specified
     and available, the function will perform the intermediate transition first, then close.
 
+    With an instance name, the transitions are resolved from the cached transition graph of the issue's workflow, so
+    a warm close only makes the transition and comment calls. When Jira rejects a cached transition, the graph is
+    invalidated and the issue is closed again with transitions looked up live.
+
     Args:
         jira_client (JIRA): An authenticated Jira client instance.
-        issue (Issue): The Jira issue to close.
+        issue (Issue): The Jira issue to close, fetched with at least the CLOSE_ISSUE_FIELDS.
         transition_name (str): The name of the final transition to close the issue.
         comment (str): The comment to add when closing the issue.
         intermediate_transition (str): Optional intermediate transition to perform before closing.
+        instance_name (str): Optional name of the Jira instance, used as cache key of the transition graph.
 
     Raises:
         Exception: If there is an error closing the Jira issue.
     """
 
+    # jira is already loaded by the client that fetched the issue
+    from jira.exceptions import JIRAError
+
+    graph = get_transition_graph(instance_name, issue) if instance_name else {}
+    status_id = issue.fields.status.id
+    commented = False
     try:
-        # Get available transitions for the current issue state
-        available_transitions = jira_client.transitions(issue)
-        available_transition_names = {t['name']: t['id'] for t in available_transitions}
-        
-        logger.info(f"Available transitions for issue {issue.key}: {list(available_transition_names.keys())}")
-        
-        # Check if intermediate transition is available
-        if intermediate_transition and intermediate_transition in available_transition_names:
-            # Direct close not available, but intermediate transition is
-            logger.info(f"Direct close not available. Performing intermediate transition '{intermediate_transition}' for issue {issue.key}")
-            jira_client.transition_issue(issue, available_transition_names[intermediate_transition])
-            logger.info(f"Transitioned Jira issue {issue.key} to intermediate status: {intermediate_transition}")
-            
-            # Refresh the issue to get the updated status
-            issue = jira_client.issue(issue.key)
-        
-        # Attempt to close the issue
-        transition_id = jira_client.find_transitionid_by_name(issue, transition_name)
-        if transition_id is None:
-            logger.warning(f"Failed to close Jira issue: Invalid transition.")
-            return
-        jira_client.add_comment(issue, comment)
-        jira_client.transition_issue(issue, transition_id, comment=comment)
-        logger.info(f"Closed Jira issue: {issue.key}")
-                
+        for attempt in range(2):
+            cached = bool(graph)
+            try:
+                for _ in range(MAX_CLOSE_TRANSITIONS):
+                    transitions = get_transitions(jira_client, issue.key, status_id, graph)
+                    logger.debug(f"Available transitions for issue {issue.key}: {list(transitions)}")
+                    if transition_name in transitions:
+                        if not commented:
+                            jira_client.add_comment(issue.key, comment)
+                            commented = True
+                        jira_client.transition_issue(issue.key, transitions[transition_name][0])
+                        logger.info(f"Closed Jira issue: {issue.key}")
+                        return
+                    if not intermediate_transition or intermediate_transition not in transitions:
+                        break
+                    # Direct close not available, but intermediate transition is
+                    jira_client.transition_issue(issue.key, transitions[intermediate_transition][0])
+                    logger.info(f"Transitioned Jira issue {issue.key} to intermediate status: {intermediate_transition}")
+                    status_id = transitions[intermediate_transition][1]
+                logger.warning(f"Failed to close Jira issue: Invalid transition.")
+                return
+            except JIRAError as e:
+                # A cached transition can be rejected after the workflow changed, retry once with live lookups
+                if not cached or attempt or e.status_code in JIRA_AUTH_ERROR_STATUS_CODES:
+                    raise
+                logger.warning(f"Jira rejected a cached transition of issue {issue.key}, looking up transitions live: {e}")
+                invalidate_transition_graph(graph)
+                status_id = jira_client.issue(issue.key, fields='status').fields.status.id
+
     except Exception as e:
         logger.error(f"Failed to close Jira issue {issue.key}: {e}")
         raise e
@@ -258,8 +654,7 @@ def update_security_hub(client: BaseClient, finding_id: str,
 
     # Validate that the client is an instance of botocore.client.SecurityHub
     if client.meta.service_model.service_name != 'securityhub':
-        raise ValueError(f"Client must be an instance of botocore.client.SecurityHub. Got {
-                         type(client)} instead.")
+        raise ValueError(f"Client must be an instance of botocore.client.SecurityHub. Got {type(client)} instead.")
 
     try:
         kwargs = {}
@@ -282,9 +677,8 @@ def update_security_hub(client: BaseClient, finding_id: str,
 
         if response.get('FailedFindings'):
             for element in response['FailedFindings']:
-                logger.error(f"Updating SecurityHub finding failed: FindingId {
-                    element['Id']}, ErrorCode {element['ErrorCode']}, ErrorMessage {
-                        element['ErrorMessage']}")
+                logger.error(f"Updating SecurityHub finding failed: FindingId {element['Id']}, "
+                             f"ErrorCode {element['ErrorCode']}, ErrorMessage {element['ErrorMessage']}")
         else:
             logger.info("SecurityHub finding updated successfully.")
 
@@ -293,34 +687,75 @@ def update_security_hub(client: BaseClient, finding_id: str,
         raise e
 
 
-def find_instance_for_account(account_id: str, instances_config: dict) -> tuple:
+class JiraRouting(NamedTuple):
+    """Immutable account-to-instance routing table, built once per container from the Lambda configuration."""
+
+    instances: Mapping[str, dict]
+    account_instances: Mapping[str, str]
+    default_instance_name: Optional[str]
+    excluded_account_ids: FrozenSet[str]
+
+
+def build_jira_routing(instances_config: dict, exclude_account_filter: list) -> JiraRouting:
     """
-    Find which Jira instance should handle this account.
-    First tries to match account_id in include_account_ids.
-    If no match, falls back to the default_instance (if configured).
-    Returns: (instance_name, instance_config) or (None, None) if not found
+    Build the routing table for the configured Jira instances.
+
+    Conflicting configurations are rejected by the validation of the Terraform variables. Configurations that bypass
+    it are resolved the way the routing always resolved them, with a warning: an excluded account stays excluded, an
+    account assigned to several instances goes to the first of them, and the first default instance is the default.
+
+    Args:
+        instances_config (dict): The Jira instances configuration, keyed by instance name.
+        exclude_account_filter (list): The account ids excluded from Jira integration.
+
+    Returns:
+        JiraRouting: The routing table.
     """
-    default_instance_name = None
-    default_instance_config = None
 
+    account_instances = {}
+    default_instance_names = []
     for instance_name, instance_config in instances_config.items():
         if not instance_config.get('enabled', True):
             continue
-
-        # Track default instance for fallback
         if instance_config.get('default_instance', False):
-            default_instance_name = instance_name
-            default_instance_config = instance_config
-
-        # Check if this instance has the account (skip if include_account_ids is empty - default instance only)
-        include_account_ids = instance_config.get('include_account_ids', [])
-        if len(include_account_ids) > 0 and account_id in include_account_ids:
-            logger.info(f"Account {account_id} matched to Jira instance '{instance_name}'")
-            return instance_name, instance_config
+            default_instance_names.append(instance_name)
+        for account_id in instance_config.get('include_account_ids', []):
+            assigned_instance_name = account_instances.setdefault(account_id, instance_name)
+            if assigned_instance_name != instance_name:
+                logger.warning(f"Account {account_id} is assigned to both Jira instances '{assigned_instance_name}' "
+                               f"and '{instance_name}', routing it to '{assigned_instance_name}'.")
+
+    excluded_account_ids = frozenset(exclude_account_filter)
+    if len(default_instance_names) > 1:
+        logger.warning(f"Jira instances {', '.join(default_instance_names)} are all marked as default instance, "
+                       f"using '{default_instance_names[0]}'.")
+    for account_id in sorted(excluded_account_ids & account_instances.keys()):
+        logger.warning(f"Excluded account {account_id} is assigned to Jira instance '{account_instances[account_id]}', "
+                       "its findings stay excluded.")
+
+    return JiraRouting(
+        instances=MappingProxyType(dict(instances_config)),
+        account_instances=MappingProxyType(account_instances),
+        default_instance_name=default_instance_names[0] if default_instance_names else None,
+        excluded_account_ids=excluded_account_ids,
+    )
+
+
+def find_instance_for_account(account_id: str, routing: JiraRouting) -> tuple:
+    """
+    Find which Jira instance should handle this account.
+    First tries to match account_id in include_account_ids.
+    If no match, falls back to the default_instance (if configured).
+    Returns: (instance_name, instance_config) or (None, None) if not found
+    """
+    instance_name = routing.account_instances.get(account_id)
+    if instance_name:
+        logger.info(f"Account {account_id} matched to Jira instance '{instance_name}'")
+        return instance_name, routing.instances[instance_name]
 
     # Use default instance if configured
-    if default_instance_config:
-        logger.info(f"Account {account_id} not matched, using default instance '{default_instance_name}'")
-        return default_instance_name, default_instance_config
+    if routing.default_instance_name:
+        logger.info(f"Account {account_id} not matched, using default instance '{routing.default_instance_name}'")
+        return routing.default_instance_name, routing.instances[routing.default_instance_name]
 
     return None, None
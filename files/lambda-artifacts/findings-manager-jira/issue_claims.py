@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Optional
+from aws_lambda_powertools import Logger
+
+# "dynamodb" or "memory", any other value disables the claims
+JIRA_CLAIM_STORE = os.getenv('JIRA_CLAIM_STORE', '')
+JIRA_CLAIM_TABLE_NAME = os.getenv('JIRA_CLAIM_TABLE_NAME')
+# Seconds a claim is held, longer than it takes the note of a created issue to show up in the events of its finding
+JIRA_CLAIM_TTL_SECONDS = int(os.getenv('JIRA_CLAIM_TTL_SECONDS', '900'))
+
+# Module level state survives across warm invocations of the same Lambda container
+_store = None
+# Claims are owned per container, so a container only releases the claims it took
+_owner = uuid.uuid4().hex
+
+
+class IssueClaimed(Exception):
+    """The Jira issue of the finding is being or was just created by another invocation."""
+
+
+class ClaimStore(ABC):
+    """Store of claims on the creation of the Jira issue of a finding, a claim expires after its TTL."""
+
+    @abstractmethod
+    def claim(self, key: str, owner: str, ttl_seconds: int) -> bool:
+        """Atomically claims the key, False when another owner holds an unexpired claim on it."""
+
+    @abstractmethod
+    def release(self, key: str, owner: str):
+        """Releases the claim on the key, if the owner holds it."""
+
+
+class InMemoryClaimStore(ClaimStore):
+    """Claims held by a single Lambda container, no infrastructure needed but not shared between containers."""
+
+    def __init__(self):
+        self._claims = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key: str, owner: str, ttl_seconds: int) -> bool:
+        now = time.time()
+        with self._lock:
+            _, expiration = self._claims.get(key, (None, 0))
+            if expiration > now:
+                return False
+            self._claims[key] = (owner, now + ttl_seconds)
+            return True
+
+    def release(self, key: str, owner: str):
+        with self._lock:
+            if self._claims.get(key, (None, 0))[0] == owner:
+                del self._claims[key]
+
+
+class DynamoDBClaimStore(ClaimStore):
+    """Claims shared by all Lambda containers, taken with a conditional write and removed by the DynamoDB TTL."""
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            # Imported on first use, the Jira Lambda keeps boto3 out of its cold start
+            from boto3 import client
+            self._client = client('dynamodb')
+        return self._client
+
+    def claim(self, key: str, owner: str, ttl_seconds: int) -> bool:
+        now = int(time.time())
+        try:
+            # Expired claims can linger until DynamoDB deletes them, they can be claimed again
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={'id': {'S': key}, 'owner': {'S': owner}, 'expiration': {'N': str(now + ttl_seconds)}},
+                ConditionExpression='attribute_not_exists(id) OR expiration <= :now',
+                ExpressionAttributeValues={':now': {'N': str(now)}}
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def release(self, key: str, owner: str):
+        try:
+            self.client.delete_item(
+                TableName=self.table_name,
+                Key={'id': {'S': key}},
+                # owner is a reserved word in DynamoDB expressions
+                ConditionExpression='#owner = :owner',
+                ExpressionAttributeNames={'#owner': 'owner'},
+                ExpressionAttributeValues={':owner': {'S': owner}}
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            pass
+
+
+def get_claim_store() -> Optional[ClaimStore]:
+    """The configured claim store, None when the claims are disabled."""
+    global _store
+    if _store is None:
+        if JIRA_CLAIM_STORE == 'dynamodb' and JIRA_CLAIM_TABLE_NAME:
+            _store = DynamoDBClaimStore(JIRA_CLAIM_TABLE_NAME)
+        elif JIRA_CLAIM_STORE == 'memory':
+            _store = InMemoryClaimStore()
+    return _store
+
+
+def claim_key(finding: dict) -> str:
+    # Finding ids are only unique per product
+    return f"{finding['ProductArn']}#{finding['Id']}"
+
+
+def claim_issue(finding: dict, logger: Logger) -> bool:
+    """
+    Claim the creation of the Jira issue of a finding.
+
+    Security Hub can emit several events for the same finding within seconds, which all pass the duplicate check on
+    the note of the finding before the note of the first issue is written. Only the invocation that claims the
+    finding creates its issue. The claim is kept after the issue is created, until the note has caught up.
+
+    Args:
+        finding (dict): The Security Hub finding.
+        logger (Logger): The logger of the Lambda.
+
+    Returns:
+        bool: False when the issue of the finding is being or was just created by another invocation, True otherwise,
+            also when the claims are disabled or the claim store fails.
+    """
+
+    store = get_claim_store()
+    if store is None:
+        return True
+    try:
+        return store.claim(claim_key(finding), _owner, JIRA_CLAIM_TTL_SECONDS)
+    except Exception as e:
+        # Without the claim a duplicate issue can be created, which is better than no issue at all
+        logger.warning(f"Failed to claim finding {finding['Id']}, creating its Jira issue unclaimed. Original error: {e}")
+        return True
+
+
+def release_issue_claim(finding: dict, logger: Logger):
+    """
+    Release the claim on a finding whose Jira issue could not be created, so a retry can create it.
+
+    Args:
+        finding (dict): The Security Hub finding.
+        logger (Logger): The logger of the Lambda.
+    """
+
+    store = get_claim_store()
+    if store is None:
+        return
+    try:
+        store.release(claim_key(finding), _owner)
+    except Exception as e:
+        logger.warning(f"Failed to release the claim on finding {finding['Id']}, retries wait for it to expire. "
+                       f"Original error: {e}")
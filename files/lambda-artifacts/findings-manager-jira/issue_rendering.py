@@ -0,0 +1,132 @@
+import gzip
+import json
+import os
+from typing import NamedTuple, Optional
+
+# Bytes of the description of a Jira issue at most, Jira Cloud rejects text fields over 32767 characters
+JIRA_ISSUE_DESCRIPTION_MAX_BYTES = int(os.getenv('JIRA_ISSUE_DESCRIPTION_MAX_BYTES', '16384'))
+# Name of the attachment holding the full event when it does not fit in the description
+FINDING_ATTACHMENT_NAME = 'finding.json.gz'
+
+# Top level ASFF fields of the summary, the bulky ones like Resources and Vulnerabilities are summarized separately
+SUMMARY_FIELDS = (
+    'Id', 'ProductArn', 'ProductName', 'GeneratorId', 'AwsAccountId', 'AwsAccountName', 'Region', 'Types', 'Title',
+    'Severity', 'Workflow', 'RecordState', 'FirstObservedAt', 'LastObservedAt', 'UpdatedAt', 'SourceUrl',
+)
+SUMMARY_COMPLIANCE_FIELDS = ('Status', 'SecurityControlId')
+SUMMARY_RESOURCE_FIELDS = ('Type', 'Id', 'Region')
+SUMMARY_VULNERABILITY_FIELDS = ('Id', 'FixAvailable', 'ExploitAvailable')
+# Resources and vulnerabilities listed in the summary at most, the others are only counted
+MAX_SUMMARY_ITEMS = 10
+# Product fields that become labels of the issue, and are listed in the summary
+LABEL_PRODUCT_FIELDS = ('RuleId', 'ControlId', 'aws/securityhub/ProductName')
+TRUNCATION_MARKER = '\n... (truncated)'
+
+
+class RenderedIssue(NamedTuple):
+    """The description of the Jira issue of a finding and the attachment holding the full event, if any."""
+
+    description: str
+    attachment: Optional[bytes]
+
+
+def _select(data: dict, fields: tuple) -> dict:
+    return {field: data[field] for field in fields if field in data}
+
+
+def _summarize_items(items: list, fields: tuple) -> dict:
+    return {'Count': len(items), 'Items': [_select(item, fields) for item in items[:MAX_SUMMARY_ITEMS]]}
+
+
+def finding_summary(finding: dict) -> dict:
+    """
+    Select the fields of a finding that identify it and its resources, in a size independent of the source product.
+
+    Args:
+        finding (dict): The Security Hub finding.
+
+    Returns:
+        dict: The summary of the finding.
+    """
+
+    summary = _select(finding, SUMMARY_FIELDS)
+    if 'Compliance' in finding:
+        summary['Compliance'] = _select(finding['Compliance'], SUMMARY_COMPLIANCE_FIELDS)
+    if 'Recommendation' in finding.get('Remediation', {}):
+        summary['Remediation'] = finding['Remediation']['Recommendation']
+    product_fields = _select(finding.get('ProductFields', {}), LABEL_PRODUCT_FIELDS)
+    if product_fields:
+        summary['ProductFields'] = product_fields
+    if finding.get('Resources'):
+        summary['Resources'] = _summarize_items(finding['Resources'], SUMMARY_RESOURCE_FIELDS)
+    if finding.get('Vulnerabilities'):
+        summary['Vulnerabilities'] = _summarize_items(finding['Vulnerabilities'], SUMMARY_VULNERABILITY_FIELDS)
+    return summary
+
+
+def issue_labels(finding: dict) -> list:
+    """
+    Get the labels of the Jira issue of a finding, Jira rejects labels holding spaces.
+
+    Args:
+        finding (dict): The Security Hub finding.
+
+    Returns:
+        list: The labels of the issue.
+    """
+
+    product_fields = finding['ProductFields']
+    labels = [
+        finding['Region'],
+        finding['AwsAccountId'],
+        finding['AwsAccountName'],
+        finding['Severity']['Label'].lower(),
+        *[product_fields[key] for key in LABEL_PRODUCT_FIELDS if key in product_fields],
+    ]
+    return [label.replace(' ', '') for label in labels]
+
+
+def _truncate(text: str, max_bytes: int) -> str:
+    encoded = text.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return text
+    keep = max(max_bytes - len(TRUNCATION_MARKER.encode('utf-8')), 0)
+    return encoded[:keep].decode('utf-8', errors='ignore') + TRUNCATION_MARKER
+
+
+def render_issue(event: dict, max_bytes: int = JIRA_ISSUE_DESCRIPTION_MAX_BYTES) -> RenderedIssue:
+    """
+    Render the description of the Jira issue of a Security Hub event within a byte budget.
+
+    The description holds the description of the finding and its summary, followed by the full event when it fits
+    the budget. A larger event is attached gzip compressed instead, so the size of the request creating the issue
+    does not depend on the size of the finding.
+
+    Args:
+        event (dict): The Security Hub event data, holding a single finding.
+        max_bytes (int): The bytes of the description at most.
+
+    Returns:
+        RenderedIssue: The description and, for an event over the budget, the gzip compressed event to attach.
+    """
+
+    finding = event['findings'][0]
+    intro = f"{finding['Description']}\n\nA Security Hub finding has been detected:\n"
+    # json.dumps escapes non ASCII characters, so the length of its output is its size in bytes
+    summary = json.dumps(finding_summary(finding), indent=2, sort_keys=True)
+    head_bytes = len(intro.encode('utf-8')) + len(summary) + len('{code}{code}\n')
+
+    # The compact event is never larger than the indented one, an event over the budget is not indented at all
+    compact_event = json.dumps(event, separators=(',', ':'), sort_keys=True)
+    full_block = '\nFull finding:\n{code}{code}\n'
+    if head_bytes + len(full_block) + len(compact_event) <= max_bytes:
+        full_event = json.dumps(event, indent=2, sort_keys=True)
+        if head_bytes + len(full_block) + len(full_event) <= max_bytes:
+            return RenderedIssue(f"{intro}{{code}}{summary}{{code}}\n\nFull finding:\n{{code}}{full_event}{{code}}\n", None)
+
+    note = f"\nThe full finding is attached as {FINDING_ATTACHMENT_NAME}.\n"
+    summary = _truncate(summary, max_bytes - (head_bytes - len(summary)) - len(note.encode('utf-8')))
+    return RenderedIssue(
+        f"{intro}{{code}}{summary}{{code}}\n{note}",
+        gzip.compress(compact_event.encode('utf-8'), 6)
+    )
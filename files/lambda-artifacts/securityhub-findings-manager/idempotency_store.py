@@ -0,0 +1,201 @@
+from datetime import datetime, timedelta, timezone
+from hashlib import sha256
+from json import dumps, loads
+from os import environ
+from time import time
+from typing import Iterable, Optional
+from boto3 import client
+from aws_lambda_powertools import Logger
+
+IDEMPOTENCY_TABLE_NAME = environ.get("IDEMPOTENCY_TABLE_NAME")
+# Seconds a completed rule is remembered, DynamoDB removes the record through its TTL attribute afterwards
+IDEMPOTENCY_TTL_SECONDS = int(environ.get("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# Seconds a sweep watermark is kept, a rule without a watermark is swept in full, so at least once per interval
+FULL_SWEEP_INTERVAL_SECONDS = int(environ.get("FULL_SWEEP_INTERVAL_SECONDS", "604800"))
+# Incremental sweeps fetch findings updated this long before the watermark again, covering eventually consistent updates
+WATERMARK_OVERLAP_SECONDS = 300
+WATERMARK_KEY_PREFIX = "watermark#"
+CHECKPOINT_KEY_PREFIX = "checkpoint#"
+# DynamoDB limits on the number of keys in a single BatchGetItem and BatchWriteItem request
+DYNAMODB_MAX_GET_KEYS = 100
+DYNAMODB_MAX_WRITE_ITEMS = 25
+
+_DYNAMODB_CLIENT = None
+
+
+def _get_dynamodb_client():
+    global _DYNAMODB_CLIENT
+    if _DYNAMODB_CLIENT is None:
+        _DYNAMODB_CLIENT = client("dynamodb")
+    return _DYNAMODB_CLIENT
+
+
+def _chunks(items: list, size: int) -> Iterable[list]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _format_timestamp(timestamp: datetime) -> str:
+    # The format Security Hub uses for its date filters
+    return timestamp.astimezone(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def _shard_suffix(shard: Optional[dict]) -> str:
+    # Unsharded rules keep the keys they had before sweeps could be sharded
+    return f":{dumps(shard, sort_keys=True)}" if shard else ""
+
+
+def rule_key(rule: dict, rules_version: Optional[str], shard: dict = None) -> Optional[str]:
+    """Idempotency key of a rule, or a shard of it, within a rules version, None when the rules version is unknown."""
+    if not rules_version:
+        return None
+    return sha256(f"{rules_version}:{dumps(rule, sort_keys=True)}{_shard_suffix(shard)}".encode()).hexdigest()
+
+
+def completed_keys(keys: Iterable[str], logger: Logger) -> set:
+    """The subset of the keys that were already marked completed, empty when no table is configured."""
+    keys = sorted(set(keys))
+    if not IDEMPOTENCY_TABLE_NAME or not keys:
+        return set()
+
+    completed = set()
+    try:
+        for chunk in _chunks(keys, DYNAMODB_MAX_GET_KEYS):
+            request = {IDEMPOTENCY_TABLE_NAME: {"Keys": [{"id": {"S": key}} for key in chunk],
+                                                "ProjectionExpression": "id"}}
+            while request:
+                response = _get_dynamodb_client().batch_get_item(RequestItems=request)
+                completed.update(item["id"]["S"] for item in response["Responses"].get(IDEMPOTENCY_TABLE_NAME, []))
+                request = response.get("UnprocessedKeys")
+    except Exception as e:
+        # Rules are safe to apply twice, so a failing lookup only costs the work the store would have saved
+        logger.warning(f"Failed to look up completed rule(s), processing all of them. Original error: {e}")
+    return completed
+
+
+def mark_completed(keys: Iterable[str], logger: Logger):
+    keys = sorted(set(keys))
+    if not IDEMPOTENCY_TABLE_NAME or not keys:
+        return
+
+    expiration = str(int(time()) + IDEMPOTENCY_TTL_SECONDS)
+    try:
+        for chunk in _chunks(keys, DYNAMODB_MAX_WRITE_ITEMS):
+            request = {IDEMPOTENCY_TABLE_NAME: [
+                {"PutRequest": {"Item": {"id": {"S": key}, "expiration": {"N": expiration}}}} for key in chunk
+            ]}
+            while request:
+                response = _get_dynamodb_client().batch_write_item(RequestItems=request)
+                request = response.get("UnprocessedItems")
+    except Exception as e:
+        logger.warning(f"Failed to mark rule(s) as completed, a redelivery will process them again. Original error: {e}")
+
+
+def rule_hash(rule: dict, shard: dict = None) -> str:
+    """Hash of the rule content, a changed rule gets a new hash and so starts without a watermark.
+
+    Every shard of a rule has a watermark of its own. The trigger Lambda records the hashes of the deployed rules in the
+    rules manifest, so a deploy recognises the rules that were added or changed.
+    """
+    return sha256(f"{dumps(rule, sort_keys=True)}{_shard_suffix(shard)}".encode()).hexdigest()
+
+
+def sweep_updated_since(rules: list, logger: Logger, shards: list = None) -> list:
+    """Per rule, the UpdatedAt from which an incremental sweep fetches findings, None for a full sweep."""
+    if not IDEMPOTENCY_TABLE_NAME or not rules:
+        return [None] * len(rules)
+
+    hashes = [rule_hash(rule, shard) for rule, shard in zip(rules, shards or [None] * len(rules))]
+    watermarks = {}
+    try:
+        for chunk in _chunks(sorted(set(hashes)), DYNAMODB_MAX_GET_KEYS):
+            request = {IDEMPOTENCY_TABLE_NAME: {"Keys": [{"id": {"S": WATERMARK_KEY_PREFIX + key}} for key in chunk],
+                                                "ProjectionExpression": "id, swept_at, expiration"}}
+            while request:
+                response = _get_dynamodb_client().batch_get_item(RequestItems=request)
+                for item in response["Responses"].get(IDEMPOTENCY_TABLE_NAME, []):
+                    # Expired items can linger until DynamoDB deletes them
+                    if int(item["expiration"]["N"]) > time():
+                        watermarks[item["id"]["S"][len(WATERMARK_KEY_PREFIX):]] = item["swept_at"]["S"]
+                request = response.get("UnprocessedKeys")
+    except Exception as e:
+        logger.warning(f"Failed to look up sweep watermarks, sweeping all rules in full. Original error: {e}")
+        return [None] * len(rules)
+
+    overlap = timedelta(seconds=WATERMARK_OVERLAP_SECONDS)
+    return [
+        _format_timestamp(datetime.fromisoformat(watermarks[key].replace("Z", "+00:00")) - overlap)
+        if key in watermarks else None
+        for key in hashes
+    ]
+
+
+def record_watermarks(rules: list, swept_at: datetime, logger: Logger, shards: list = None):
+    """Remembers that the findings of the rules were swept up to swept_at, the start of the successful sweep."""
+    hashes = sorted({rule_hash(rule, shard) for rule, shard in zip(rules, shards or [None] * len(rules))})
+    if not IDEMPOTENCY_TABLE_NAME or not hashes:
+        return
+
+    expiration = str(int(time()) + FULL_SWEEP_INTERVAL_SECONDS)
+    try:
+        for chunk in _chunks(hashes, DYNAMODB_MAX_WRITE_ITEMS):
+            request = {IDEMPOTENCY_TABLE_NAME: [
+                {"PutRequest": {"Item": {"id": {"S": WATERMARK_KEY_PREFIX + key},
+                                         "swept_at": {"S": _format_timestamp(swept_at)},
+                                         "expiration": {"N": expiration}}}}
+                for key in chunk
+            ]}
+            while request:
+                response = _get_dynamodb_client().batch_write_item(RequestItems=request)
+                request = response.get("UnprocessedItems")
+    except Exception as e:
+        logger.warning(f"Failed to record sweep watermarks, the next sweep covers these rules in full. Original error: {e}")
+
+
+def checkpoint_key(scope: Optional[str], rules: list) -> Optional[str]:
+    """Key of the streaming progress of the rules sharing a query, None when the scope (rules version) is unknown."""
+    if not scope:
+        return None
+    return CHECKPOINT_KEY_PREFIX + sha256(f"{scope}:{dumps(rules, sort_keys=True)}".encode()).hexdigest()
+
+
+def load_checkpoint(key: Optional[str], logger: Logger) -> Optional[dict]:
+    """The progress saved under the key by an earlier delivery, None to start from the first page."""
+    if not IDEMPOTENCY_TABLE_NAME or not key:
+        return None
+
+    try:
+        item = _get_dynamodb_client().get_item(
+            TableName=IDEMPOTENCY_TABLE_NAME, Key={"id": {"S": key}}, ConsistentRead=True
+        ).get("Item")
+    except Exception as e:
+        logger.warning(f"Failed to look up the streaming checkpoint, starting from the first page. Original error: {e}")
+        return None
+    if item is None or int(item["expiration"]["N"]) <= time():
+        return None
+    return loads(item["checkpoint"]["S"])
+
+
+def save_checkpoint(key: Optional[str], checkpoint: dict, logger: Logger):
+    """Saves the progress after a page, it expires with the idempotency records of the same rules."""
+    if not IDEMPOTENCY_TABLE_NAME or not key:
+        return
+
+    try:
+        _get_dynamodb_client().put_item(TableName=IDEMPOTENCY_TABLE_NAME, Item={
+            "id": {"S": key},
+            "checkpoint": {"S": dumps(checkpoint, sort_keys=True)},
+            "expiration": {"N": str(int(time()) + IDEMPOTENCY_TTL_SECONDS)},
+        })
+    except Exception as e:
+        logger.warning(f"Failed to save the streaming checkpoint, a redelivery starts from an earlier page. Original error: {e}")
+
+
+def clear_checkpoint(key: Optional[str], logger: Logger):
+    if not IDEMPOTENCY_TABLE_NAME or not key:
+        return
+
+    try:
+        _get_dynamodb_client().delete_item(TableName=IDEMPOTENCY_TABLE_NAME, Key={"id": {"S": key}})
+    except Exception as e:
+        logger.warning(f"Failed to clear the streaming checkpoint, it expires through its TTL. Original error: {e}")
@@ -0,0 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps
+from os import environ
+from boto3 import client
+from jira_eligibility import jira_action, map_item, settings_from_json
+from observability import add_count
+
+# Settings of the Jira eligibility rules, set in lambda routing mode only, when no Step Function routes the findings
+JIRA_ELIGIBILITY_SETTINGS = environ.get("JIRA_ELIGIBILITY_SETTINGS", "")
+# The Jira Lambda invoked asynchronously with the eligible findings, or in queued mode the queue buffering them for it
+JIRA_LAMBDA_NAME = environ.get("JIRA_LAMBDA_NAME", "")
+JIRA_QUEUE_URL = environ.get("JIRA_QUEUE_URL", "")
+# SQS limits, they apply to a SendMessageBatch request as a whole
+MAX_PAYLOAD_BYTES = 256 * 1024
+SQS_MAX_BATCH_ENTRIES = 10
+# The Jira Lambda is invoked once per finding, these invocations are made in parallel
+INVOKE_THREADS = 8
+
+# Module level state survives across warm invocations of the same Lambda container
+_SETTINGS = settings_from_json(JIRA_ELIGIBILITY_SETTINGS) if JIRA_ELIGIBILITY_SETTINGS else None
+_CLIENTS = {}
+
+
+def routing_enabled() -> bool:
+    return _SETTINGS is not None
+
+
+def _get_client(service: str):
+    if service not in _CLIENTS:
+        _CLIENTS[service] = client(service)
+    return _CLIENTS[service]
+
+
+def eligible_findings(findings: list, suppressed_finding_ids: list) -> list:
+    """The findings the Jira integration acts on, decided by the rules of the Choice rule of the Step Function."""
+    suppressed = set(suppressed_finding_ids)
+    eligible = []
+    for finding in findings:
+        action = jira_action(finding, _SETTINGS, finding.get("Id") in suppressed)
+        if action:
+            eligible.append(finding)
+            add_count("JiraFindingsRouted", Action=action)
+    return eligible
+
+
+def _batches(bodies: list, max_entries: int) -> list:
+    # A finding is at most 240 KB, so every body fits in a batch of its own
+    batches, batch, batch_bytes = [], [], 0
+    for body in bodies:
+        body_bytes = len(body.encode())
+        if batch and (len(batch) == max_entries or batch_bytes + body_bytes > MAX_PAYLOAD_BYTES):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(body)
+        batch_bytes += body_bytes
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _enqueue(findings: list, logger) -> int:
+    # Every message holds a Map item like the Step Function sends in queued mode
+    sqs = _get_client("sqs")
+    failed = 0
+    for batch in _batches([dumps(map_item(finding, _SETTINGS)) for finding in findings], SQS_MAX_BATCH_ENTRIES):
+        entries = [{"Id": str(index), "MessageBody": body} for index, body in enumerate(batch)]
+        response = sqs.send_message_batch(QueueUrl=JIRA_QUEUE_URL, Entries=entries)
+        for failure in response.get("Failed", []):
+            logger.error(f"Failed putting finding on the Jira queue: {failure['Code']} {failure.get('Message', '')}")
+            failed += 1
+    return failed
+
+
+def _invoke_one(lambda_client, finding: dict, logger) -> bool:
+    try:
+        lambda_client.invoke(
+            FunctionName=JIRA_LAMBDA_NAME,
+            InvocationType="Event",
+            Payload=dumps({"detail": {"findings": [finding]}})
+        )
+    except Exception as e:
+        logger.error(f"Failed to invoke the Jira Lambda for finding {finding.get('Id')}. Original error: {e}")
+        return False
+    return True
+
+
+def _invoke(findings: list, logger) -> int:
+    # One invocation per finding, like the Step Function Map, so a retry of a failed invocation only repeats its finding
+    # boto3 clients are thread safe once created, creating them is not
+    lambda_client = _get_client("lambda")
+    with ThreadPoolExecutor(max_workers=INVOKE_THREADS) as executor:
+        invoked = executor.map(lambda finding: _invoke_one(lambda_client, finding, logger), findings)
+        return sum(not success for success in invoked)
+
+
+def route_findings(findings: list, suppressed_finding_ids: list, logger):
+    """
+    Passes the Jira eligible findings of an event to the Jira Lambda, in one invocation of the events Lambda.
+
+    Every finding is passed on its own, so the Jira Lambda handles each finding in a separate invocation with its own
+    retries. Raises when none of the findings could be passed, so the asynchronous invocation of the events Lambda is
+    retried. When only some findings could not be passed they are logged and counted instead: a retry would pass the
+    other findings again, creating their Jira issues twice.
+    """
+    eligible = eligible_findings(findings, suppressed_finding_ids)
+    if not eligible:
+        return
+    failed = _enqueue(eligible, logger) if JIRA_QUEUE_URL else _invoke(eligible, logger)
+    add_count("JiraFindingsNotRouted", failed)
+    if failed == len(eligible):
+        raise RuntimeError(f"Failed to pass {failed} finding(s) to the Jira integration.")
+    if failed:
+        logger.error(f"Failed to pass {failed} of {len(eligible)} finding(s) to the Jira integration, they are not retried.")
+    logger.info(f"Passed {len(eligible) - failed} finding(s) to the Jira integration.")
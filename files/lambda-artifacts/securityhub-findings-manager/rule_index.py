@@ -0,0 +1,102 @@
+from re import compile as compile_regexp
+from typing import Iterator, List, Optional
+from awsfindingsmanagerlib import Finding, Rule
+
+# Bucket for rules that do not restrict the region they apply to
+ANY_REGION = None
+# Bucket for rules that are not keyed on a security control or rule id
+UNKEYED = None
+
+
+class IndexedRule:
+    """A registered rule with its match fields normalised once, so matching a finding does no re-parsing."""
+
+    __slots__ = ("position", "rule", "product_name", "title", "security_control_id", "rule_or_control_id",
+                 "regions", "resource_id_patterns", "tags")
+
+    def __init__(self, position: int, rule: Rule):
+        self.position = position
+        self.rule = rule
+        self.product_name = rule.product_name
+        self.title = rule.title
+        self.security_control_id = rule.security_control_id
+        self.rule_or_control_id = rule.rule_or_control_id
+        self.regions = frozenset(rule.regions)
+        self.resource_id_patterns = tuple(compile_regexp(pattern) for pattern in rule.resource_id_regexps)
+        self.tags = tuple((tag.get("key"), tag.get("value")) for tag in rule.tags)
+
+    def is_matching(self, finding: Finding) -> bool:
+        """Same semantics as Finding.is_matching_rule, using the precompiled match fields."""
+        if self.product_name and self.product_name != finding.product_name:
+            return False
+        if self.title and self.title != finding.title:
+            return False
+        if self.security_control_id and self.security_control_id != finding.security_control_id:
+            return False
+        if self.rule_or_control_id and self.rule_or_control_id not in (finding.control_id, finding.rule_id):
+            return False
+        if self.regions and finding.region not in self.regions:
+            return False
+        if self.resource_id_patterns and not any(pattern.search(resource_id)
+                                                 for resource_id in finding.resource_ids if resource_id
+                                                 for pattern in self.resource_id_patterns):
+            return False
+        if self.tags and not any(tags.get(key) == value
+                                 for key, value in self.tags
+                                 for tags in finding.tags):
+            return False
+        return True
+
+
+class RuleIndex:
+    """Rules bucketed by control/rule id and region, so a finding is only checked against its candidate rules."""
+
+    def __init__(self, rules: List[Rule]):
+        buckets = {}
+        for position, rule in enumerate(rules):
+            indexed_rule = IndexedRule(position, rule)
+            regions = buckets.setdefault(self._rule_key(rule), {})
+            for region in rule.regions or [ANY_REGION]:
+                regions.setdefault(region, []).append(indexed_rule)
+        self._buckets = {key: {region: tuple(indexed_rules) for region, indexed_rules in regions.items()}
+                         for key, regions in buckets.items()}
+        self.size = len(rules)
+
+    @staticmethod
+    def _rule_key(rule: Rule):
+        # security_control_id and rule_or_control_id are mutually exclusive on a rule
+        if rule.security_control_id:
+            return ("security_control_id", rule.security_control_id)
+        if rule.rule_or_control_id:
+            return ("rule_or_control_id", rule.rule_or_control_id)
+        return UNKEYED
+
+    @staticmethod
+    def _finding_keys(finding: Finding) -> set:
+        return {
+            ("security_control_id", finding.security_control_id),
+            ("rule_or_control_id", finding.control_id),
+            ("rule_or_control_id", finding.rule_id),
+            UNKEYED,
+        }
+
+    def candidates(self, finding: Finding) -> List[IndexedRule]:
+        """The rules that could match the finding, in registration order."""
+        candidates = {}
+        for key in self._finding_keys(finding):
+            regions = self._buckets.get(key)
+            if not regions:
+                continue
+            for region in (finding.region, ANY_REGION):
+                for indexed_rule in regions.get(region, ()):
+                    candidates[indexed_rule.position] = indexed_rule
+        return [candidates[position] for position in sorted(candidates)]
+
+    def matching_rules(self, finding: Finding) -> Iterator[Rule]:
+        for indexed_rule in self.candidates(finding):
+            if indexed_rule.is_matching(finding):
+                yield indexed_rule.rule
+
+    def match(self, finding: Finding) -> Optional[Rule]:
+        """The first registered rule matching the finding, None if no rule matches."""
+        return next(self.matching_rules(finding), None)
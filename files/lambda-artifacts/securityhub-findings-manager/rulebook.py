@@ -0,0 +1,99 @@
+"""Compiles rules.yaml into the rulebook artifact the Lambdas load, validating every rule once.
+
+Usage:
+    python rulebook.py rules.yaml [--output rules.yaml.compiled.json]
+"""
+import argparse
+import sys
+from hashlib import sha256
+from json import dumps
+from re import compile as compile_regexp, error as RegexpError
+from typing import Optional
+import yaml
+from awsfindingsmanagerlib.validations import validate_rule_data
+
+# Bumped when the layout of the artifact changes, Lambdas only load the format they know
+FORMAT_VERSION = 1
+
+
+class RulebookError(ValueError):
+    """The rules file is not a valid rulebook, the message lists every problem found."""
+
+
+def _normalise(rule: dict) -> dict:
+    # Order does not matter for these match fields, so duplicates are dropped and the lists sorted once
+    match_on = dict(rule["match_on"])
+    for field in ("regions", "resource_id_regexps"):
+        if field in match_on:
+            match_on[field] = sorted(set(match_on[field]))
+    return {"note": rule["note"], "action": rule["action"], "match_on": match_on}
+
+
+def compile_rulebook(contents: bytes, source_version: Optional[str] = None) -> dict:
+    """Validates the rules of a rules.yaml file and returns the artifact, raises RulebookError when invalid."""
+    try:
+        data = yaml.safe_load(contents)
+    except yaml.YAMLError as e:
+        raise RulebookError(f"The rules file is not valid YAML: {e}") from e
+    if not isinstance(data, dict) or not isinstance(data.get("Rules"), list):
+        raise RulebookError("The rules file must hold a list of rules under the \"Rules\" key.")
+
+    rules, errors, notes = [], [], set()
+    for position, rule_data in enumerate(data["Rules"], start=1):
+        try:
+            rule = _normalise(validate_rule_data(rule_data))
+        except Exception as e:
+            errors.append(f"rule {position}: {type(e).__name__} {' '.join(str(e).split())}".rstrip())
+            continue
+        # The findings manager identifies rules by their note, a second rule with the same note would be dropped
+        if rule["note"] in notes:
+            errors.append(f"rule {position}: the note {rule['note']!r} is already used by another rule")
+        notes.add(rule["note"])
+        for pattern in rule["match_on"].get("resource_id_regexps", []):
+            try:
+                compile_regexp(pattern)
+            except RegexpError as e:
+                errors.append(f"rule {position}: invalid resource id regexp {pattern!r}: {e}")
+        rules.append(rule)
+    if errors:
+        raise RulebookError(f"Found {len(errors)} problem(s) in the rules file: {'; '.join(errors)}.")
+
+    return {
+        "format_version": FORMAT_VERSION,
+        "content_hash": sha256(dumps(rules, sort_keys=True).encode()).hexdigest(),
+        "source_version": source_version,
+        "rules": rules,
+    }
+
+
+def dump_rulebook(rulebook: dict) -> bytes:
+    """Canonical JSON of the artifact, with sorted keys and without whitespace.
+
+    The artifact embeds the source_version of the rules object it was compiled from, so the same rules uploaded again
+    give different bytes and a different S3 ETag. Compare the content_hash to tell whether the rules changed.
+    """
+    return dumps(rulebook, sort_keys=True, separators=(",", ":")).encode()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("rules_file")
+    parser.add_argument("--output", help="Where to write the artifact, only validates the rules file when omitted")
+    args = parser.parse_args()
+
+    with open(args.rules_file, "rb") as rules_file:
+        try:
+            rulebook = compile_rulebook(rules_file.read())
+        except RulebookError as e:
+            print(f"{args.rules_file}: {e}", file=sys.stderr)
+            return 1
+
+    if args.output:
+        with open(args.output, "wb") as output_file:
+            output_file.write(dump_rulebook(rulebook))
+    print(f"{args.rules_file}: {len(rulebook['rules'])} valid rule(s), content hash {rulebook['content_hash']}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
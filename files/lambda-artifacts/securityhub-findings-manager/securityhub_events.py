@@ -1,14 +1,75 @@
+from collections import Counter
 from aws_lambda_powertools import Logger
 from awsfindingsmanagerlib import FindingsManager
-from strategize_findings_manager import manage
+from finding_fingerprint import remember_findings, unchanged_findings
+from jira_router import route_findings, routing_enabled
+from observability import add_count, instrument_handler, log_payload, log_payload_on_error, timed
+from strategize_findings_manager import (
+    finding_state, load_findings_manager, manage, publish_securityhub_client_metrics, rules_cache_stats
+)
 
 LOGGER = Logger()
 
+# Findings in other workflow states are left alone, in line with the default query filter of the worker
+MANAGED_WORKFLOW_STATUSES = ("NEW", "NOTIFIED")
+FINGERPRINT_SCOPE = "events"
 
-@LOGGER.inject_lambda_context(log_event=True)
+
+@LOGGER.inject_lambda_context
+@instrument_handler
 def lambda_handler(event, context):
-    return manage(
-        FindingsManager.suppress_findings_on_matching_rules,
-        (event["detail"]["findings"],),
-        LOGGER
-    )
+    log_payload(LOGGER, "Received event.", event)
+    result = manage_findings(event)
+    # In lambda routing mode the Jira decision is made here as well, instead of by the Step Function around this Lambda
+    if routing_enabled():
+        with timed("RouteFindingsToJira"):
+            route_findings(event["detail"]["findings"], result["suppressed_finding_ids"], LOGGER)
+    return result
+
+
+def manage_findings(event: dict) -> dict:
+    """Suppresses the findings of the event that match a rule, the findings the Jira integration acts on are kept."""
+    # An Imported event can hold up to 100 findings, all of them are evaluated in a single pass
+    findings = [
+        finding for finding in event["detail"]["findings"]
+        if finding.get("Workflow", {}).get("Status") in MANAGED_WORKFLOW_STATUSES
+    ]
+    if not findings:
+        LOGGER.info("No findings with a managed workflow status in the event.")
+        return finding_state("skipped")
+
+    findings_manager = load_findings_manager(LOGGER)
+    if findings_manager is None:
+        log_payload_on_error(LOGGER, "Failed to evaluate the findings of the event.", event)
+        return finding_state("failed")
+
+    # Re-imports that match no rule under the current rules version are not evaluated again
+    rules_version = rules_cache_stats()["etag"]
+    unchanged = unchanged_findings(FINGERPRINT_SCOPE, findings, LOGGER, rules_version)
+    findings = [finding for finding in findings if finding["Id"] not in unchanged]
+    if unchanged:
+        LOGGER.info(f"Skipping {len(unchanged)} finding(s) unchanged since they were last evaluated.")
+        add_count("FindingsUnchanged", len(unchanged))
+    if not findings:
+        return finding_state("skipped")
+
+    for product_name, count in Counter(finding.get("ProductName") for finding in findings).items():
+        add_count("FindingsEvaluated", count, ProductName=product_name)
+    with timed("SuppressFindings"):
+        result = manage(
+            FindingsManager.suppress_findings_on_matching_rules,
+            (findings,),
+            LOGGER,
+            findings_manager
+        )
+    publish_securityhub_client_metrics()
+    if result["finding_state"] == "failed":
+        log_payload_on_error(LOGGER, "Failed to evaluate the findings of the event.", event)
+    else:
+        # Suppressed findings change their workflow status, so only the findings left alone are remembered
+        suppressed = set(result["suppressed_finding_ids"])
+        remember_findings(
+            FINGERPRINT_SCOPE, [finding for finding in findings if finding["Id"] not in suppressed], LOGGER,
+            rules_version
+        )
+    return result
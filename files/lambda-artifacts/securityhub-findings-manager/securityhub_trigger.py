@@ -1,25 +1,221 @@
-from boto3 import client
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from json import dumps
 from os import environ
+from boto3 import client
 from aws_lambda_powertools import Logger
-from strategize_findings_manager import get_rules
+from idempotency_store import rule_hash, sweep_updated_since
+from observability import add_count, instrument_handler, log_payload, timed
+from strategize_findings_manager import (
+    compile_rules_object, get_rules, load_rules_manifest, publish_securityhub_client_metrics, rules_cache_stats,
+    store_rules_manifest, unsuppress_removed_rules
+)
 
 SQS_QUEUE_NAME = environ.get("SQS_QUEUE_NAME")
+# Maximum number of rules packed into a single SQS message, 1 puts every rule in its own message
+SQS_RULES_PER_MESSAGE = max(int(environ.get("SQS_RULES_PER_MESSAGE", "1")), 1)
+# SQS limits, both apply to a single message as well as to a SendMessageBatch request as a whole
+SQS_MAX_BATCH_ENTRIES = 10
+SQS_MAX_PAYLOAD_BYTES = 256 * 1024
+SQS_SEND_THREADS = 8
+# Deploys of the rules object only sweep the rules that were added or changed since the previous deploy
+SWEEP_CHANGED_RULES_ONLY = environ.get("SWEEP_CHANGED_RULES_ONLY", "true").lower() == "true"
+# Sets the findings suppressed by rules that were removed from the rules object back to NEW
+UNSUPPRESS_REMOVED_RULES = environ.get("UNSUPPRESS_REMOVED_RULES", "false").lower() == "true"
+# Splits the sweep of every rule into shards, so workers sweep slices of the findings of broad rules in parallel
+SWEEP_SHARDS_ENABLED = environ.get("SWEEP_SHARDS_ENABLED", "false").lower() == "true"
+# Comma separated account IDs and regions that get a shard of their own, the findings of all others share one shard
+SWEEP_SHARD_ACCOUNT_IDS = [value for value in environ.get("SWEEP_SHARD_ACCOUNT_IDS", "").split(",") if value]
+SWEEP_SHARD_REGIONS = [value for value in environ.get("SWEEP_SHARD_REGIONS", "").split(",") if value]
 LOGGER = Logger()
 
 
-@LOGGER.inject_lambda_context(log_event=True)
+def _envelope(rule_jsons: list, rules_version: str = None, sweep_id: str = None, since_jsons: list = (),
+              shard_jsons: list = ()) -> str:
+    # The rules version and sweep id let the worker recognise redelivered rules it has already applied
+    return (
+        f'{{"rules_version": {dumps(rules_version)}, "sweep_id": {dumps(sweep_id)}, '
+        f'"updated_since": [{", ".join(since_jsons)}], "shards": [{", ".join(shard_jsons)}], '
+        f'"rules": [{", ".join(rule_jsons)}]}}'
+    )
+
+
+def bundle_rules(rules: list, rules_version: str = None, sweep_id: str = None, updated_since: list = None,
+                 shards: list = None) -> list:
+    """Packs the rules into message bodies holding at most SQS_RULES_PER_MESSAGE rules each.
+
+    updated_since holds, per rule, the watermark of an incremental sweep or None for a full sweep, shards the
+    Security Hub filters limiting the rule to its shard or None for all findings of the rule.
+    """
+    # Serialized size of the envelope without any rules in it
+    envelope_bytes = len(_envelope([], rules_version, sweep_id).encode())
+    bodies, bundle, since_bundle, shard_bundle, bundle_bytes = [], [], [], [], envelope_bytes
+    for rule, since, shard in zip(rules, updated_since or [None] * len(rules), shards or [None] * len(rules)):
+        rule_json, since_json, shard_json = dumps(rule), dumps(since), dumps(shard)
+        rule_bytes = len(rule_json.encode()) + len(since_json) + len(shard_json.encode())
+        # Every rule after the first one in a bundle adds a ", " separator to all three lists
+        if bundle and (len(bundle) >= SQS_RULES_PER_MESSAGE or bundle_bytes + 6 + rule_bytes > SQS_MAX_PAYLOAD_BYTES):
+            bodies.append(_envelope(bundle, rules_version, sweep_id, since_bundle, shard_bundle))
+            bundle, since_bundle, shard_bundle, bundle_bytes = [], [], [], envelope_bytes
+        bundle_bytes += rule_bytes + (6 if bundle else 0)
+        bundle.append(rule_json)
+        since_bundle.append(since_json)
+        shard_bundle.append(shard_json)
+    if bundle:
+        bodies.append(_envelope(bundle, rules_version, sweep_id, since_bundle, shard_bundle))
+    return bodies
+
+
+def _slices(field: str, values: list, rest: bool = True) -> list:
+    # One filter per value, and one for the findings with any other value when the values do not cover them all
+    slices = [{field: [{"Value": value, "Comparison": "EQUALS"}]} for value in values]
+    if values and rest:
+        slices.append({field: [{"Value": value, "Comparison": "NOT_EQUALS"} for value in values]})
+    return slices or [{}]
+
+
+def shard_rules(rules: list) -> tuple:
+    """Splits every rule into shards by account and region, returns the rules and their shards as parallel lists.
+
+    A rule limited to regions of its own is split by those regions, other rules by SWEEP_SHARD_REGIONS. Every region
+    slice is split by SWEEP_SHARD_ACCOUNT_IDS. Together the shards of a rule cover exactly the findings of the rule.
+    """
+    if not SWEEP_SHARDS_ENABLED:
+        return rules, [None] * len(rules)
+
+    account_slices = _slices("AwsAccountId", SWEEP_SHARD_ACCOUNT_IDS)
+    sharded_rules, shards = [], []
+    for rule in rules:
+        rule_regions = rule["match_on"].get("regions")
+        # The regions of a rule cover all of its findings, so there is no shard for the findings of other regions
+        region_slices = _slices("Region", rule_regions or SWEEP_SHARD_REGIONS, rest=not rule_regions)
+        for region_slice in region_slices:
+            for account_slice in account_slices:
+                sharded_rules.append(rule)
+                shards.append({**account_slice, **region_slice} or None)
+    return sharded_rules, shards
+
+
+def batch_messages(bodies: list) -> list:
+    """Groups message bodies into SendMessageBatch entries, within the entry count and payload size limits."""
+    batches, batch, batch_bytes = [], [], 0
+    for body in bodies:
+        body_bytes = len(body.encode())
+        if batch and (len(batch) == SQS_MAX_BATCH_ENTRIES or batch_bytes + body_bytes > SQS_MAX_PAYLOAD_BYTES):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append({"Id": str(len(batch)), "MessageBody": body})
+        batch_bytes += body_bytes
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def send_batch(sqs, entries: list) -> list:
+    response = sqs.send_message_batch(QueueUrl=SQS_QUEUE_NAME, Entries=entries)
+    failed = response.get("Failed", [])
+    # Failures that are not caused by the request itself, like throttling, are worth a single retry
+    retry_ids = {failure["Id"] for failure in failed if not failure["SenderFault"]}
+    if retry_ids:
+        response = sqs.send_message_batch(
+            QueueUrl=SQS_QUEUE_NAME, Entries=[entry for entry in entries if entry["Id"] in retry_ids]
+        )
+        failed = [failure for failure in failed if failure["Id"] not in retry_ids] + response.get("Failed", [])
+    for failure in failed:
+        LOGGER.error(f"Failed putting message on SQS: {failure['Code']} {failure.get('Message', '')}")
+    return failed
+
+
+def changed_rules(rules: list, shards: list, swept_hashes: set) -> tuple:
+    """The rules and shards whose hash is not in the manifest, those were added or changed since the last deploy."""
+    changed = [(rule, shard) for rule, shard in zip(rules, shards) if rule_hash(rule, shard) not in swept_hashes]
+    return [rule for rule, _ in changed], [shard for _, shard in changed]
+
+
+def removed_rules(rules: list, previous_rules: list) -> list:
+    """The previously deployed rules whose note no longer appears in the rules, rules are identified by their note."""
+    notes = {rule.get("note") for rule in rules}
+    return [rule for rule in previous_rules if rule.get("note") not in notes]
+
+
+def handle_removed_rules(rules: list, manifest: dict):
+    removed = removed_rules(rules, manifest["rules"])
+    if not removed:
+        return
+    LOGGER.warning(
+        f"{len(removed)} rule(s) were removed from the rules object: {', '.join(str(rule.get('note')) for rule in removed)}."
+    )
+    if UNSUPPRESS_REMOVED_RULES and not unsuppress_removed_rules(removed, LOGGER):
+        LOGGER.error("Failed to unsuppress the findings of the removed rule(s).")
+
+
+def deployed_manifest() -> dict:
+    try:
+        return load_rules_manifest()
+    except Exception as e:
+        LOGGER.warning(f"Failed to load the rules manifest, removed rules are not reported and all rules are swept. "
+                       f"Original error: {e}")
+        return {"rules": [], "rule_hashes": []}
+
+
+def is_scheduled_sweep(event: dict) -> bool:
+    return event.get("source") == "aws.events" and event.get("detail-type") == "Scheduled Event"
+
+
+@LOGGER.inject_lambda_context
+@instrument_handler
 def lambda_handler(event, context):
+    log_payload(LOGGER, "Received event.", event)
+    if not is_scheduled_sweep(event):
+        # A deploy of the rules object is validated once here, an invalid one fails the deploy and leaves the
+        # previous compiled rulebook in place for all Lambdas
+        compile_rules_object(LOGGER)
+
+    deployed_rules = deployed_hashes = None
     try:
         sqs = client("sqs")
-        for rule in get_rules(LOGGER):
-                message_body = dumps(rule.data)
-                LOGGER.info(f"Putting rule on SQS. Rule details: {message_body}")
-                sqs.send_message(
-                    QueueUrl=SQS_QUEUE_NAME,
-                    MessageBody=message_body
-                )
+        rules = [rule.data for rule in get_rules(LOGGER)]
+        if not is_scheduled_sweep(event):
+            deployed_rules, manifest = rules, deployed_manifest()
+            handle_removed_rules(deployed_rules, manifest)
+        rules, shards = shard_rules(rules)
+        if is_scheduled_sweep(event):
+            # Scheduled sweeps only fetch the findings updated since the last sweep of a rule, rules that changed or
+            # were not swept within FULL_SWEEP_INTERVAL_SECONDS have no watermark and are swept in full
+            updated_since = sweep_updated_since(rules, LOGGER, shards)
+            LOGGER.info(f"Sweeping {sum(1 for since in updated_since if since)} of {len(rules)} rule(s) incrementally.")
+            bodies = bundle_rules(rules, rules_cache_stats()["etag"], event.get("id"), updated_since, shards)
+        else:
+            deployed_hashes = [rule_hash(rule, shard) for rule, shard in zip(rules, shards)]
+            if SWEEP_CHANGED_RULES_ONLY:
+                # Rules whose hash is in the manifest were put on SQS by an earlier deploy, the others are swept in full
+                swept_rules = len(rules)
+                rules, shards = changed_rules(rules, shards, set(manifest["rule_hashes"]))
+                LOGGER.info(f"Sweeping {len(rules)} added or changed rule(s) of {swept_rules} rule(s).")
+            bodies = bundle_rules(rules, rules_cache_stats()["etag"], shards=shards)
+        # Message bodies hold the full rules, they are only logged at the DEBUG log level
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            for body in bodies:
+                LOGGER.debug("Putting rule(s) on SQS.", extra={"message_body": body})
+        batches = batch_messages(bodies)
+        with timed("EnqueueRules"), ThreadPoolExecutor(max_workers=SQS_SEND_THREADS) as executor:
+            failed = [failure for failures in executor.map(lambda entries: send_batch(sqs, entries), batches)
+                      for failure in failures]
     except Exception as e:
         LOGGER.error(f"Failed putting rule(s) on SQS.")
         LOGGER.error(f"Original error: {e}", exc_info=True)
         raise Exception
+
+    LOGGER.info(
+        f"Put {len(rules)} rule(s) on SQS in {len(bodies)} message(s) using {len(batches)} batch request(s)."
+    )
+    add_count("RulesEnqueued", len(rules))
+    add_count("MessagesFailed", len(failed))
+    publish_securityhub_client_metrics()
+    if failed:
+        raise Exception(f"Failed putting {len(failed)} of {len(bodies)} message(s) on SQS.")
+    if deployed_rules is not None:
+        try:
+            store_rules_manifest(deployed_rules, deployed_hashes)
+        except Exception as e:
+            LOGGER.warning(f"Failed to store the rules manifest, the next deploy compares its rules with an older one. Original error: {e}")
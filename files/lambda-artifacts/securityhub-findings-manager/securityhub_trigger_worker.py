@@ -1,16 +1,102 @@
 from json import loads
 from aws_lambda_powertools import Logger
-from strategize_findings_manager import manager_per_rule
+from idempotency_store import completed_keys, mark_completed, record_watermarks, rule_key
+from observability import add_count, instrument_handler, log_payload, log_payload_on_error
+from securityhub_client import securityhub_client_stats
+from strategize_findings_manager import manager_per_batch, publish_securityhub_client_metrics
 
 LOGGER = Logger()
 
 
-@LOGGER.inject_lambda_context(log_event=True)
+def rules_from_message(body: str) -> tuple:
+    """The rules of the message, the version their idempotency keys are scoped to and every watermark and shard."""
+    message = loads(body)
+    # Messages put on the queue before rules were bundled hold a single rule instead of a {"rules": [...]} envelope
+    if "rules" not in message:
+        return [message], None, [None], [None]
+    rules, rules_version = message["rules"], message.get("rules_version")
+    # Scheduled sweeps apply the same rules version again, each of them is idempotent on its own
+    if rules_version and message.get("sweep_id"):
+        rules_version = f"{rules_version}:{message['sweep_id']}"
+    return (
+        rules, rules_version, message.get("updated_since") or [None] * len(rules),
+        message.get("shards") or [None] * len(rules)
+    )
+
+
+def pending_rules(rules: list, rules_version: str, updated_since: list, shards: list, completed: set) -> list:
+    """The (key, rule, updated_since, shard) of the rules of the message not already applied by an earlier delivery."""
+    keyed_rules = [
+        (rule_key(rule, rules_version, shard), rule, since, shard)
+        for rule, since, shard in zip(rules, updated_since, shards)
+    ]
+    return [keyed_rule for keyed_rule in keyed_rules if keyed_rule[0] is None or keyed_rule[0] not in completed]
+
+
+def apply_records(records: list) -> bool:
+    """Applies the pending rules of the records and remembers them as completed when they all succeeded."""
+    keyed_rules = [keyed_rule for _, keyed_rules, _ in records for keyed_rule in keyed_rules]
+    if not keyed_rules:
+        return True
+    rules = [rule for _, rule, _, _ in keyed_rules]
+    shards = [shard for _, _, _, shard in keyed_rules]
+    # Streaming progress is resumable within the rules version the idempotency keys are scoped to
+    rules_versions = {rules_version for _, _, rules_version in records}
+    checkpoint_scope = rules_versions.pop() if len(rules_versions) == 1 else None
+    # Findings updated while the sweep runs are fetched again by the next incremental sweep
+    swept_at = manager_per_batch(rules, LOGGER, [since for _, _, since, _ in keyed_rules], checkpoint_scope, shards)
+    if swept_at is None:
+        return False
+    mark_completed([key for key, _, _, _ in keyed_rules if key is not None], LOGGER)
+    record_watermarks(rules, swept_at, LOGGER, shards)
+    add_count("RulesApplied", len(rules))
+    return True
+
+
+@LOGGER.inject_lambda_context
+@instrument_handler
 def lambda_handler(event, context):
+    log_payload(LOGGER, "Received event.", event)
+    failed_message_ids, messages = [], []
     for record in event["Records"]:
-        rule = loads(record["body"])
         try:
-            manager_per_rule(rule, LOGGER)
+            messages.append((record["messageId"], *rules_from_message(record["body"])))
         except Exception as e:
-            LOGGER.error(f"Failed to process rule. Rule details; {rule}")
+            LOGGER.error(f"Failed to read rule(s) from message. Message body; {record['body']}")
             LOGGER.error(f"Original error: {e}", exc_info=True)
+            # Reported as failed, so after maxReceiveCount deliveries the message ends up on the DLQ
+            failed_message_ids.append(record["messageId"])
+
+    keys = [
+        rule_key(rule, rules_version, shard)
+        for _, rules, rules_version, _, shards in messages for rule, shard in zip(rules, shards)
+    ]
+    completed = completed_keys([key for key in keys if key is not None], LOGGER)
+    records = [
+        (message_id, pending_rules(rules, rules_version, updated_since, shards, completed), rules_version)
+        for message_id, rules, rules_version, updated_since, shards in messages
+    ]
+    skipped = len(keys) - sum(len(keyed_rules) for _, keyed_rules, _ in records)
+    if skipped:
+        LOGGER.info(f"Skipping {skipped} rule(s) already applied by an earlier delivery.")
+        add_count("RulesSkipped", skipped)
+
+    # All rules of the batch are applied by a single findings manager, so rules sharing a query share the
+    # GetFindings calls and the resulting suppressions are sent in as few BatchUpdateFindings calls as possible
+    if not apply_records(records):
+        if len(records) == 1:
+            failed_message_ids.append(records[0][0])
+        else:
+            # Retry message by message, so only the messages that fail on their own are returned to the queue
+            LOGGER.warning(f"Applying the batch failed, retrying its {len(records)} message(s) one by one.")
+            failed_message_ids.extend(record[0] for record in records if not apply_records([record]))
+
+    LOGGER.info(f"Security Hub client stats: {securityhub_client_stats()}.")
+    publish_securityhub_client_metrics()
+    add_count("MessagesFailed", len(failed_message_ids))
+    if failed_message_ids:
+        LOGGER.error(f"Failed to apply the rule(s) of {len(failed_message_ids)} message(s), returning them to the queue.")
+        log_payload_on_error(LOGGER, "Failed messages.", [
+            record["body"] for record in event["Records"] if record["messageId"] in failed_message_ids
+        ])
+    return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in failed_message_ids]}
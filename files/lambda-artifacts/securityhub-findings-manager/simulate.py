@@ -0,0 +1,301 @@
+"""Replays exported Security Hub findings through a rulebook offline, without making any AWS call.
+
+Reports how many findings every rule would suppress, which rules overlap, the high severity findings that no rule
+matches and a lower bound of the Security Hub API time a sweep of the rules takes. The export is streamed, so exports
+of any size are read in constant memory, and the findings are matched by a pool of processes.
+
+Supported exports, optionally gzip compressed (.gz):
+    - JSON Lines, every line a finding or a GetFindings response holding findings under "Findings"
+    - a JSON array of findings, or a JSON document holding them under "Findings", like the output of GetFindings
+
+Usage:
+    python simulate.py rules.yaml findings.jsonl [--processes 4] [--chunk-size 1000] [--json report.json]
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from json import JSONDecodeError, JSONDecoder, loads
+from math import ceil
+from typing import Iterator, Union
+from awsfindingsmanagerlib import Finding
+from rule_index import RuleIndex
+from rulebook import FORMAT_VERSION, RulebookError, compile_rulebook
+from securityhub_client import API_RATES
+from securityhub_events import MANAGED_WORKFLOW_STATUSES
+from strategize_findings_manager import compiled_rule
+
+# Characters read from the export at a time when streaming a JSON document
+READ_CHUNK_SIZE = 1024 * 1024
+# Findings returned by a GetFindings page and updated by a BatchUpdateFindings call at most
+SECURITYHUB_PAGE_SIZE = 100
+# Unmatched findings listed in the report as examples
+MAX_UNMATCHED_SAMPLES = 20
+
+# State of a worker process, the rule index is built once per process
+_RULE_INDEX = None
+_SEVERITIES = ()
+
+
+def load_rules(rules_file: str) -> list:
+    """The rules of a compiled rulebook or of a rules.yaml file, raises RulebookError when they are invalid."""
+    with open(rules_file, "rb") as file:
+        contents = file.read()
+    try:
+        rulebook = loads(contents)
+    except ValueError:
+        rulebook = None
+    # A rules file written as JSON is valid YAML too, only the compiled rulebook has a format version
+    if not isinstance(rulebook, dict) or "format_version" not in rulebook:
+        return compile_rulebook(contents)["rules"]
+    if rulebook["format_version"] != FORMAT_VERSION:
+        raise RulebookError(f"Unsupported compiled rulebook format {rulebook['format_version']}, expected {FORMAT_VERSION}.")
+    return rulebook["rules"]
+
+
+def _open_export(path: str):
+    return gzip.open(path, "rt", encoding="utf-8") if path.endswith(".gz") else open(path, encoding="utf-8")
+
+
+def _is_json_object(text: str) -> bool:
+    try:
+        return isinstance(loads(text), dict)
+    except JSONDecodeError:
+        return False
+
+
+def _stream_array(file, buffer: str) -> Iterator[dict]:
+    """Decodes the findings of the first array of a JSON document one at a time, the array of "Findings" in objects."""
+    decoder = JSONDecoder()
+    while True:
+        marker = buffer.find('"Findings"') if buffer.lstrip().startswith("{") else 0
+        position = buffer.find("[", marker) if marker >= 0 else -1
+        if position >= 0:
+            break
+        chunk = file.read(READ_CHUNK_SIZE)
+        if not chunk:
+            raise ValueError("The export holds no array of findings.")
+        buffer += chunk
+
+    position += 1
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        try:
+            finding, position = decoder.raw_decode(buffer, position)
+        except JSONDecodeError:
+            # The finding continues in the next chunk, only the unread part of the buffer is kept
+            chunk = file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                raise ValueError("The export ends in the middle of a finding.")
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield finding
+
+
+def read_export(path: str) -> Iterator[Union[str, dict]]:
+    """The findings of the export, as undecoded lines of a JSON Lines export or as decoded findings otherwise."""
+    with _open_export(path) as file:
+        buffer = file.read(READ_CHUNK_SIZE)
+        newline = buffer.find("\n")
+        first_line = buffer[:newline] if newline >= 0 else buffer
+        # A finding is at most 240 KB, so the first line of a JSON Lines export always fits in the first chunk
+        if (newline >= 0 or len(buffer) < READ_CHUNK_SIZE) and _is_json_object(first_line):
+            file.seek(0)
+            yield from (line for line in file if line.strip())
+        else:
+            yield from _stream_array(file, buffer)
+
+
+def _chunks(items: Iterator, size: int) -> Iterator[list]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _init_process(rules: list, severities: tuple):
+    global _RULE_INDEX, _SEVERITIES
+    _RULE_INDEX = RuleIndex([compiled_rule(data) for data in rules])
+    _SEVERITIES = severities
+
+
+def _findings(items: list) -> Iterator[dict]:
+    for item in items:
+        try:
+            data = loads(item) if isinstance(item, str) else item
+        except JSONDecodeError:
+            # Counted as an invalid finding instead of failing the whole chunk
+            yield None
+            continue
+        # Lines of a JSON Lines export can hold a whole GetFindings response
+        if isinstance(data, dict) and isinstance(data.get("Findings"), list):
+            yield from data["Findings"]
+        else:
+            yield data
+
+
+def _new_report() -> dict:
+    return {
+        "findings": 0,
+        "invalid": 0,
+        "unmanaged": 0,
+        "suppressed": Counter(),
+        "matching": Counter(),
+        "overlaps": Counter(),
+        "unmatched": Counter(),
+        "unmatched_samples": [],
+    }
+
+
+def simulate_chunk(items: list) -> dict:
+    """Matches a chunk of findings against the rule index of the process, returns the counts of the chunk."""
+    report = _new_report()
+    for data in _findings(items):
+        report["findings"] += 1
+        if not isinstance(data, dict):
+            report["invalid"] += 1
+            continue
+        try:
+            if data.get("Workflow", {}).get("Status") not in MANAGED_WORKFLOW_STATUSES:
+                report["unmanaged"] += 1
+                continue
+            finding = Finding(data)
+            notes = [rule.note for rule in _RULE_INDEX.matching_rules(finding)]
+        except Exception:
+            report["invalid"] += 1
+            continue
+
+        if notes:
+            # The first matching rule suppresses the finding, the other matching rules are overlapped by it
+            report["suppressed"][notes[0]] += 1
+            report["matching"].update(notes)
+            report["overlaps"].update((notes[0], note) for note in notes[1:])
+            continue
+        severity = data.get("Severity", {}).get("Label")
+        if severity in _SEVERITIES:
+            report["unmatched"][severity] += 1
+            if len(report["unmatched_samples"]) < MAX_UNMATCHED_SAMPLES:
+                report["unmatched_samples"].append({
+                    "id": data.get("Id"),
+                    "severity": severity,
+                    "title": data.get("Title"),
+                    "control": data.get("Compliance", {}).get("SecurityControlId"),
+                })
+    return report
+
+
+def _merge(report: dict, chunk_report: dict):
+    for key, value in chunk_report.items():
+        if key == "unmatched_samples":
+            report[key].extend(value[:MAX_UNMATCHED_SAMPLES - len(report[key])])
+        elif isinstance(value, Counter):
+            report[key].update(value)
+        else:
+            report[key] += value
+
+
+def simulate(rules: list, export: str, processes: int, chunk_size: int, severities: tuple) -> dict:
+    """Streams the export through the rules, with at most two chunks per process in flight to bound the memory."""
+    report = _new_report()
+    started = time.perf_counter()
+    chunks = _chunks(read_export(export), chunk_size)
+    if processes <= 1:
+        _init_process(rules, severities)
+        for chunk in chunks:
+            _merge(report, simulate_chunk(chunk))
+    else:
+        with ProcessPoolExecutor(processes, initializer=_init_process, initargs=(rules, severities)) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(simulate_chunk, chunk))
+                if len(pending) >= processes * 2:
+                    _merge(report, pending.popleft().result())
+            while pending:
+                _merge(report, pending.popleft().result())
+    report["seconds"] = time.perf_counter() - started
+    report["findings_per_second"] = report["findings"] / report["seconds"] if report["seconds"] else 0.0
+
+    # Every rule is swept with at least one GetFindings page, its query also returns findings its resource id
+    # patterns reject, so this is a lower bound
+    pages = sum(max(ceil(report["matching"][rule["note"]] / SECURITYHUB_PAGE_SIZE), 1) for rule in rules)
+    batches = sum(ceil(count / SECURITYHUB_PAGE_SIZE) for count in report["suppressed"].values())
+    report["sweep"] = {
+        "get_findings_pages": pages,
+        "batch_update_findings_calls": batches,
+        "seconds": pages / API_RATES["GetFindings"][0] + batches / API_RATES["BatchUpdateFindings"][0],
+    }
+    return report
+
+
+def print_report(rules: list, report: dict):
+    print(f"Replayed {report['findings']} finding(s) in {report['seconds']:.1f} s "
+          f"({report['findings_per_second']:.0f} findings/s): {report['findings'] - report['unmanaged'] - report['invalid']} "
+          f"with workflow status {' or '.join(MANAGED_WORKFLOW_STATUSES)}, {report['unmanaged']} in other workflow "
+          f"states, {report['invalid']} invalid.")
+
+    print(f"\nFindings suppressed per rule ({sum(report['suppressed'].values())} in total):")
+    for rule in sorted(rules, key=lambda rule: -report["suppressed"][rule["note"]]):
+        shadowed = report["matching"][rule["note"]] - report["suppressed"][rule["note"]]
+        print(f"{report['suppressed'][rule['note']]:>10}  {rule['note']}"
+              + (f" (another {shadowed} matched by an earlier rule)" if shadowed else ""))
+
+    if report["overlaps"]:
+        print("\nOverlapping rules, findings matching both are suppressed by the first:")
+        for (first, second), count in report["overlaps"].most_common():
+            print(f"{count:>10}  {first} -> {second}")
+
+    print(f"\nUnmatched findings by severity: "
+          f"{', '.join(f'{severity} {count}' for severity, count in report['unmatched'].most_common()) or 'none'}.")
+    for sample in report["unmatched_samples"]:
+        print(f"{sample['severity']:>10}  {sample['control'] or '-'}  {sample['title']}  {sample['id']}")
+
+    sweep = report["sweep"]
+    print(f"\nA sweep of all rules takes at least {sweep['get_findings_pages']} GetFindings page(s) and "
+          f"{sweep['batch_update_findings_calls']} BatchUpdateFindings call(s), {sweep['seconds']:.0f} s at the "
+          f"Security Hub rate limits.")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("rules_file", help="rules.yaml or its compiled rulebook")
+    parser.add_argument("export", help="the exported findings")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=1000, help="findings matched per task of a process")
+    parser.add_argument("--severities", type=lambda value: tuple(value.split(",")), default=("CRITICAL", "HIGH"),
+                        help="severity labels of the unmatched findings to report")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    try:
+        rules = load_rules(args.rules_file)
+    except RulebookError as e:
+        print(f"{args.rules_file}: {e}", file=sys.stderr)
+        return 1
+    try:
+        report = simulate(rules, args.export, args.processes, args.chunk_size, args.severities)
+    except (OSError, ValueError) as e:
+        print(f"{args.export}: {e}", file=sys.stderr)
+        return 1
+
+    print_report(rules, report)
+    if args.json:
+        report["overlaps"] = [{"rule": first, "overlapped_rule": second, "findings": count}
+                              for (first, second), count in report["overlaps"].items()]
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
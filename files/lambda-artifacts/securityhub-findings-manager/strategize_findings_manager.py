@@ -1,36 +1,468 @@
+from datetime import datetime, timezone
+from json import dumps, loads
 from os import environ
+from time import monotonic
+from typing import Optional
+from boto3 import client
+from botocore.exceptions import ClientError
 from aws_lambda_powertools import Logger
-from awsfindingsmanagerlib import S3, FindingsManager, NoteTextConfig
+from aws_lambda_powertools.metrics import MetricUnit
+from awsfindingsmanagerlib import S3, Finding, FindingsManager, NoteTextConfig, Rule
+from awsfindingsmanagerlib.awsfindingsmanagerlib import PAGINATION_PAGESIZE
+from idempotency_store import checkpoint_key, clear_checkpoint, load_checkpoint, save_checkpoint
+from rule_index import RuleIndex
+from rulebook import FORMAT_VERSION, RulebookError, compile_rulebook, dump_rulebook
+from observability import add_count, add_metric, log_payload, timed
+from securityhub_client import get_client, securityhub_client_stats
 
 S3_BUCKET_NAME = environ.get("S3_BUCKET_NAME")
 S3_OBJECT_NAME = environ.get("S3_OBJECT_NAME")
+# Objects written by the trigger Lambda next to the rules object, outside the filter of its S3 notification:
+# the rules as compiled by rulebook.py, loaded instead of the rules object they were compiled from, and the rules
+# of the last deploy
+S3_COMPILED_OBJECT_NAME = f"{S3_OBJECT_NAME}.compiled.json"
+S3_MANIFEST_OBJECT_NAME = f"{S3_OBJECT_NAME}.manifest.json"
+# Whether the worker suppresses findings page by page while paging through them, instead of after fetching them all
+STREAM_FINDINGS = environ.get("STREAM_FINDINGS", "true").lower() == "true"
+# Passes over a query in streaming mode, further passes pick up the findings that moved to pages already passed
+MAX_STREAMING_PASSES = 5
+# Seconds a cached rules version is trusted without revalidating it against S3, 0 revalidates on every invocation
+RULES_CACHE_TTL_SECONDS = float(environ.get("RULES_CACHE_TTL_SECONDS", "0"))
+
+# Module level state survives across warm invocations of the same Lambda container
+_RULES_CACHE = {
+    "etag": None,
+    "findings_manager": None,
+    "validated_at": 0.0,
+    "hits": 0,
+    "misses": 0,
+}
+_S3_CLIENT = None
+_PUBLISHED_CLIENT_STATS = {}
+# Cumulative Security Hub client stats published as metrics, per invocation
+CLIENT_STATS_METRICS = {
+    "calls": ("SecurityHubCalls", MetricUnit.Count),
+    "retries": ("SecurityHubRetries", MetricUnit.Count),
+    "throttles": ("SecurityHubThrottles", MetricUnit.Count),
+    "rate_limited_seconds": ("SecurityHubRateLimitedTime", MetricUnit.Seconds),
+}
+
+
+class LambdaFindingsManager(FindingsManager):
+    """FindingsManager that matches incoming findings through a rule index built once per rules version.
+
+    A shard holds Security Hub filters added to the query of every rule, limiting a sweep to a slice of the findings.
+    """
+
+    def __init__(self, *args, shard: dict = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.shard = shard
+        # Start of the sweep, the end of its UpdatedAt window and the watermark recorded when it succeeds
+        self.swept_at = datetime.now(timezone.utc)
+        self._rule_positions = {}
+        self._rule_updated_since = {}
+        self._rule_index = None
+
+    def register_rules(self, rules: list, updated_since: list = None, validated: bool = False):
+        """Registers the rules, get_findings only fetches the findings updated since the given time of a rule.
+
+        Rules from a compiled rulebook are marked validated and registered without validating them again.
+        """
+        if validated:
+            self._rules.update(compiled_rule(data) for data in rules)
+            success = True
+        else:
+            success = super().register_rules(rules)
+        for data, since in zip(rules, updated_since or [None] * len(rules)):
+            note = data.get("note")
+            self._rule_positions.setdefault(note, len(self._rule_positions))
+            # Registered rules are identified by their note, a note registered twice is swept from the earliest time
+            if since is None or self._rule_updated_since.get(note, since) is None:
+                self._rule_updated_since[note] = None
+            else:
+                self._rule_updated_since[note] = min(since, self._rule_updated_since.get(note, since))
+        self._rule_index = None
+        return success
+
+    @property
+    def ordered_rules(self) -> list:
+        # Registered rules are kept in a set, order them as registered so the first match is deterministic
+        return sorted(self.rules, key=lambda rule: self._rule_positions[rule.note])
+
+    @property
+    def rule_index(self) -> RuleIndex:
+        if self._rule_index is None:
+            self._rule_index = RuleIndex(self.ordered_rules)
+        return self._rule_index
+
+    @staticmethod
+    def _get_security_hub_client(region: str):
+        # Shared, rate limited client instead of a new client for every query and batch update
+        return get_client(region)
+
+    def _get_security_hub_paginator_iterator(self, region: str, operation_name: str, query_filter: dict):
+        pages = iter(super()._get_security_hub_paginator_iterator(region, operation_name, query_filter))
+        while True:
+            with timed("GetFindings"):
+                page = next(pages, None)
+            if page is None:
+                return
+            yield page
+
+    def _batch_update_findings(self, security_hub, payload):
+        with timed("BatchUpdateFindings"):
+            return super()._batch_update_findings(security_hub, payload)
+
+    def _get_aggregating_region(self):
+        # Looked up once per manager instead of once per query
+        if not hasattr(self, "_aggregating_region"):
+            self._aggregating_region = super()._get_aggregating_region()
+        return self._aggregating_region
+
+    def _queries(self) -> list:
+        """The (query, [(position, rule)]) of the registered rules, rules sharing a query grouped under it.
+
+        Rules that only differ in their resource id patterns or note share their query, as long as they are swept from
+        the same watermark.
+        """
+        now = _format_timestamp(self.swept_at)
+        queries = {}
+        for position, rule in enumerate(self.ordered_rules):
+            query = self.default_query_filter
+            query.update(rule.query_filter)
+            query.update(self.shard or {})
+            if self._rule_updated_since.get(rule.note):
+                query["UpdatedAt"] = [{"Start": self._rule_updated_since[rule.note], "End": now}]
+            queries.setdefault(dumps(query, sort_keys=True), (query, []))[1].append((position, rule))
+        return list(queries.values())
+
+    def get_findings(self) -> list:
+        """Retrieves the findings of all registered rules, querying Security Hub once for rules sharing a query.
+
+        Every finding is assigned the first registered rule it matches, so the suppressions can be batched per rule
+        afterwards.
+        """
+        rules = self.ordered_rules
+        queries = self._queries()
+        matches = {}
+        for query, query_rules in queries:
+            for finding in self._get_findings(query):
+                matched_position = matches.get(finding.id, (len(rules),))[0]
+                for position, rule in query_rules:
+                    if position >= matched_position:
+                        break
+                    if not rule.resource_id_regexps or finding.is_matching_resource_ids(rule.resource_id_regexps):
+                        finding.matched_rule = rule
+                        matches[finding.id] = (position, finding)
+                        break
+        self._logger.debug(f"Retrieved findings for {len(rules)} rule(s) with {len(queries)} queries.")
+        return [finding for _, finding in matches.values()]
+
+    def _get_finding_pages(self, query: dict, checkpoint: dict = None):
+        """Yields the findings of the query a page at a time, each with the position to resume from after that page.
+
+        A position is the region and the NextToken of its next page, a None token when the region is done.
+        """
+        aggregating_region = self._get_aggregating_region()
+        regions = [aggregating_region] if aggregating_region else self.regions
+        if checkpoint and checkpoint["region"] in regions:
+            done = checkpoint["token"] is None
+            regions = regions[regions.index(checkpoint["region"]) + done:]
+        for region in regions:
+            kwargs = {"Filters": query, "MaxResults": PAGINATION_PAGESIZE}
+            if checkpoint and checkpoint["region"] == region:
+                kwargs["NextToken"] = checkpoint["token"]
+            security_hub = self._get_security_hub_client(region)
+            while True:
+                try:
+                    with timed("GetFindings"):
+                        page = security_hub.get_findings(**kwargs)
+                except ClientError as e:
+                    if e.response["Error"]["Code"] in ("AccessDeniedException", "InvalidAccessException"):
+                        self._logger.debug(f"No access for Security Hub for region {region}.")
+                        break
+                    raise
+                yield [Finding(data) for data in page["Findings"]], {"region": region, "token": page.get("NextToken")}
+                if not page.get("NextToken"):
+                    break
+                kwargs["NextToken"] = page["NextToken"]
+
+    def stream_suppress_matching_findings(self, checkpoint_scope: str = None) -> tuple:
+        """Suppresses the findings of all registered rules page by page, returns the success and suppressed count.
+
+        The suppressions of a page are sent before the next page is fetched, so memory use does not grow with the
+        number of matching findings. Suppressed findings drop out of the query while it is paged, so the query is
+        paged again as long as the previous pass suppressed findings, which picks up the findings that moved to pages
+        already passed. Where a finding matches rules of different queries, the first query to page it applies its rule.
+
+        With a checkpoint scope the position in the query is saved after every page, so a redelivery of rules that ran
+        into the Lambda timeout resumes where they stopped instead of starting over.
+        """
+        success, suppressed = True, 0
+        security_hub = self._get_security_hub_client(self.aws_region)
+        for query, query_rules in self._queries():
+            key = checkpoint_key(checkpoint_scope, [self.shard] + [rule.data for _, rule in query_rules])
+            checkpoint = load_checkpoint(key, self._logger)
+            if checkpoint:
+                # Resumed with the query of the earlier delivery, whose pages the NextToken belongs to
+                query = checkpoint["query"]
+                self.swept_at = min(self.swept_at, _parse_timestamp(checkpoint["swept_at"]))
+                self._logger.info(f"Resuming {len(query_rules)} rule(s) from page token {checkpoint['token']}.")
+            for _ in range(MAX_STREAMING_PASSES):
+                pass_suppressed = 0
+                for findings, position in self._get_finding_pages(query, checkpoint):
+                    matched = []
+                    for finding in findings:
+                        for _, rule in query_rules:
+                            if not rule.resource_id_regexps or finding.is_matching_resource_ids(rule.resource_id_regexps):
+                                finding.matched_rule = rule
+                                matched.append(finding)
+                                break
+                    payloads = self._get_suppressing_payload(matched)
+                    for payload_success, payload in self._batch_apply_payloads(security_hub, payloads, "suppression"):
+                        success = success and payload_success
+                        if payload_success:
+                            pass_suppressed += len(payload["FindingIdentifiers"])
+                            record_suppressions([payload])
+                            self._logger.info(
+                                f"{len(payload['FindingIdentifiers'])} finding(s) {payload['Workflow']['Status']} "
+                                f"with note: {payload['Note']['Text']}."
+                            )
+                    save_checkpoint(key, {"query": query, "swept_at": _format_timestamp(self.swept_at), **position},
+                                    self._logger)
+                suppressed += pass_suppressed
+                checkpoint = None
+                if not pass_suppressed:
+                    break
+            else:
+                self._logger.warning(
+                    f"Stopped paging a query after {MAX_STREAMING_PASSES} passes that all suppressed findings, "
+                    "the next sweep picks up the findings that are left."
+                )
+            clear_checkpoint(key, self._logger)
+        return success, suppressed
+
+    def get_suppressed_findings(self) -> list:
+        """Retrieves the suppressed findings of all registered rules, recognised by the rule's note on the finding."""
+        findings = {}
+        for rule in self.ordered_rules:
+            query = self.default_query_filter
+            query.update(rule.query_filter)
+            query["WorkflowStatus"] = [{"Value": "SUPPRESSED", "Comparison": "EQUALS"}]
+            for finding in self._get_findings(query):
+                if rule.resource_id_regexps and not finding.is_matching_resource_ids(rule.resource_id_regexps):
+                    continue
+                if _suppression_note(finding.note_text) == rule.note:
+                    findings[finding.id] = finding
+        return list(findings.values())
+
+    def unsuppress_findings(self, findings: list):
+        return self._workflow_state_change_on_findings(findings, suppress=False)
+
+    def validate_finding_on_matching_rules(self, finding_data: dict):
+        finding = Finding(finding_data)
+        rule = self.rule_index.match(finding)
+        if rule is None:
+            return None
+        finding.matched_rule = rule
+        return finding
+
+
+def compiled_rule(data: dict) -> Rule:
+    """A Rule of a compiled rulebook, its data was validated by rulebook.py and is not validated again.
+
+    The constructor of Rule validates its data, which takes most of the time of loading a large rulebook. The Rule is
+    built the way the constructor of the pinned awsfindingsmanagerlib version builds it, the tests check the result
+    behaves like Rule(**data), so upgrading the library fails them when it changes.
+    """
+    rule = Rule.__new__(Rule)
+    rule._data = data
+    return rule
+
+
+def _format_timestamp(timestamp: datetime) -> str:
+    # The format Security Hub uses for its date filters
+    return timestamp.astimezone(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def _parse_timestamp(timestamp: str) -> datetime:
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+
+
+def _suppression_note(note_text: str) -> Optional[str]:
+    # With NoteTextConfig(format="json") the suppression note is one key of a JSON note, otherwise the whole note
+    try:
+        return loads(note_text).get(NoteTextConfig.DEFAULT_KEY)
+    except (TypeError, ValueError, AttributeError):
+        return note_text
+
+
+class _S3Contents(S3):
+    """S3 rules backend for an object body that has already been downloaded."""
+
+    def __init__(self, file_contents: bytes):
+        self._file_contents = file_contents
+
+
+def _get_s3_client():
+    global _S3_CLIENT
+    if _S3_CLIENT is None:
+        _S3_CLIENT = client("s3")
+    return _S3_CLIENT
+
+
+def _get_rules_object(cached_version: str, logger: Logger) -> Optional[tuple]:
+    """The version and contents of the rules, None when the cached version is still current.
+
+    The version is the ETag of the rules object. Its compiled rulebook is loaded instead of the rules object, as long as
+    it was compiled from that version: until the trigger Lambda compiled a newly uploaded rules object, or when it
+    rejected it, the rules object itself is loaded and validated by the findings manager.
+    """
+    s3 = _get_s3_client()
+    version = s3.head_object(Bucket=S3_BUCKET_NAME, Key=S3_OBJECT_NAME)["ETag"]
+    if version == cached_version:
+        return None
+    try:
+        contents = s3.get_object(Bucket=S3_BUCKET_NAME, Key=S3_COMPILED_OBJECT_NAME)["Body"].read()
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            raise
+    else:
+        if _compiled_source_version(contents) == version:
+            return version, contents
+        logger.warning(f"The compiled rulebook was not compiled from rules version {version}, loading the rules object.")
+    response = s3.get_object(Bucket=S3_BUCKET_NAME, Key=S3_OBJECT_NAME)
+    return response["ETag"], response["Body"].read()
+
+
+def _compiled_source_version(contents: bytes) -> Optional[str]:
+    try:
+        return loads(contents).get("source_version")
+    except (ValueError, AttributeError):
+        return None
+
+
+def _register_rules_object(findings_manager: LambdaFindingsManager, contents: bytes, logger: Logger):
+    try:
+        rulebook = loads(contents)
+    except ValueError:
+        rulebook = None
+    # A rules object written as JSON is valid YAML too, only the compiled rulebook has a format version
+    if not isinstance(rulebook, dict) or "format_version" not in rulebook:
+        rules = _S3Contents(contents).get_rules()
+        log_payload(logger, f"Loaded {len(rules)} rule(s) from the rules object.", rules)
+        findings_manager.register_rules(rules)
+        return
+    if rulebook["format_version"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported compiled rulebook format {rulebook.get('format_version')}, expected {FORMAT_VERSION}.")
+    logger.info(f"Loaded {len(rulebook['rules'])} compiled rule(s) with content hash {rulebook['content_hash']}.")
+    findings_manager.register_rules(rulebook["rules"], validated=True)
+
+
+def compile_rules_object(logger: Logger) -> dict:
+    """Compiles the rules object into the rulebook the Lambdas load, raises RulebookError when it is invalid.
+
+    The rulebook records the version of the rules object it was compiled from. An invalid rules object leaves the
+    previous rulebook in place, which no longer matches the rules object, so the Lambdas load the rules object itself
+    and the findings manager skips its invalid rules.
+    """
+    response = _get_s3_client().get_object(Bucket=S3_BUCKET_NAME, Key=S3_OBJECT_NAME)
+    try:
+        with timed("CompileRules"):
+            rulebook = compile_rulebook(response["Body"].read(), response["ETag"])
+    except RulebookError as e:
+        logger.error(f"Rejected the rules object {S3_OBJECT_NAME} (version {response['ETag']}): {e}")
+        raise
+    _get_s3_client().put_object(
+        Bucket=S3_BUCKET_NAME, Key=S3_COMPILED_OBJECT_NAME, Body=dump_rulebook(rulebook),
+        ContentType="application/json"
+    )
+    logger.info(f"Compiled {len(rulebook['rules'])} rule(s) with content hash {rulebook['content_hash']}.")
+    return rulebook
+
+
+def _rules_cache_hit(logger: Logger) -> FindingsManager:
+    _RULES_CACHE["hits"] += 1
+    add_count("RulesCacheHit")
+    logger.debug(
+        f"Rules cache hit for version {_RULES_CACHE['etag']} "
+        f"(hits: {_RULES_CACHE['hits']}, misses: {_RULES_CACHE['misses']})."
+    )
+    return _RULES_CACHE["findings_manager"]
 
 
 def _initialize_findings_manager(logger: Logger) -> FindingsManager:
-    s3_backend = S3(S3_BUCKET_NAME, S3_OBJECT_NAME)
-    rules = s3_backend.get_rules()
-    logger.info(rules)
+    cached_findings_manager = _RULES_CACHE["findings_manager"]
+    if cached_findings_manager and monotonic() - _RULES_CACHE["validated_at"] < RULES_CACHE_TTL_SECONDS:
+        return _rules_cache_hit(logger)
+
+    # Only the ETag of the rules object is fetched while the cached version is still current
+    rules_object = _get_rules_object(_RULES_CACHE["etag"] if cached_findings_manager else None, logger)
+    if rules_object is None:
+        _RULES_CACHE["validated_at"] = monotonic()
+        return _rules_cache_hit(logger)
+    version, contents = rules_object
+
     # Note: NoteTextConfig(format="json") enables awsfindingsmanagerlib 1.4.0+ to merge suppression notes
     # with existing Jira ticket metadata, preserving jiraIssue and jiraInstance fields for autoclose functionality
-    findings_manager = FindingsManager(note_text=NoteTextConfig(format="json"))
-    findings_manager.register_rules(rules)
+    with timed("LoadRules"):
+        findings_manager = LambdaFindingsManager(note_text=NoteTextConfig(format="json"))
+        _register_rules_object(findings_manager, contents, logger)
+
+    _RULES_CACHE.update(etag=version, findings_manager=findings_manager, validated_at=monotonic())
+    _RULES_CACHE["misses"] += 1
+    add_count("RulesCacheMiss")
+    logger.info(
+        f"Rules cache miss, loaded rules version {_RULES_CACHE['etag']} "
+        f"(hits: {_RULES_CACHE['hits']}, misses: {_RULES_CACHE['misses']})."
+    )
     return findings_manager
 
 
-def manage(func, args, logger: Logger):
+def rules_cache_stats() -> dict:
+    return {key: _RULES_CACHE[key] for key in ("etag", "hits", "misses")}
+
+
+def publish_securityhub_client_metrics():
+    """Adds the Security Hub calls, retries, throttles and rate limiting of this invocation to its metrics."""
+    stats = securityhub_client_stats()
+    for stat, (name, unit) in CLIENT_STATS_METRICS.items():
+        # The client stats add up over all invocations of the container
+        add_metric(name, unit, stats[stat] - _PUBLISHED_CLIENT_STATS.get(stat, 0))
+    _PUBLISHED_CLIENT_STATS.update(stats)
+
+
+def record_suppressions(suppressed_payload: list):
+    """Adds the number of suppressed findings to the metrics.
+
+    The count is not split per rule: a dimension holding the free text note of a rule would add a custom metric for
+    every rule, the suppressions per rule are logged instead.
+    """
+    add_count("FindingsSuppressed", sum(len(chunk["FindingIdentifiers"]) for chunk in suppressed_payload))
+
+
+def load_findings_manager(logger: Logger) -> Optional[FindingsManager]:
+    """The findings manager of the current rules version, None when it failed to initialize."""
     try:
-        findings_manager = _initialize_findings_manager(logger)
+        return _initialize_findings_manager(logger)
     except Exception as e:
         logger.error("Findings manager failed to initialize, please investigate.")
         logger.error(f"Original error: {e}", exc_info=True)
-        return {"finding_state": "skipped"}
+        return None
+
+
+def manage(func, args, logger: Logger, findings_manager: FindingsManager = None):
+    if findings_manager is None:
+        findings_manager = load_findings_manager(logger)
+        if findings_manager is None:
+            return finding_state("failed")
 
     try:
         success, suppressed_payload = getattr(findings_manager, func.__name__)(*args)
     except Exception as e:
         logger.error("Findings manager failed to apply findings management rules, please investigate.")
         logger.error(f"Original error: {e}", exc_info=True)
-        return {"finding_state": "skipped"}
+        return finding_state("failed")
 
     if success:
         logger.info("Successfully applied all findings management rules.")
@@ -39,50 +471,137 @@ def manage(func, args, logger: Logger):
         logger.error(
             "No explicit error was raised, but not all findings management rules were applied successfully, please investigate."
         )
-        return {"finding_state": "skipped"}
+        return finding_state("failed")
 
 
-def manager_per_rule(rule: list, logger: Logger):
+def _apply_rules(rules: list, logger: Logger, updated_since: list, checkpoint_scope: str,
+                 shard: dict = None) -> Optional[datetime]:
     try:
-        logger.info(f"Processing rule: {rule}")
         # Note: NoteTextConfig(format="json") enables awsfindingsmanagerlib 1.4.0+ to merge suppression notes
         # with existing Jira ticket metadata, preserving jiraIssue and jiraInstance fields for autoclose functionality
-        findings_manager_per_rule = FindingsManager(note_text=NoteTextConfig(format="json"))
-        findings_manager_per_rule.register_rules([rule])
-        success, suppressed_payload = findings_manager_per_rule.suppress_matching_findings()
+        findings_manager_per_batch = LambdaFindingsManager(note_text=NoteTextConfig(format="json"), shard=shard)
+        findings_manager_per_batch.register_rules(rules, updated_since)
+        with timed("ApplyRules"):
+            if STREAM_FINDINGS:
+                success, suppressed = findings_manager_per_batch.stream_suppress_matching_findings(checkpoint_scope)
+            else:
+                success, suppressed_payload = findings_manager_per_batch.suppress_matching_findings()
     except Exception as e:
         logger.error("Findings manager failed to apply findings management rules, please investigate.")
         logger.error(f"Original error: {e}", exc_info=True)
-        return {"finding_state": "skipped"}
+        return None
 
-    if success:
-        logger.info("Successfully applied all findings management rules.")
-        return suppression_logging(logger, suppressed_payload)
-    else:
+    if not success:
         logger.error(
             "No explicit error was raised, but not all findings management rules were applied successfully, please investigate."
         )
-        return {"finding_state": "skipped"}
+        return None
+    logger.info("Successfully applied all findings management rules.")
+    if STREAM_FINDINGS:
+        logger.info(f"{suppressed} finding(s) suppressed while streaming.")
+    else:
+        suppression_logging(logger, suppressed_payload)
+    return findings_manager_per_batch.swept_at
 
 
-def get_rules(logger: Logger):
+def manager_per_batch(rules: list, logger: Logger, updated_since: list = None, checkpoint_scope: str = None,
+                      shards: list = None) -> Optional[datetime]:
+    """Applies the rules with a findings manager per shard, returns the start of the sweep when all of them succeeded.
+
+    A rule with an updated_since timestamp only considers the findings updated since then. In streaming mode the
+    progress is checkpointed under the checkpoint scope, and the start of the sweep is that of the delivery it resumed.
+    """
+    updated_since = updated_since or [None] * len(rules)
+    logger.info(f"Processing {len(rules)} rule(s), {sum(1 for since in updated_since if since)} incrementally.")
+    logger.debug("Rule details.", extra={"rules": rules})
+    # Shards of the same rule share its note, which identifies a rule within a findings manager
+    per_shard = {}
+    for rule, since, shard in zip(rules, updated_since, shards or [None] * len(rules)):
+        shard_rules = per_shard.setdefault(dumps(shard, sort_keys=True), (shard, [], []))
+        shard_rules[1].append(rule)
+        shard_rules[2].append(since)
+
+    swept_at = datetime.now(timezone.utc)
+    for shard, shard_rules, shard_updated_since in per_shard.values():
+        if shard:
+            logger.info(f"Processing {len(shard_rules)} rule(s) within shard {dumps(shard)}.")
+        shard_swept_at = _apply_rules(shard_rules, logger, shard_updated_since, checkpoint_scope, shard)
+        if shard_swept_at is None:
+            return None
+        swept_at = min(swept_at, shard_swept_at)
+    return swept_at
+
+
+def load_rules_manifest() -> dict:
+    """The rules of the last deploy and the hashes of the rules it swept, empty when no deploy recorded them yet.
+
+    Manifests stored before the hashes were recorded have no rule_hashes, so all of their rules count as changed.
+    """
     try:
-        findings_manager = _initialize_findings_manager(logger)
+        response = _get_s3_client().get_object(Bucket=S3_BUCKET_NAME, Key=S3_MANIFEST_OBJECT_NAME)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return {"rules": [], "rule_hashes": []}
+        raise
+    manifest = loads(response["Body"].read())
+    return {"rules": manifest["rules"], "rule_hashes": manifest.get("rule_hashes", [])}
+
+
+def store_rules_manifest(rules: list, rule_hashes: list):
+    _get_s3_client().put_object(
+        Bucket=S3_BUCKET_NAME, Key=S3_MANIFEST_OBJECT_NAME,
+        Body=dumps({"rules": rules, "rule_hashes": sorted(set(rule_hashes))}).encode(), ContentType="application/json"
+    )
+
+
+def unsuppress_removed_rules(rules: list, logger: Logger) -> bool:
+    """Sets the findings suppressed by removed rules back to NEW, unless a current rule still matches them."""
+    current_findings_manager = load_findings_manager(logger)
+    if current_findings_manager is None:
+        return False
+
+    try:
+        findings_manager = LambdaFindingsManager(note_text=NoteTextConfig(format="json"))
+        findings_manager.register_rules(rules)
+        findings = [finding for finding in findings_manager.get_suppressed_findings()
+                    if current_findings_manager.rule_index.match(finding) is None]
+        success, _ = findings_manager.unsuppress_findings(findings)
     except Exception as e:
-        logger.error("Findings manager failed to initialize, please investigate.")
+        logger.error("Findings manager failed to unsuppress the findings of removed rules, please investigate.")
         logger.error(f"Original error: {e}", exc_info=True)
-        return {"finding_state": "skipped"}
+        return False
+
+    logger.info(f"Unsuppressed {len(findings)} finding(s) of {len(rules)} removed rule(s).")
+    return success
+
+
+def get_rules(logger: Logger):
+    findings_manager = load_findings_manager(logger)
+    if findings_manager is None:
+        return finding_state("skipped")
     return findings_manager.rules
 
 
+def finding_state(state: str, suppressed_payload: list = ()) -> dict:
+    # One of "suppressed", "skipped" or "failed", where failed findings are treated as not suppressed
+    # The Step Function looks up every finding of the event in suppressed_finding_ids, so it is always present
+    return {
+        "finding_state": state,
+        "suppressed_finding_ids": [
+            identifier["Id"] for chunk in suppressed_payload for identifier in chunk["FindingIdentifiers"]
+        ],
+    }
+
+
 def suppression_logging(logger: Logger, suppressed_payload: list):
+    record_suppressions(suppressed_payload)
     if len(suppressed_payload) > 0:
         for chunk in suppressed_payload:
             note_text = chunk["Note"]["Text"]
             workflow_status = chunk["Workflow"]["Status"]
             count = len(chunk["FindingIdentifiers"])
             logger.info(f"{count} finding(s) {workflow_status} with note: {note_text}.")
-        return {"finding_state": "suppressed"}
+        return finding_state("suppressed", suppressed_payload)
     else:
         logger.info("No findings were suppressed.")
-        return {"finding_state": "skipped"}
+        return finding_state("skipped")
@@ -0,0 +1,169 @@
+from abc import ABC, abstractmethod
+from hashlib import sha256
+from json import dumps
+from os import environ
+from time import time
+from typing import Dict, Iterable, Optional
+from aws_lambda_powertools import Logger
+
+# "dynamodb" or "memory", any other value disables the fingerprint check
+FINGERPRINT_STORE = environ.get("FINGERPRINT_STORE", "")
+FINGERPRINT_TABLE_NAME = environ.get("FINGERPRINT_TABLE_NAME")
+# Seconds a fingerprint is remembered, longer than the re-evaluation interval of the periodic controls
+FINGERPRINT_TTL_SECONDS = int(environ.get("FINGERPRINT_TTL_SECONDS", "604800"))
+# DynamoDB limits on the number of keys in a single BatchGetItem and BatchWriteItem request
+DYNAMODB_MAX_GET_KEYS = 100
+DYNAMODB_MAX_WRITE_ITEMS = 25
+
+# Module level state survives across warm invocations of the same Lambda container
+_STORE = None
+
+
+def _chunks(items: list, size: int) -> Iterable[list]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class FingerprintStore(ABC):
+    """Key-value store of finding fingerprints, entries expire after FINGERPRINT_TTL_SECONDS."""
+
+    @abstractmethod
+    def get_many(self, keys: list) -> Dict[str, str]:
+        """The stored fingerprints of the keys that have one."""
+
+    @abstractmethod
+    def put_many(self, fingerprints: Dict[str, str]):
+        """Stores the fingerprints of the keys."""
+
+
+class InMemoryFingerprintStore(FingerprintStore):
+    """Fingerprints kept by a single Lambda container, no infrastructure needed but not shared between containers."""
+
+    def __init__(self):
+        self._fingerprints = {}
+
+    def get_many(self, keys: list) -> Dict[str, str]:
+        now = time()
+        fingerprints = {}
+        for key in keys:
+            fingerprint, expiration = self._fingerprints.get(key, (None, 0))
+            if expiration > now:
+                fingerprints[key] = fingerprint
+        return fingerprints
+
+    def put_many(self, fingerprints: Dict[str, str]):
+        expiration = time() + FINGERPRINT_TTL_SECONDS
+        self._fingerprints.update((key, (fingerprint, expiration)) for key, fingerprint in fingerprints.items())
+
+
+class DynamoDBFingerprintStore(FingerprintStore):
+    """Fingerprints shared by all Lambda containers, DynamoDB removes them through the TTL attribute."""
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            # Imported on first use, the Jira Lambda keeps boto3 out of its cold start
+            from boto3 import client
+            self._client = client("dynamodb")
+        return self._client
+
+    def get_many(self, keys: list) -> Dict[str, str]:
+        fingerprints = {}
+        now = int(time())
+        for chunk in _chunks(sorted(set(keys)), DYNAMODB_MAX_GET_KEYS):
+            request = {self.table_name: {"Keys": [{"id": {"S": key}} for key in chunk],
+                                         "ProjectionExpression": "id, fingerprint, expiration"}}
+            while request:
+                response = self.client.batch_get_item(RequestItems=request)
+                for item in response["Responses"].get(self.table_name, []):
+                    # Expired items can linger until DynamoDB deletes them
+                    if int(item["expiration"]["N"]) > now:
+                        fingerprints[item["id"]["S"]] = item["fingerprint"]["S"]
+                request = response.get("UnprocessedKeys")
+        return fingerprints
+
+    def put_many(self, fingerprints: Dict[str, str]):
+        expiration = str(int(time()) + FINGERPRINT_TTL_SECONDS)
+        for chunk in _chunks(sorted(fingerprints.items()), DYNAMODB_MAX_WRITE_ITEMS):
+            request = {self.table_name: [
+                {"PutRequest": {"Item": {"id": {"S": key}, "fingerprint": {"S": fingerprint},
+                                         "expiration": {"N": expiration}}}}
+                for key, fingerprint in chunk
+            ]}
+            while request:
+                response = self.client.batch_write_item(RequestItems=request)
+                request = response.get("UnprocessedItems")
+
+
+def get_store() -> Optional[FingerprintStore]:
+    """The configured fingerprint store, None when the fingerprint check is disabled."""
+    global _STORE
+    if _STORE is None:
+        if FINGERPRINT_STORE == "dynamodb" and FINGERPRINT_TABLE_NAME:
+            _STORE = DynamoDBFingerprintStore(FINGERPRINT_TABLE_NAME)
+        elif FINGERPRINT_STORE == "memory":
+            _STORE = InMemoryFingerprintStore()
+    return _STORE
+
+
+def finding_fingerprint(finding: dict, rules_version: str = None) -> str:
+    """Hash of the finding attributes that rules, Jira routing and autoclose act on.
+
+    Timestamps, severity and descriptions are left out, they change on every re-import without changing the outcome.
+    """
+    product_fields = finding.get("ProductFields", {})
+    return sha256(dumps({
+        "account": finding.get("AwsAccountId"),
+        "region": finding.get("Region"),
+        "product": finding.get("ProductName", product_fields.get("aws/securityhub/ProductName")),
+        "generator": finding.get("GeneratorId"),
+        "title": finding.get("Title"),
+        "control": finding.get("Compliance", {}).get("SecurityControlId"),
+        "product_control": [product_fields.get("ControlId"), product_fields.get("RuleId")],
+        "compliance_status": finding.get("Compliance", {}).get("Status"),
+        "record_state": finding.get("RecordState"),
+        "workflow_status": finding.get("Workflow", {}).get("Status"),
+        "note": finding.get("Note", {}).get("Text"),
+        "resources": [[resource.get("Id"), resource.get("Region"), resource.get("Tags")]
+                      for resource in finding.get("Resources", [])],
+        "rules_version": rules_version,
+    }, sort_keys=True).encode()).hexdigest()
+
+
+def _key(scope: str, finding: dict) -> str:
+    # The events and Jira Lambdas share the table, each under their own scope
+    return f"{scope}#{finding['Id']}"
+
+
+def unchanged_findings(scope: str, findings: list, logger: Logger, rules_version: str = None) -> set:
+    """Ids of the findings whose fingerprint matches the one remembered for the scope, empty when disabled."""
+    store = get_store()
+    if store is None or not findings:
+        return set()
+
+    try:
+        stored = store.get_many([_key(scope, finding) for finding in findings])
+    except Exception as e:
+        # Processing a finding twice is safe, so a failing lookup only costs the work the store would have saved
+        logger.warning(f"Failed to look up finding fingerprints, processing all findings. Original error: {e}")
+        return set()
+    return {
+        finding["Id"] for finding in findings
+        if stored.get(_key(scope, finding)) == finding_fingerprint(finding, rules_version)
+    }
+
+
+def remember_findings(scope: str, findings: list, logger: Logger, rules_version: str = None):
+    """Remembers the fingerprints of the findings, so identical re-imports are skipped within the TTL."""
+    store = get_store()
+    if store is None or not findings:
+        return
+
+    try:
+        store.put_many({_key(scope, finding): finding_fingerprint(finding, rules_version) for finding in findings})
+    except Exception as e:
+        logger.warning(f"Failed to store finding fingerprints, their re-imports will be processed. Original error: {e}")
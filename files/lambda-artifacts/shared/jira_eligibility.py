@@ -0,0 +1,221 @@
+"""Decides whether the Jira integration creates or closes an issue for a finding, the single source of these rules.
+
+The rules are Choice rules in Amazon States Language, kept as plain data. They decide on a Step Function Map item: a
+finding under detail.findings[0], whether the findings manager suppressed it and the settings of the Jira integration.
+As the settings are part of the item, the rule is the same for every deployment. The Choice state of the Step Function
+uses the rule as generated into files/step-function-artifacts/jira-eligibility-rule.json, the Lambdas evaluate it
+in-process, so both always decide alike.
+
+Usage:
+    python jira_eligibility.py    # write the Choice rule of the Step Function after changing the rules
+"""
+import json
+import os
+import re
+from typing import NamedTuple, Optional, Tuple
+
+FINDING = "$.detail.findings[0]"
+WORKFLOW_STATUS = f"{FINDING}.Workflow.Status"
+COMPLIANCE_STATUS = f"{FINDING}.Compliance.Status"
+RECORD_STATE = f"{FINDING}.RecordState"
+SEVERITY_NORMALIZED = f"{FINDING}.Severity.Normalized"
+NOTE_TEXT = f"{FINDING}.Note.Text"
+
+ACTION_CREATE = "create"
+ACTION_CLOSE = "close"
+
+RULE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "step-function-artifacts", "jira-eligibility-rule.json"
+)
+
+
+class EligibilitySettings(NamedTuple):
+    """The Jira integration settings the rules depend on, named after the settings of the Map item."""
+
+    finding_severity_normalized: int = 70
+    include_product_names: Tuple[str, ...] = ()
+    jira_autoclose_enabled: bool = False
+    jira_autoclose_suppressed_enabled: bool = False
+
+
+def settings_from_json(text: str) -> EligibilitySettings:
+    """The settings of a JSON object holding the fields of EligibilitySettings."""
+    settings = json.loads(text)
+    return EligibilitySettings(
+        finding_severity_normalized=settings["finding_severity_normalized"],
+        include_product_names=tuple(settings.get("include_product_names", ())),
+        jira_autoclose_enabled=settings.get("jira_autoclose_enabled", False),
+        jira_autoclose_suppressed_enabled=settings.get("jira_autoclose_suppressed_enabled", False),
+    )
+
+
+def _equals(path: str, *values: str) -> dict:
+    if len(values) == 1:
+        return {"Variable": path, "StringEquals": values[0]}
+    return {"Or": [{"Variable": path, "StringEquals": value} for value in values]}
+
+
+def _enabled(setting: str) -> dict:
+    return {"Variable": f"$.settings.{setting}", "BooleanEquals": True}
+
+
+# The finding needs a Jira issue: it is NEW and ACTIVE, and its compliance status is FAILED, WARNING or missing, as
+# for Inspector findings. AWS Config findings can be NEW with compliance status NOT_AVAILABLE, they are not actionable.
+NEW_FINDING = {"And": [
+    _equals(WORKFLOW_STATUS, "NEW"),
+    _equals(RECORD_STATE, "ACTIVE"),
+    {"Or": [
+        {"Variable": COMPLIANCE_STATUS, "IsPresent": False},
+        {"And": [{"Variable": COMPLIANCE_STATUS, "IsPresent": True}, _equals(COMPLIANCE_STATUS, "FAILED", "WARNING")]},
+    ]},
+]}
+
+# The issue of the finding can be closed: it is RESOLVED, SUPPRESSED when suppressed findings are autoclosed, or still
+# NOTIFIED while it passes, its resource is gone (compliance status NOT_AVAILABLE) or it was archived
+RESOLVED_FINDING = {"Or": [
+    _equals(WORKFLOW_STATUS, "RESOLVED"),
+    {"And": [_enabled("jira_autoclose_suppressed_enabled"), _equals(WORKFLOW_STATUS, "SUPPRESSED")]},
+    {"And": [
+        _equals(WORKFLOW_STATUS, "NOTIFIED"),
+        {"Or": [
+            _equals(RECORD_STATE, "ARCHIVED"),
+            {"And": [
+                {"Variable": COMPLIANCE_STATUS, "IsPresent": True},
+                _equals(COMPLIANCE_STATUS, "PASSED", "NOT_AVAILABLE"),
+            ]},
+        ]},
+    ]},
+]}
+
+CREATE_ISSUE = {"Comment": "CREATE JIRA TICKET: Requires severity >= threshold", "And": [
+    {"Variable": SEVERITY_NORMALIZED, "NumericGreaterThanEqualsPath": "$.settings.finding_severity_normalized"},
+    NEW_FINDING,
+]}
+
+CLOSE_ISSUE = {"Comment": "CLOSE JIRA TICKET: Works at ANY severity (ticket already exists)", "And": [
+    _enabled("jira_autoclose_enabled"),
+    RESOLVED_FINDING,
+    {"And": [{"Variable": NOTE_TEXT, "IsPresent": True}, {"Variable": NOTE_TEXT, "StringMatches": "*jiraIssue*"}]},
+]}
+
+ELIGIBLE = {"And": [
+    {"Comment": "Only findings that were not suppressed by the findings manager",
+     "Variable": "$.suppressed", "BooleanEquals": False},
+    {"Comment": "PRODUCT NAME FILTER: Only process findings with ProductName in the include list, when there is one",
+     "Or": [
+         {"Variable": "$.product_included", "IsPresent": False},
+         {"Variable": "$.product_included", "BooleanEquals": True},
+     ]},
+    {"Comment": "Prevent duplicate Jira tickets: only create NEW tickets if note doesn't contain jiraIssue", "Or": [
+        {"Variable": NOTE_TEXT, "IsPresent": False},
+        {"Not": {"Variable": NOTE_TEXT, "StringMatches": "*jiraIssue*"}},
+        {"Not": _equals(WORKFLOW_STATUS, "NEW")},
+    ]},
+    {"Or": [CREATE_ISSUE, CLOSE_ISSUE]},
+]}
+
+# The Jira Lambda closes the issues of the SUPPRESSED findings it receives, whether they are passed is decided before
+LAMBDA_SETTINGS = EligibilitySettings(jira_autoclose_enabled=True, jira_autoclose_suppressed_enabled=True)
+
+
+class MissingPath(Exception):
+    """A comparison on a path missing from the input, a Choice state fails on it instead of choosing a branch."""
+
+
+def _resolve(data, path: str):
+    # "$.detail.findings[0].Note.Text" is resolved as detail, findings, 0, Note, Text
+    for step in re.findall(r"[^.\[\]$]+", path):
+        if isinstance(data, list) and step.isdigit() and int(step) < len(data):
+            data = data[int(step)]
+        elif isinstance(data, dict) and step in data:
+            data = data[step]
+        else:
+            raise MissingPath(path)
+    return data
+
+
+def _string_matches(value: str, pattern: str) -> bool:
+    # Choice rules only support the * wildcard, escaped as \*
+    parts = re.split(r"(?<!\\)\*", pattern)
+    return re.fullmatch(".*".join(re.escape(part.replace("\\*", "*")) for part in parts), value, re.DOTALL) is not None
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+_COMPARISONS = {
+    "BooleanEquals": lambda value, expected: isinstance(value, bool) and value == expected,
+    "NumericGreaterThanEquals": lambda value, expected: _is_number(value) and value >= expected,
+    "StringEquals": lambda value, expected: isinstance(value, str) and value == expected,
+    "StringMatches": lambda value, expected: isinstance(value, str) and _string_matches(value, expected),
+}
+
+
+def evaluate(rule: dict, data: dict) -> bool:
+    """Evaluates a Choice rule on its input like a Choice state, raising MissingPath where the state would fail."""
+    # In order and short-circuiting like a Choice state, so presence checks guard the comparisons after them
+    if "And" in rule:
+        return all(evaluate(element, data) for element in rule["And"])
+    if "Or" in rule:
+        return any(evaluate(element, data) for element in rule["Or"])
+    if "Not" in rule:
+        return not evaluate(rule["Not"], data)
+    (operator, expected), = [(key, value) for key, value in rule.items() if key not in ("Comment", "Next", "Variable")]
+    if operator == "IsPresent":
+        try:
+            _resolve(data, rule["Variable"])
+            return expected
+        except MissingPath:
+            return not expected
+    if operator.endswith("Path"):
+        operator, expected = operator[:-len("Path")], _resolve(data, expected)
+    return _COMPARISONS[operator](_resolve(data, rule["Variable"]), expected)
+
+
+def map_item(finding: dict, settings: EligibilitySettings, suppressed: bool = False) -> dict:
+    """The Step Function Map item of a finding, the input of the rules."""
+    item = {
+        "detail": {"findings": [finding]},
+        "settings": {**settings._asdict(), "include_product_names": list(settings.include_product_names)},
+        "suppressed": suppressed,
+    }
+    if settings.include_product_names:
+        # Security Hub sets the product name of every finding, the Step Function fails on a finding without one
+        item["product_included"] = finding.get("ProductName") in settings.include_product_names
+    return item
+
+
+def _holds(rule: dict, data: dict) -> bool:
+    try:
+        return evaluate(rule, data)
+    except MissingPath:
+        return False
+
+
+def jira_action(finding: dict, settings: EligibilitySettings, suppressed: bool = False) -> Optional[str]:
+    """Whether the Jira integration creates ("create") or closes ("close") an issue for the finding, None for neither."""
+    data = map_item(finding, settings, suppressed)
+    if not _holds(ELIGIBLE, data):
+        return None
+    return ACTION_CREATE if _holds(CREATE_ISSUE, data) else ACTION_CLOSE
+
+
+def is_new_finding(finding: dict) -> bool:
+    """Whether the state of the finding asks for a Jira issue, regardless of its severity."""
+    return _holds(NEW_FINDING, map_item(finding, LAMBDA_SETTINGS))
+
+
+def is_resolved_finding(finding: dict) -> bool:
+    """Whether the state of the finding allows closing its Jira issue."""
+    return _holds(RESOLVED_FINDING, map_item(finding, LAMBDA_SETTINGS))
+
+
+def render_rule() -> str:
+    """The Choice rule of the Step Function as written to RULE_PATH, without its Next field."""
+    return json.dumps(ELIGIBLE, indent=2, sort_keys=True) + "\n"
+
+
+if __name__ == "__main__":
+    with open(RULE_PATH, "w") as file:
+        file.write(render_rule())
@@ -0,0 +1,137 @@
+import logging
+from contextlib import contextmanager
+from functools import wraps
+from hashlib import sha256
+from json import dumps
+from os import environ
+from random import random
+from threading import Lock
+from time import perf_counter
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.metrics.provider.cloudwatch_emf.cloudwatch import AmazonCloudWatchEMFProvider
+
+METRICS_ENABLED = environ.get("POWERTOOLS_METRICS_DISABLED", "false").lower() != "true"
+METRICS_NAMESPACE = environ.get("POWERTOOLS_METRICS_NAMESPACE", "SecurityHubFindingsManager")
+# Tracing is opt-in, the X-Ray SDK imports botocore and so undoes the lazy imports of the Jira Lambda's cold start
+TRACING_ENABLED = environ.get("POWERTOOLS_TRACE_DISABLED", "true").lower() == "false"
+# CloudWatch limit on the length of a dimension value
+MAX_DIMENSION_VALUE_LENGTH = 1024
+# How events and rules are logged below the DEBUG log level: "digest", "truncate", "full" or "off"
+PAYLOAD_LOG_MODE = environ.get("PAYLOAD_LOG_MODE", "digest").lower()
+# Fraction of the payloads that is logged below the DEBUG log level
+PAYLOAD_LOG_SAMPLE_RATE = float(environ.get("PAYLOAD_LOG_SAMPLE_RATE", "1"))
+# Characters of a payload kept in "truncate" mode
+PAYLOAD_LOG_MAX_LENGTH = int(environ.get("PAYLOAD_LOG_MAX_LENGTH", "2048"))
+
+# Module level state survives across warm invocations of the same Lambda container
+_TRACER = None
+# Metrics are flushed per set of dimensions next to the service dimension, like the rule or Jira instance
+_METRICS = {}
+# The threads processing a queued batch of the Jira Lambda add metrics at the same time
+_METRICS_LOCK = Lock()
+
+
+def get_tracer():
+    """The Powertools Tracer, None when tracing is disabled."""
+    global _TRACER
+    if _TRACER is None and TRACING_ENABLED:
+        from aws_lambda_powertools import Tracer
+        _TRACER = Tracer()
+    return _TRACER
+
+
+def add_metric(name: str, unit: str, value: float, **dimensions):
+    """Adds a metric to the flush of the invocation, under the given dimensions next to the service dimension."""
+    if not METRICS_ENABLED:
+        return
+
+    dimensions = {dimension: str(label)[:MAX_DIMENSION_VALUE_LENGTH] for dimension, label in dimensions.items()}
+    dimension_set = tuple(sorted(dimensions.items()))
+    with _METRICS_LOCK:
+        if dimension_set not in _METRICS:
+            provider = AmazonCloudWatchEMFProvider(namespace=METRICS_NAMESPACE)
+            for dimension, label in dimensions.items():
+                provider.add_dimension(name=dimension, value=label)
+            _METRICS[dimension_set] = provider
+        _METRICS[dimension_set].add_metric(name=name, unit=unit, value=value)
+
+
+def flush_metrics():
+    """Prints the metrics added since the last flush as EMF log lines, one per set of dimensions."""
+    for provider in _METRICS.values():
+        # Powertools warns about flushing a provider without metrics
+        if provider.metric_set:
+            provider.flush_metrics()
+    _METRICS.clear()
+
+
+def add_count(name: str, value: int = 1, **dimensions):
+    add_metric(name, MetricUnit.Count, value, **dimensions)
+
+
+def log_payload(logger, message: str, payload):
+    """Logs a payload in full at the DEBUG log level, otherwise a sample of them in the PAYLOAD_LOG_MODE.
+
+    The digest mode logs a hash and the length of the payload, enough to tell whether two invocations received the
+    same event or rules without paying for their ingestion.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(message, extra={"payload": payload})
+        return
+    if PAYLOAD_LOG_MODE not in ("digest", "truncate", "full") or random() >= PAYLOAD_LOG_SAMPLE_RATE:
+        return
+    if PAYLOAD_LOG_MODE == "full":
+        logger.info(message, extra={"payload": payload})
+        return
+
+    serialized = dumps(payload, sort_keys=True, default=str)
+    if PAYLOAD_LOG_MODE == "truncate":
+        logger.info(message, extra={"payload": serialized[:PAYLOAD_LOG_MAX_LENGTH], "payload_length": len(serialized),
+                                    "payload_truncated": len(serialized) > PAYLOAD_LOG_MAX_LENGTH})
+    else:
+        logger.info(message, extra={"payload_digest": sha256(serialized.encode()).hexdigest(),
+                                    "payload_length": len(serialized)})
+
+
+def log_payload_on_error(logger, message: str, payload):
+    """Logs a payload in full regardless of the PAYLOAD_LOG_MODE, for the invocations that need investigating."""
+    logger.error(message, extra={"payload": payload})
+
+
+@contextmanager
+def traced(name: str, **annotations):
+    """X-Ray subsegment around a step of a handler, annotated for searching traces, a no-op when tracing is disabled."""
+    tracer = get_tracer()
+    if tracer is None:
+        yield
+        return
+    with tracer.provider.in_subsegment(f"## {name}") as subsegment:
+        for key, value in annotations.items():
+            subsegment.put_annotation(key=key, value=str(value))
+        yield
+
+
+@contextmanager
+def timed(name: str, **dimensions):
+    """Traces the block as a subsegment and records its duration as the <name>Latency metric in milliseconds."""
+    start = perf_counter()
+    try:
+        with traced(name, **dimensions):
+            yield
+    finally:
+        add_metric(f"{name}Latency", MetricUnit.Milliseconds, (perf_counter() - start) * 1000, **dimensions)
+
+
+def instrument_handler(handler):
+    """Flushes the metrics of every invocation of the handler and traces it when tracing is enabled."""
+    tracer = get_tracer()
+    traced_handler = tracer.capture_lambda_handler(handler) if tracer else handler
+
+    @wraps(handler)
+    def wrapper(event, context):
+        try:
+            return traced_handler(event, context)
+        finally:
+            flush_metrics()
+
+    return wrapper
@@ -0,0 +1,115 @@
+from os import environ
+from threading import Lock
+from time import monotonic, sleep
+from boto3 import client
+from botocore.config import Config
+
+# Number of Lambda containers expected to call Security Hub at the same time, they share the documented rates
+SECURITYHUB_CONCURRENCY = max(int(environ.get("SECURITYHUB_CONCURRENCY", "1")), 1)
+# Attempts per API call, including the first one, before the error is raised to the caller
+SECURITYHUB_MAX_ATTEMPTS = int(environ.get("SECURITYHUB_MAX_ATTEMPTS", "10"))
+
+# Documented Security Hub rate limits per account and region as (requests per second, burst)
+# https://docs.aws.amazon.com/securityhub/1.0/APIReference/Welcome.html
+API_RATES = {
+    "BatchImportFindings": (10, 30),
+    "BatchUpdateFindings": (10, 30),
+    "GetFindings": (3, 6),
+    "UpdateFindings": (1, 5),
+}
+DEFAULT_API_RATE = (10, 30)
+THROTTLING_ERROR_CODES = ("ThrottlingException", "Throttling", "TooManyRequestsException")
+
+# Module level state survives across warm invocations of the same Lambda container
+_CLIENTS = {}
+_CLIENTS_LOCK = Lock()
+_STATS = {
+    "calls": 0,
+    "retries": 0,
+    "throttles": 0,
+    "rate_limited_seconds": 0.0,
+}
+# The handlers of the clients run in the threads of their callers, updates of the stats are not atomic
+_STATS_LOCK = Lock()
+
+
+class TokenBucket:
+    """Client side rate limiter, callers wait for a token instead of being throttled by Security Hub."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = monotonic()
+        self._lock = Lock()
+
+    def acquire(self) -> float:
+        """Takes a token, sleeping until it is available, and returns the number of seconds waited."""
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # A missing token is reserved up front, so concurrent callers queue up behind each other
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            sleep(wait)
+        return wait
+
+
+def _token_buckets() -> dict:
+    rates = {"default": DEFAULT_API_RATE, **API_RATES}
+    return {operation: TokenBucket(rate / SECURITYHUB_CONCURRENCY, max(burst / SECURITYHUB_CONCURRENCY, 1))
+            for operation, (rate, burst) in rates.items()}
+
+
+def _register_handlers(securityhub):
+    buckets = _token_buckets()
+
+    def before_send(event_name, **kwargs):
+        # Fired for every attempt, so retries wait for a token as well
+        operation = event_name.rsplit(".", 1)[-1]
+        waited = buckets.get(operation, buckets["default"]).acquire()
+        with _STATS_LOCK:
+            _STATS["rate_limited_seconds"] += waited
+
+    def needs_retry(response, **kwargs):
+        if response and response[1].get("Error", {}).get("Code") in THROTTLING_ERROR_CODES:
+            with _STATS_LOCK:
+                _STATS["throttles"] += 1
+        # Leave the retry decision to the adaptive retry handler of botocore
+
+    def after_call(parsed=None, exception=None, **kwargs):
+        metadata = parsed or getattr(exception, "response", None) or {}
+        with _STATS_LOCK:
+            _STATS["calls"] += 1
+            _STATS["retries"] += metadata.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+
+    events = securityhub.meta.events
+    events.register("before-send.securityhub", before_send)
+    events.register_first("needs-retry.securityhub", needs_retry)
+    events.register("after-call.securityhub", after_call)
+    events.register("after-call-error.securityhub", after_call)
+
+
+def get_client(region: str = None):
+    """A Security Hub client shared by all callers in the container, one per region.
+
+    Calls are rate limited per API on the client side, and retried by botocore in adaptive mode with jittered
+    exponential backoff when Security Hub throttles them anyway.
+    """
+    with _CLIENTS_LOCK:
+        if region not in _CLIENTS:
+            config = Config(
+                region_name=region,
+                retries={"mode": "adaptive", "total_max_attempts": SECURITYHUB_MAX_ATTEMPTS},
+            )
+            securityhub = client("securityhub", config=config)
+            _register_handlers(securityhub)
+            _CLIENTS[region] = securityhub
+        return _CLIENTS[region]
+
+
+def securityhub_client_stats() -> dict:
+    with _STATS_LOCK:
+        return dict(_STATS)
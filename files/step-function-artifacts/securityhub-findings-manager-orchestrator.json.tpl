@@ -1,28 +1,31 @@
 {
     "Comment": "Step Function to orchestrate Security Hub findings manager Lambda functions",
-    "StartAt": "ChoiceSuppressor",
+    "StartAt": "ManagedFindings",
     "States": {
+      "ManagedFindings": {
+        "Type": "Pass",
+        "Comment": "The findings of the event the findings manager manages, only NEW and NOTIFIED findings can be suppressed",
+        "Parameters": {
+          "ids.$": "$.detail.findings[?(@.Workflow.Status == 'NEW' || @.Workflow.Status == 'NOTIFIED')].Id"
+        },
+        "ResultPath": "$.ManagedFindings",
+        "Next": "ChoiceSuppressor"
+      },
       "ChoiceSuppressor": {
         "Type": "Choice",
+        "Comment": "Events of only RESOLVED or SUPPRESSED findings skip the findings manager and go straight to the Jira integration",
         "Choices": [
           {
-            "Or": [
-              {
-                "Variable": "$.detail.findings[0].Workflow.Status",
-                "StringEquals": "NEW"
-              },
-              {
-                "Variable": "$.detail.findings[0].Workflow.Status",
-                "StringEquals": "NOTIFIED"
-              }
-            ],
+            "Variable": "$.ManagedFindings.ids[0]",
+            "IsPresent": true,
             "Next": "invoke-securityhub-findings-manager-events"
           }
         ],
-        "Default": "ChoiceJiraIntegration"
+        "Default": "skip-securityhub-findings-manager-events"
       },
       "invoke-securityhub-findings-manager-events": {
         "Type": "Task",
+        "Comment": "Apply the findings management rules to all findings of the event in one invocation",
         "Resource": "arn:aws:states:::lambda:invoke",
         "Parameters": {
           "Payload.$": "$",
@@ -46,223 +49,157 @@
               "States.TaskFailed"
             ],
             "Comment": "Catch all task failures",
-            "Next": "ChoiceJiraIntegration",
+            "Next": "skip-securityhub-findings-manager-events",
             "ResultPath": "$.error"
           }
         ],
-        "Next": "ChoiceJiraIntegration",
+        "Next": "JiraEligibilitySettings",
         "ResultPath": "$.TaskResult"
       },
-      "ChoiceJiraIntegration": {
-        "Type": "Choice",
-        "Choices": [
-          {
-            "And": [
-              {
-                "Or": [
-                  {
-                    "Variable": "$.TaskResult.Payload.finding_state",
-                    "IsPresent": false
-                  },
-                  {
-                    "And": [
-                      {
-                        "Variable": "$.TaskResult.Payload.finding_state",
-                        "IsPresent": true
-                      },
-                      {
-                        "Variable": "$.TaskResult.Payload.finding_state",
-                        "StringEquals": "skipped"
-                      }
-                    ]
-                  }
-                ]
+      "skip-securityhub-findings-manager-events": {
+        "Type": "Pass",
+        "Comment": "Treat all findings as not suppressed when the findings manager was skipped or failed",
+        "Result": {
+          "Payload": {
+            "finding_state": "skipped",
+            "suppressed_finding_ids": []
+          }
+        },
+        "ResultPath": "$.TaskResult",
+        "Next": "JiraEligibilitySettings"
+      },
+      "JiraEligibilitySettings": {
+        "Type": "Pass",
+        "Comment": "The settings of the Jira integration the eligibility rule decides on, part of every Map item",
+        "Result": ${jsonencode(jira_eligibility_settings)},
+        "ResultPath": "$.JiraEligibilitySettings",
+        "Next": "ProcessFindings"
+      },
+      "ProcessFindings": {
+        "Type": "Map",
+        "Comment": "Fan out every finding of the event, each iteration sees a single finding under detail.findings[0]",
+        "ItemsPath": "$.detail.findings",
+        "ItemSelector": {
+          "detail": {
+            "findings.$": "States.Array($$.Map.Item.Value)"
+          },
+%{~ if length(jira_eligibility_settings.include_product_names) > 0 }
+          "product_included.$": "States.ArrayContains($.JiraEligibilitySettings.include_product_names, $$.Map.Item.Value.ProductName)",
+%{~ endif }
+          "settings.$": "$.JiraEligibilitySettings",
+          "suppressed.$": "States.ArrayContains($.TaskResult.Payload.suppressed_finding_ids, $$.Map.Item.Value.Id)"
+        },
+        "MaxConcurrency": 10,
+        "ItemProcessor": {
+          "ProcessorConfig": {
+            "Mode": "INLINE"
+          },
+          "StartAt": "ChoiceJiraIntegration",
+          "States": {
+            "ChoiceJiraIntegration": {
+              "Type": "Choice",
+              "Comment": "The rule is generated by files/lambda-artifacts/shared/jira_eligibility.py, which evaluates it in-process",
+              "Choices": [
+                ${jsonencode(merge(jsondecode(jira_eligibility_rule), { Next = "invoke-securityhub-jira" }))}
+              ],
+              "Default": "SkipJira"
+            },
+            "SkipJira": {
+              "Type": "Pass",
+              "Result": {
+                "failed": false
               },
-%{~ if length(include_product_names) > 0 }
-              {
-                "Comment": "PRODUCT NAME FILTER: Only process findings with ProductName in the include list",
-                "Or": [
-%{~ for idx, product_name in include_product_names }
-                  {
-                    "Variable": "$.detail.findings[0].ProductName",
-                    "StringEquals": "${product_name}"
-                  }%{if idx < length(include_product_names) - 1},%{endif}
-%{~ endfor }
-                ]
+              "End": true
+            },
+            "invoke-securityhub-jira": {
+              "Type": "Task",
+%{~ if jira_queue_url != "" }
+              "Comment": "Buffer the finding in the Jira queue, the Jira Lambda processes it in a batch",
+              "Resource": "arn:aws:states:::sqs:sendMessage",
+              "Parameters": {
+                "MessageBody.$": "$",
+                "QueueUrl": "${jira_queue_url}"
               },
-%{ endif ~}
-              {
-                "Comment": "Prevent duplicate Jira tickets: only create NEW tickets if note doesn't contain jiraIssue",
-                "Or": [
-                  {
-                    "Not": {
-                      "Variable": "$.detail.findings[0].Note.Text",
-                      "StringMatches": "*jiraIssue*"
-                    }
-                  },
-                  {
-                    "Not": {
-                      "Variable": "$.detail.findings[0].Workflow.Status",
-                      "StringEquals": "NEW"
-                    }
-                  }
-                ]
+              "Retry": [
+                {
+                  "ErrorEquals": [
+                    "States.TaskFailed"
+                  ],
+                  "IntervalSeconds": 2,
+                  "MaxAttempts": 6,
+                  "BackoffRate": 2
+                }
+              ],
+%{~ else }
+              "Resource": "arn:aws:states:::lambda:invoke",
+              "Parameters": {
+                "Payload.$": "$",
+                "FunctionName": "${jira_lambda}"
               },
-              %{~ if jira_autoclose_enabled }
-              {
-                "Or": [
-                  {
-                    "Comment": "CREATE JIRA TICKET: Requires severity >= threshold",
-                    "And": [
-                      {
-                        "Variable": "$.detail.findings[0].Severity.Normalized",
-                        "NumericGreaterThanEquals": ${finding_severity_normalized}
-                      },
-                      {
-                        "Variable": "$.detail.findings[0].Workflow.Status",
-                        "StringEquals": "NEW"
-                      },
-                      {
-                        "Variable": "$.detail.findings[0].RecordState",
-                        "StringEquals": "ACTIVE"
-                      },
-                      {
-                        "Or": [
-                          {
-                            "Variable": "$.detail.findings[0].Compliance.Status",
-                            "IsPresent": false
-                          },
-                          {
-                            "And": [
-                              {
-                                "Variable": "$.detail.findings[0].Compliance.Status",
-                                "IsPresent": true
-                              },
-                              {
-                                "Or": [
-                                  {
-                                    "Variable": "$.detail.findings[0].Compliance.Status",
-                                    "StringEquals": "FAILED"
-                                  },
-                                  {
-                                    "Variable": "$.detail.findings[0].Compliance.Status",
-                                    "StringEquals": "WARNING"
-                                  }
-                                ]
-                              }
-                            ]
-                          }
-                        ]
-                      }
-                    ]
-                  },
-                  {
-                    "Comment": "CLOSE JIRA TICKET: Works at ANY severity (ticket already exists)",
-                    "And": [
-                      {
-                        "Or": [
-                          {
-                            "Variable": "$.detail.findings[0].Workflow.Status",
-                            "StringEquals": "RESOLVED"
-                          },%{~ if jira_autoclose_suppressed_enabled }
-                          {
-                            "Variable": "$.detail.findings[0].Workflow.Status",
-                            "StringEquals": "SUPPRESSED"
-                          },%{ endif ~}
-                          {
-                            "And": [
-                              {
-                                "Variable": "$.detail.findings[0].Workflow.Status",
-                                "StringEquals": "NOTIFIED"
-                              },
-                              {
-                                "Or": [
-                                  {
-                                    "Variable": "$.detail.findings[0].RecordState",
-                                    "StringEquals": "ARCHIVED"
-                                  },
-                                  {
-                                    "And": [
-                                      {
-                                        "Variable": "$.detail.findings[0].Compliance.Status",
-                                        "IsPresent": true
-                                      },
-                                      {
-                                        "Or": [
-                                          {
-                                            "Variable": "$.detail.findings[0].Compliance.Status",
-                                            "StringEquals": "PASSED"
-                                          },
-                                          {
-                                            "Variable": "$.detail.findings[0].Compliance.Status",
-                                            "StringEquals": "NOT_AVAILABLE"
-                                          }
-                                        ]
-                                      }
-                                    ]
-                                  }
-                                ]
-                              }
-                            ]
-                          }
-                        ]
-                      },
-                      {
-                        "Variable": "$.detail.findings[0].Note.Text",
-                        "IsPresent": true
-                      },
-                      {
-                        "Variable": "$.detail.findings[0].Note.Text",
-                        "StringMatches": "*jiraIssue*"
-                      }
-                    ]
-                  }
-                ]
-              }
-              %{ else }
-              {
-                "And": [
-                  {
-                    "Variable": "$.detail.findings[0].Severity.Normalized",
-                    "NumericGreaterThanEquals": ${finding_severity_normalized}
-                  },
-                  {
-                    "Variable": "$.detail.findings[0].Workflow.Status",
-                    "StringEquals": "NEW"
-                  }
-                ]
-              }
-              %{ endif ~}
-            ],
-            "Next": "invoke-securityhub-jira"
+              "Retry": [
+                {
+                  "ErrorEquals": [
+                    "Lambda.ServiceException",
+                    "Lambda.AWSLambdaException",
+                    "Lambda.SdkClientException"
+                  ],
+                  "IntervalSeconds": 2,
+                  "MaxAttempts": 6,
+                  "BackoffRate": 2
+                }
+              ],
+%{~ endif }
+              "Catch": [
+                {
+                  "ErrorEquals": [
+                    "States.ALL"
+                  ],
+                  "Comment": "Record the failure and let the other findings of the event continue",
+                  "Next": "JiraFailed",
+                  "ResultPath": "$.error"
+                }
+              ],
+              "ResultSelector": {
+                "failed": false
+              },
+              "ResultPath": "$",
+              "End": true
+            },
+            "JiraFailed": {
+              "Type": "Pass",
+              "Parameters": {
+                "failed": true,
+                "finding_id.$": "$.detail.findings[0].Id",
+                "error.$": "$.error"
+              },
+              "End": true
+            }
+          }
+        },
+        "ResultSelector": {
+          "failed.$": "$[?(@.failed == true)]"
+        },
+        "ResultPath": "$.ProcessFindings",
+        "Next": "ChoiceJiraFailures"
+      },
+      "ChoiceJiraFailures": {
+        "Type": "Choice",
+        "Choices": [
+          {
+            "Variable": "$.ProcessFindings.failed[0]",
+            "IsPresent": true,
+            "Next": "JiraFailure"
           }
         ],
         "Default": "Success"
       },
+      "JiraFailure": {
+        "Type": "Fail",
+        "Error": "JiraIntegrationFailed",
+        "Comment": "Fail the execution when the Jira integration failed for any finding of the event"
+      },
       "Success": {
         "Type": "Succeed"
-      },
-      "invoke-securityhub-jira": {
-        "Type": "Task",
-        "Resource": "arn:aws:states:::lambda:invoke",
-        "OutputPath": "$.Payload",
-        "Parameters": {
-          "Payload.$": "$",
-          "FunctionName": "${jira_lambda}"
-        },
-        "Retry": [
-          {
-            "ErrorEquals": [
-              "Lambda.ServiceException",
-              "Lambda.AWSLambdaException",
-              "Lambda.SdkClientException"
-            ],
-            "IntervalSeconds": 2,
-            "MaxAttempts": 6,
-            "BackoffRate": 2
-          }
-        ],
-        "End": true
       }
     }
   }
@@ -1,3 +1,23 @@
+locals {
+  # Environment of the Lambdas sharing the finding fingerprint check
+  finding_fingerprints_table_enabled = var.finding_fingerprints.enabled && var.finding_fingerprints.store == "dynamodb"
+  finding_fingerprints_environment = var.finding_fingerprints.enabled ? {
+    FINGERPRINT_STORE       = var.finding_fingerprints.store
+    FINGERPRINT_TABLE_NAME  = local.finding_fingerprints_table_enabled ? aws_dynamodb_table.finding_fingerprints[0].name : ""
+    FINGERPRINT_TTL_SECONDS = var.finding_fingerprints.ttl_seconds
+  } : {}
+
+  # Table of the worker's idempotency records, the sweep watermarks and the streaming checkpoints
+  worker_idempotency_table_name = var.findings_manager_worker_lambda.idempotency_enabled ? aws_dynamodb_table.findings_manager_worker_idempotency[0].name : ""
+
+  # Environment of the events Lambda when it routes the Jira eligible findings itself
+  jira_routing_environment = local.jira_lambda_routing_enabled ? {
+    JIRA_ELIGIBILITY_SETTINGS = jsonencode(local.jira_eligibility_settings)
+    JIRA_LAMBDA_NAME          = local.jira_queue_enabled ? "" : var.jira_integration.lambda_settings.name
+    JIRA_QUEUE_URL            = local.jira_queue_enabled ? aws_sqs_queue.jira_findings_q[0].url : ""
+  } : {}
+}
+
 data "aws_iam_policy_document" "findings_manager_lambda_iam_role" {
   statement {
     sid = "TrustEventsToStoreLogEvent"
@@ -12,12 +32,31 @@ data "aws_iam_policy_document" "findings_manager_lambda_iam_role" {
     ]
   }
 
+  dynamic "statement" {
+    for_each = var.observability.tracing_enabled ? { "XRayAccess" = true } : {}
+
+    content {
+      sid       = "XRayAccess"
+      actions   = ["xray:PutTelemetryRecords", "xray:PutTraceSegments"]
+      resources = ["*"]
+    }
+  }
+
   statement {
     sid       = "S3GetObjectAccess"
     actions   = ["s3:GetObject"]
     resources = ["${module.findings_manager_bucket.arn}/*"]
   }
 
+  statement {
+    sid     = "S3PutCompiledRules"
+    actions = ["s3:PutObject"]
+    resources = [
+      "${module.findings_manager_bucket.arn}/${var.rules_s3_object_name}.compiled.json",
+      "${module.findings_manager_bucket.arn}/${var.rules_s3_object_name}.manifest.json"
+    ]
+  }
+
   statement {
     sid       = "S3ListBucketObjects"
     actions   = ["s3:ListBucket"]
@@ -75,6 +114,56 @@ data "aws_iam_policy_document" "findings_manager_lambda_iam_role" {
     resources = [aws_sqs_queue.findings_manager_rule_q.arn]
   }
 
+  dynamic "statement" {
+    for_each = local.jira_lambda_routing_enabled && !local.jira_queue_enabled ? { "JiraLambdaInvokeAccess" = true } : {}
+
+    content {
+      sid       = "JiraLambdaInvokeAccess"
+      actions   = ["lambda:InvokeFunction"]
+      resources = [module.jira_lambda[0].arn]
+    }
+  }
+
+  dynamic "statement" {
+    for_each = local.jira_lambda_routing_enabled && local.jira_queue_enabled ? { "JiraQueueSendAccess" = true } : {}
+
+    content {
+      sid       = "JiraQueueSendAccess"
+      actions   = ["sqs:SendMessage"]
+      resources = [aws_sqs_queue.jira_findings_q[0].arn]
+    }
+  }
+
+  dynamic "statement" {
+    for_each = var.findings_manager_worker_lambda.idempotency_enabled ? { "LambdaDynamoDBIdempotencyAccess" = true } : {}
+
+    content {
+      sid = "LambdaDynamoDBIdempotencyAccess"
+      actions = [
+        "dynamodb:BatchGetItem",
+        "dynamodb:BatchWriteItem",
+        "dynamodb:DeleteItem",
+        "dynamodb:GetItem",
+        "dynamodb:PutItem"
+      ]
+      effect    = "Allow"
+      resources = [aws_dynamodb_table.findings_manager_worker_idempotency[0].arn]
+    }
+  }
+
+  dynamic "statement" {
+    for_each = local.finding_fingerprints_table_enabled ? { "LambdaDynamoDBFingerprintAccess" = true } : {}
+
+    content {
+      sid = "LambdaDynamoDBFingerprintAccess"
+      actions = [
+        "dynamodb:BatchGetItem",
+        "dynamodb:BatchWriteItem"
+      ]
+      effect    = "Allow"
+      resources = [aws_dynamodb_table.finding_fingerprints[0].arn]
+    }
+  }
 }
 
 # Push the Lambda code zip deployment package to s3
@@ -116,14 +205,16 @@ module "findings_manager_events_lambda" {
   subnet_ids                  = var.subnet_ids
   tags                        = var.tags
   timeout                     = var.findings_manager_events_lambda.timeout
+  tracing_config_mode         = local.tracing_config_mode
 
-  environment = {
+  environment = merge({
     S3_BUCKET_NAME              = module.findings_manager_bucket.name
     S3_OBJECT_NAME              = var.rules_s3_object_name
     LOG_LEVEL                   = var.findings_manager_events_lambda.log_level
     POWERTOOLS_LOGGER_LOG_EVENT = "false"
     POWERTOOLS_SERVICE_NAME     = "securityhub-findings-manager-events"
-  }
+    RULES_CACHE_TTL_SECONDS     = var.findings_manager_events_lambda.rules_cache_ttl_seconds
+  }, local.finding_fingerprints_environment, local.jira_routing_environment, local.observability_environment)
 
   execution_role = {
     create_policy = true
@@ -196,7 +287,7 @@ resource "aws_cloudwatch_event_rule" "securityhub_findings_resolved_events" {
 
 # Allow Eventbridge to invoke Security Hub Events Lambda function
 resource "aws_lambda_permission" "eventbridge_invoke_findings_manager_events_lambda" {
-  count = local.jira_integration_enabled ? 0 : 1
+  count = local.jira_step_function_enabled ? 0 : 1
 
   action        = "lambda:InvokeFunction"
   function_name = var.findings_manager_events_lambda.name
@@ -207,13 +298,32 @@ resource "aws_lambda_permission" "eventbridge_invoke_findings_manager_events_lam
 
 # Add Security Hub Events Lambda function as a target to the EventBridge rule
 resource "aws_cloudwatch_event_target" "findings_manager_events_lambda" {
-  count = local.jira_integration_enabled ? 0 : 1
+  count = local.jira_step_function_enabled ? 0 : 1
 
   arn    = module.findings_manager_events_lambda.arn
   region = var.region
   rule   = aws_cloudwatch_event_rule.securityhub_findings_events.name
 }
 
+# In lambda routing mode the events Lambda also receives the resolved findings, to close their Jira issues
+resource "aws_lambda_permission" "eventbridge_invoke_findings_manager_events_lambda_resolved" {
+  count = local.jira_lambda_routing_enabled && try(var.jira_integration.autoclose_enabled, false) ? 1 : 0
+
+  action        = "lambda:InvokeFunction"
+  function_name = var.findings_manager_events_lambda.name
+  principal     = "events.amazonaws.com"
+  region        = var.region
+  source_arn    = aws_cloudwatch_event_rule.securityhub_findings_resolved_events[0].arn
+}
+
+resource "aws_cloudwatch_event_target" "findings_manager_events_lambda_resolved" {
+  count = local.jira_lambda_routing_enabled && try(var.jira_integration.autoclose_enabled, false) ? 1 : 0
+
+  arn    = module.findings_manager_events_lambda.arn
+  region = var.region
+  rule   = aws_cloudwatch_event_rule.securityhub_findings_resolved_events[0].name
+}
+
 ################################################################################
 # Trigger Lambda
 ################################################################################
@@ -242,15 +352,23 @@ module "findings_manager_trigger_lambda" {
   subnet_ids                  = var.subnet_ids
   tags                        = var.tags
   timeout                     = var.findings_manager_trigger_lambda.timeout
+  tracing_config_mode         = local.tracing_config_mode
 
-  environment = {
+  environment = merge({
+    IDEMPOTENCY_TABLE_NAME      = local.worker_idempotency_table_name
     S3_BUCKET_NAME              = module.findings_manager_bucket.name
     S3_OBJECT_NAME              = var.rules_s3_object_name
     LOG_LEVEL                   = var.findings_manager_trigger_lambda.log_level
     SQS_QUEUE_NAME              = aws_sqs_queue.findings_manager_rule_q.name
+    SQS_RULES_PER_MESSAGE       = var.findings_manager_trigger_lambda.rules_per_message
+    SWEEP_CHANGED_RULES_ONLY    = var.findings_manager_trigger_lambda.sweep_changed_rules_only
+    SWEEP_SHARDS_ENABLED        = var.findings_manager_trigger_lambda.sweep_shards != null
+    SWEEP_SHARD_ACCOUNT_IDS     = join(",", try(var.findings_manager_trigger_lambda.sweep_shards.account_ids, []))
+    SWEEP_SHARD_REGIONS         = join(",", try(var.findings_manager_trigger_lambda.sweep_shards.regions, []))
+    UNSUPPRESS_REMOVED_RULES    = var.findings_manager_trigger_lambda.unsuppress_removed_rules
     POWERTOOLS_LOGGER_LOG_EVENT = "false"
     POWERTOOLS_SERVICE_NAME     = "securityhub-findings-manager-trigger"
-  }
+  }, local.observability_environment)
 
   execution_role = {
     create_policy = true
@@ -283,6 +401,35 @@ resource "aws_s3_bucket_notification" "findings_manager_trigger" {
   depends_on = [aws_lambda_permission.s3_invoke_findings_manager_trigger_lambda]
 }
 
+# Scheduled sweeps only fetch the findings updated since a rule was last swept
+resource "aws_cloudwatch_event_rule" "findings_manager_sweep" {
+  count = var.findings_manager_trigger_lambda.sweep_schedule_expression != null ? 1 : 0
+
+  name                = "rule-sweep-${var.findings_manager_trigger_lambda.name}"
+  description         = "EventBridge rule for scheduled incremental sweeps, triggering the findings manager trigger lambda."
+  region              = var.region
+  schedule_expression = var.findings_manager_trigger_lambda.sweep_schedule_expression
+  tags                = var.tags
+}
+
+resource "aws_lambda_permission" "eventbridge_invoke_findings_manager_trigger_lambda" {
+  count = var.findings_manager_trigger_lambda.sweep_schedule_expression != null ? 1 : 0
+
+  action        = "lambda:InvokeFunction"
+  function_name = var.findings_manager_trigger_lambda.name
+  principal     = "events.amazonaws.com"
+  region        = var.region
+  source_arn    = aws_cloudwatch_event_rule.findings_manager_sweep[0].arn
+}
+
+resource "aws_cloudwatch_event_target" "findings_manager_trigger_lambda" {
+  count = var.findings_manager_trigger_lambda.sweep_schedule_expression != null ? 1 : 0
+
+  arn    = module.findings_manager_trigger_lambda.arn
+  region = var.region
+  rule   = aws_cloudwatch_event_rule.findings_manager_sweep[0].name
+}
+
 ################################################################################
 # Worker Lambda
 ################################################################################
@@ -311,12 +458,18 @@ module "findings_manager_worker_lambda" {
   subnet_ids                  = var.subnet_ids
   tags                        = var.tags
   timeout                     = var.findings_manager_worker_lambda.timeout
+  tracing_config_mode         = local.tracing_config_mode
 
-  environment = {
+  environment = merge({
+    FULL_SWEEP_INTERVAL_SECONDS = var.findings_manager_trigger_lambda.full_sweep_interval_seconds
+    IDEMPOTENCY_TABLE_NAME      = local.worker_idempotency_table_name
+    IDEMPOTENCY_TTL_SECONDS     = var.findings_manager_worker_lambda.idempotency_ttl_seconds
     LOG_LEVEL                   = var.findings_manager_worker_lambda.log_level
     POWERTOOLS_LOGGER_LOG_EVENT = "false"
     POWERTOOLS_SERVICE_NAME     = "securityhub-findings-manager-worker"
-  }
+    SECURITYHUB_CONCURRENCY     = var.findings_manager_worker_lambda.maximum_concurrency
+    STREAM_FINDINGS             = var.findings_manager_worker_lambda.stream_findings
+  }, local.observability_environment)
 
   execution_role = {
     create_policy = true
@@ -324,6 +477,67 @@ module "findings_manager_worker_lambda" {
   }
 }
 
+# Rules applied by the worker Lambda, so redelivered SQS messages skip the rules that were already applied,
+# the sweep watermark of every rule and the streaming checkpoints of rules that are still being applied
+resource "aws_dynamodb_table" "findings_manager_worker_idempotency" {
+  count = var.findings_manager_worker_lambda.idempotency_enabled ? 1 : 0
+
+  name         = "${var.findings_manager_worker_lambda.name}-idempotency"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "id"
+  region       = var.region
+  tags         = var.tags
+
+  attribute {
+    name = "id"
+    type = "S"
+  }
+
+  point_in_time_recovery {
+    enabled = true
+  }
+
+  server_side_encryption {
+    enabled     = true
+    kms_key_arn = var.kms_key_arn
+  }
+
+  ttl {
+    attribute_name = "expiration"
+    enabled        = true
+  }
+}
+
+# Fingerprints of the findings processed by the events and Jira Lambdas, so unchanged re-imports are skipped
+resource "aws_dynamodb_table" "finding_fingerprints" {
+  count = local.finding_fingerprints_table_enabled ? 1 : 0
+
+  name         = "${var.findings_manager_events_lambda.name}-fingerprints"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "id"
+  region       = var.region
+  tags         = var.tags
+
+  attribute {
+    name = "id"
+    type = "S"
+  }
+
+  point_in_time_recovery {
+    enabled = true
+  }
+
+  server_side_encryption {
+    enabled     = true
+    kms_key_arn = var.kms_key_arn
+  }
+
+  ttl {
+    attribute_name = "expiration"
+    enabled        = true
+  }
+}
+
 # Upload rules list to S3
 resource "aws_s3_object" "rules" {
   count = var.rules_filepath == "" ? 0 : 1
@@ -405,10 +619,12 @@ resource "aws_lambda_event_source_mapping" "sqs_to_worker" {
   function_name    = module.findings_manager_worker_lambda.name
   # assumes a rule processing time of 30 sec average (which is high)
   batch_size                         = var.findings_manager_worker_lambda.timeout / 30
+  function_response_types            = ["ReportBatchItemFailures"]
   maximum_batching_window_in_seconds = 60
   region                             = var.region
 
   scaling_config {
-    maximum_concurrency = 4 #  to prevent Security Hub API rate limits
+    # The workers share the Security Hub API rate limits, their clients divide the documented rates by this number
+    maximum_concurrency = var.findings_manager_worker_lambda.maximum_concurrency
   }
 }
@@ -16,6 +16,30 @@ locals {
     for instance_key, instance in var.jira_integration.instances : instance.credentials_ssm_secret_arn
     if instance.enabled != false && instance.credentials_ssm_secret_arn != null && instance.credentials_ssm_secret_arn != "REDACTED"
   ] : []
+
+  # In queued mode the Jira eligible findings are buffered in SQS instead of invoking the Lambda
+  jira_queue_enabled = local.jira_integration_enabled && try(var.jira_integration.queue.enabled, false)
+
+  # Claims on the creation of the Jira issue of a finding, against duplicate issues from bursts of events
+  jira_issue_claims_enabled       = local.jira_integration_enabled && try(var.jira_integration.issue_claims.enabled, false)
+  jira_issue_claims_table_enabled = local.jira_issue_claims_enabled && var.jira_integration.issue_claims.store == "dynamodb"
+  jira_issue_claims_environment = local.jira_issue_claims_enabled ? {
+    JIRA_CLAIM_STORE       = var.jira_integration.issue_claims.store
+    JIRA_CLAIM_TABLE_NAME  = local.jira_issue_claims_table_enabled ? aws_dynamodb_table.jira_issue_claims[0].name : ""
+    JIRA_CLAIM_TTL_SECONDS = var.jira_integration.issue_claims.ttl_seconds
+  } : {}
+
+  # In lambda routing mode the events Lambda decides which findings go to Jira, without a Step Function
+  jira_lambda_routing_enabled = local.jira_integration_enabled && try(var.jira_integration.routing_mode, "step_function") == "lambda"
+  jira_step_function_enabled  = local.jira_integration_enabled && !local.jira_lambda_routing_enabled
+
+  # Settings of the Jira eligibility rules, shared by the Choice rule of the Step Function and the events Lambda
+  jira_eligibility_settings = local.jira_integration_enabled ? {
+    finding_severity_normalized       = var.jira_integration.finding_severity_normalized_threshold
+    include_product_names             = var.jira_integration.include_product_names
+    jira_autoclose_enabled            = var.jira_integration.autoclose_enabled
+    jira_autoclose_suppressed_enabled = var.jira_integration.autoclose_suppressed_findings
+  } : null
 }
 
 data "aws_iam_policy_document" "jira_lambda_iam_role" {
@@ -34,6 +58,16 @@ data "aws_iam_policy_document" "jira_lambda_iam_role" {
     ]
   }
 
+  dynamic "statement" {
+    for_each = var.observability.tracing_enabled ? { "XRayAccess" = true } : {}
+
+    content {
+      sid       = "XRayAccess"
+      actions   = ["xray:PutTelemetryRecords", "xray:PutTraceSegments"]
+      resources = ["*"]
+    }
+  }
+
   # Grant access to ALL SecretsManager secrets from all instances
   dynamic "statement" {
     for_each = length(local.jira_secretsmanager_arns) > 0 ? { "SecretManagerAccess" = true } : {}
@@ -75,6 +109,36 @@ data "aws_iam_policy_document" "jira_lambda_iam_role" {
     }
   }
 
+  dynamic "statement" {
+    for_each = local.finding_fingerprints_table_enabled ? { "DynamoDBFingerprintAccess" = true } : {}
+
+    content {
+      sid       = "DynamoDBFingerprintAccess"
+      actions   = ["dynamodb:BatchGetItem", "dynamodb:BatchWriteItem"]
+      resources = [aws_dynamodb_table.finding_fingerprints[0].arn]
+    }
+  }
+
+  dynamic "statement" {
+    for_each = local.jira_issue_claims_table_enabled ? { "DynamoDBIssueClaimAccess" = true } : {}
+
+    content {
+      sid       = "DynamoDBIssueClaimAccess"
+      actions   = ["dynamodb:DeleteItem", "dynamodb:PutItem"]
+      resources = [aws_dynamodb_table.jira_issue_claims[0].arn]
+    }
+  }
+
+  dynamic "statement" {
+    for_each = local.jira_queue_enabled ? { "SQSJiraQueueAccess" = true } : {}
+
+    content {
+      sid       = "SQSJiraQueueAccess"
+      actions   = ["sqs:ChangeMessageVisibility", "sqs:DeleteMessage", "sqs:GetQueueAttributes", "sqs:ReceiveMessage"]
+      resources = [aws_sqs_queue.jira_findings_q[0].arn]
+    }
+  }
+
   statement {
     sid = "LambdaKMSAccess"
     actions = [
@@ -129,8 +193,9 @@ module "jira_lambda" {
   subnet_ids                  = var.subnet_ids
   tags                        = var.tags
   timeout                     = var.jira_integration.lambda_settings.timeout
+  tracing_config_mode         = local.tracing_config_mode
 
-  environment = {
+  environment = merge({
     # Multi-instance configuration as JSON
     JIRA_INSTANCES_CONFIG = jsonencode(var.jira_integration.instances)
 
@@ -139,14 +204,118 @@ module "jira_lambda" {
     JIRA_AUTOCLOSE_COMMENT    = var.jira_integration.autoclose_comment
     JIRA_AUTOCLOSE_TRANSITION = var.jira_integration.autoclose_transition_name
 
+    # Bytes of an issue description at most, the full finding is attached when it does not fit
+    JIRA_ISSUE_DESCRIPTION_MAX_BYTES = var.jira_integration.issue_description_max_bytes
+
+    # Seconds the credentials and authenticated Jira client of an instance are reused across warm invocations
+    JIRA_CLIENT_CACHE_TTL_SECONDS = var.jira_integration.lambda_settings.client_cache_ttl_seconds
+
+    # Seconds the learned workflow transitions of a project and issue type are reused to autoclose issues
+    JIRA_TRANSITION_CACHE_TTL_SECONDS = var.jira_integration.lambda_settings.transition_cache_ttl_seconds
+
+    # Jira calls made to the same instance at the same time at most while processing a queued batch
+    JIRA_MAX_CONCURRENCY_PER_INSTANCE = var.jira_integration.queue.max_concurrency_per_instance
+
     # Logging settings
     LOG_LEVEL                   = var.jira_integration.lambda_settings.log_level
     POWERTOOLS_LOGGER_LOG_EVENT = "false"
     POWERTOOLS_SERVICE_NAME     = "securityhub-findings-manager-jira"
-  }
+  }, local.finding_fingerprints_environment, local.jira_issue_claims_environment, local.observability_environment)
 
   execution_role = {
     create_policy = true
     policy        = data.aws_iam_policy_document.jira_lambda_iam_role[0].json
   }
 }
+
+# Claims on the creation of Jira issues, a claim is a conditional write that expires through the TTL attribute
+resource "aws_dynamodb_table" "jira_issue_claims" {
+  count = local.jira_issue_claims_table_enabled ? 1 : 0
+
+  name         = "${var.jira_integration.lambda_settings.name}-issue-claims"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "id"
+  region       = var.region
+  tags         = var.tags
+
+  attribute {
+    name = "id"
+    type = "S"
+  }
+
+  point_in_time_recovery {
+    enabled = true
+  }
+
+  server_side_encryption {
+    enabled     = true
+    kms_key_arn = var.kms_key_arn
+  }
+
+  ttl {
+    attribute_name = "expiration"
+    enabled        = true
+  }
+}
+
+# SQS queue buffering the Jira eligible findings in queued mode, consumed in batches by the Jira Lambda
+resource "aws_sqs_queue" "jira_findings_q" {
+  count = local.jira_queue_enabled ? 1 : 0
+
+  name              = "SecurityHubFindingsManagerJiraQueue"
+  kms_master_key_id = var.kms_key_arn
+  region            = var.region
+  tags              = var.tags
+  # A batch throttled by Jira can take the whole Lambda timeout, the extra time covers the retries of the event source
+  visibility_timeout_seconds = var.jira_integration.lambda_settings.timeout * 6
+}
+
+resource "aws_sqs_queue" "dlq_for_jira_findings_q" {
+  count = local.jira_queue_enabled ? 1 : 0
+
+  name              = "DlqForSecurityHubFindingsManagerJiraQueue"
+  kms_master_key_id = var.kms_key_arn
+  region            = var.region
+  tags              = var.tags
+}
+
+resource "aws_sqs_queue_redrive_policy" "jira_findings_q" {
+  count = local.jira_queue_enabled ? 1 : 0
+
+  queue_url = aws_sqs_queue.jira_findings_q[0].id
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.dlq_for_jira_findings_q[0].arn
+    maxReceiveCount     = 10
+  })
+  region = var.region
+}
+
+resource "aws_sqs_queue_redrive_allow_policy" "dlq_for_jira_findings_q" {
+  count = local.jira_queue_enabled ? 1 : 0
+
+  queue_url = aws_sqs_queue.dlq_for_jira_findings_q[0].id
+
+  redrive_allow_policy = jsonencode({
+    redrivePermission = "byQueue",
+    sourceQueueArns   = [aws_sqs_queue.jira_findings_q[0].arn]
+  })
+  region = var.region
+}
+
+# The SQS queue with findings triggers the Jira lambda
+resource "aws_lambda_event_source_mapping" "sqs_to_jira" {
+  count = local.jira_queue_enabled ? 1 : 0
+
+  enabled                            = true
+  event_source_arn                   = aws_sqs_queue.jira_findings_q[0].arn
+  function_name                      = module.jira_lambda[0].name
+  batch_size                         = var.jira_integration.queue.batch_size
+  function_response_types            = ["ReportBatchItemFailures"]
+  maximum_batching_window_in_seconds = var.jira_integration.queue.maximum_batching_window_seconds
+  region                             = var.region
+
+  scaling_config {
+    # Together with the calls per instance of every invocation, this bounds the concurrent calls made to a Jira instance
+    maximum_concurrency = var.jira_integration.queue.maximum_concurrency
+  }
+}
@@ -4,7 +4,7 @@ locals {
 
 # IAM role to be assumed by Step Function
 module "jira_step_function_iam_role" {
-  count = local.jira_integration_enabled ? 1 : 0
+  count = local.jira_step_function_enabled ? 1 : 0
 
   source  = "schubergphilis/mcaf-role/aws"
   version = "~> 0.5.3"
@@ -18,7 +18,7 @@ module "jira_step_function_iam_role" {
 }
 
 data "aws_iam_policy_document" "jira_step_function_iam_role" {
-  count = local.jira_integration_enabled ? 1 : 0
+  count = local.jira_step_function_enabled ? 1 : 0
 
   statement {
     sid = "LambdaInvokeAccess"
@@ -31,6 +31,26 @@ data "aws_iam_policy_document" "jira_step_function_iam_role" {
     ]
   }
 
+  dynamic "statement" {
+    for_each = local.jira_queue_enabled ? { "SQSJiraQueueAccess" = true } : {}
+
+    content {
+      sid       = "SQSJiraQueueAccess"
+      actions   = ["sqs:SendMessage"]
+      resources = [aws_sqs_queue.jira_findings_q[0].arn]
+    }
+  }
+
+  dynamic "statement" {
+    for_each = local.jira_queue_enabled ? { "SQSJiraQueueKMSAccess" = true } : {}
+
+    content {
+      sid       = "SQSJiraQueueKMSAccess"
+      actions   = ["kms:Decrypt", "kms:GenerateDataKey*"]
+      resources = [var.kms_key_arn]
+    }
+  }
+
   statement {
     sid = "CloudWatchLogDeliveryResourcePolicyAccess"
     actions = [
@@ -62,7 +82,7 @@ data "aws_iam_policy_document" "jira_step_function_iam_role" {
 
 resource "aws_cloudwatch_log_group" "log_group_jira_orchestrator_sfn" {
   #checkov:skip=CKV_AWS_338:Ensure CloudWatch log groups retains logs for at least 1 year
-  count = local.jira_integration_enabled ? 1 : 0
+  count = local.jira_step_function_enabled ? 1 : 0
 
   name              = "/aws/sfn/${local.sfn_jira_orchestrator_name}"
   region            = var.region
@@ -74,7 +94,7 @@ resource "aws_cloudwatch_log_group" "log_group_jira_orchestrator_sfn" {
 resource "aws_sfn_state_machine" "jira_orchestrator" {
   #checkov:skip=CKV_AWS_284:x-ray is not enabled due to the simplicity of this state machine and the costs involved with enabling this feature.
   #checkov:skip=CKV_AWS_285:logging configuration is only supported for SFN type 'EXPRESS'.
-  count = local.jira_integration_enabled ? 1 : 0
+  count = local.jira_step_function_enabled ? 1 : 0
 
   name     = local.sfn_jira_orchestrator_name
   region   = var.region
@@ -82,12 +102,13 @@ resource "aws_sfn_state_machine" "jira_orchestrator" {
   tags     = var.tags
 
   definition = templatefile("${path.module}/files/step-function-artifacts/${local.sfn_jira_orchestrator_name}.json.tpl", {
-    finding_severity_normalized       = var.jira_integration.finding_severity_normalized_threshold
-    findings_manager_events_lambda    = module.findings_manager_events_lambda.arn
-    jira_autoclose_enabled            = var.jira_integration.autoclose_enabled
-    jira_autoclose_suppressed_enabled = var.jira_integration.autoclose_suppressed_findings
-    jira_lambda                       = module.jira_lambda[0].arn
-    include_product_names             = var.jira_integration.include_product_names
+    findings_manager_events_lambda = module.findings_manager_events_lambda.arn
+    jira_lambda                    = module.jira_lambda[0].arn
+    jira_queue_url                 = local.jira_queue_enabled ? aws_sqs_queue.jira_findings_q[0].url : ""
+
+    # Generated by files/lambda-artifacts/shared/jira_eligibility.py, which evaluates the same rule in-process
+    jira_eligibility_rule     = file("${path.module}/files/step-function-artifacts/jira-eligibility-rule.json")
+    jira_eligibility_settings = local.jira_eligibility_settings
   })
 
   logging_configuration {
@@ -99,7 +120,7 @@ resource "aws_sfn_state_machine" "jira_orchestrator" {
 
 # IAM role to be assumed by EventBridge
 module "jira_eventbridge_iam_role" {
-  count = local.jira_integration_enabled ? 1 : 0
+  count = local.jira_step_function_enabled ? 1 : 0
 
   source  = "schubergphilis/mcaf-role/aws"
   version = "~> 0.5.3"
@@ -113,7 +134,7 @@ module "jira_eventbridge_iam_role" {
 }
 
 data "aws_iam_policy_document" "jira_eventbridge_iam_role" {
-  count = local.jira_integration_enabled ? 1 : 0
+  count = local.jira_step_function_enabled ? 1 : 0
 
   statement {
     sid = "StepFunctionExecutionAccess"
@@ -127,7 +148,7 @@ data "aws_iam_policy_document" "jira_eventbridge_iam_role" {
 }
 
 resource "aws_cloudwatch_event_target" "jira_orchestrator" {
-  count = local.jira_integration_enabled ? 1 : 0
+  count = local.jira_step_function_enabled ? 1 : 0
 
   arn      = aws_sfn_state_machine.jira_orchestrator[0].arn
   region   = var.region
@@ -136,7 +157,7 @@ resource "aws_cloudwatch_event_target" "jira_orchestrator" {
 }
 
 resource "aws_cloudwatch_event_target" "jira_orchestrator_resolved" {
-  count = local.jira_integration_enabled && try(var.jira_integration.autoclose_enabled, false) ? 1 : 0
+  count = local.jira_step_function_enabled && try(var.jira_integration.autoclose_enabled, false) ? 1 : 0
 
   arn      = aws_sfn_state_machine.jira_orchestrator[0].arn
   region   = var.region
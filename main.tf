@@ -6,6 +6,17 @@ locals {
   # Also see https://docs.powertools.aws.dev/lambda/python/latest/#lambda-layer.
   # See https://docs.aws.amazon.com/powertools/python/latest/getting-started/install/ for the available layer versions.
   powertools_layer_arn = "arn:aws:lambda:${local.account_region}:017000801446:layer:AWSLambdaPowertoolsPythonV3-${replace(var.lambda_runtime, ".", "")}-x86_64:27"
+
+  # Environment of all Lambdas, configuring the Powertools metrics and tracer and the logging of payloads
+  observability_environment = {
+    PAYLOAD_LOG_MAX_LENGTH       = var.observability.payload_log_max_length
+    PAYLOAD_LOG_MODE             = var.observability.payload_log_mode
+    PAYLOAD_LOG_SAMPLE_RATE      = var.observability.payload_log_sample_rate
+    POWERTOOLS_METRICS_DISABLED  = !var.observability.metrics_enabled
+    POWERTOOLS_METRICS_NAMESPACE = var.observability.metrics_namespace
+    POWERTOOLS_TRACE_DISABLED    = !var.observability.tracing_enabled
+  }
+  tracing_config_mode = var.observability.tracing_enabled ? "Active" : null
 }
 
 # Data Source to get the access to Account ID in which Terraform is authorized and the region configured on the provider
@@ -166,6 +166,137 @@ run "jira_enabled" {
     condition     = length(aws_cloudwatch_event_target.jira_orchestrator_resolved) == 0
     error_message = "Resolved findings target should not exist when autoclose is disabled"
   }
+
+  assert {
+    condition     = length(aws_sqs_queue.jira_findings_q) == 0
+    error_message = "Jira queue should not exist when queued mode is disabled"
+  }
+}
+
+run "jira_queue" {
+  command = plan
+
+  variables {
+    kms_key_arn    = "arn:aws:kms:eu-west-1:111122223333:key/1234abcd-12ab-34cd-56ef-1234567890ab"
+    s3_bucket_name = "securityhub-findings-manager-jira-queue"
+    rules_filepath = "examples/rules.yaml"
+
+    jira_integration = {
+      instances = {
+        prod = {
+          include_account_ids            = ["123456789000"]
+          project_key                    = "SEC"
+          credentials_secretsmanager_arn = "arn:aws:secretsmanager:eu-west-1:123456789012:secret:jira-creds"
+        }
+      }
+
+      queue = {
+        enabled = true
+      }
+
+      security_group_egress_rules = [{
+        cidr_ipv4   = "0.0.0.0/0"
+        description = "Allow all outbound traffic"
+      }]
+    }
+  }
+
+  assert {
+    condition     = length(aws_sqs_queue.jira_findings_q) == 1 && length(aws_sqs_queue.dlq_for_jira_findings_q) == 1
+    error_message = "Jira queue and its DLQ should be created when queued mode is enabled"
+  }
+
+  assert {
+    condition     = length(aws_lambda_event_source_mapping.sqs_to_jira) == 1
+    error_message = "Jira queue should trigger the Jira lambda"
+  }
+
+  assert {
+    condition     = strcontains(aws_sfn_state_machine.jira_orchestrator[0].definition, "arn:aws:states:::sqs:sendMessage")
+    error_message = "Step Function should send the findings to the Jira queue"
+  }
+}
+
+run "jira_lambda_routing" {
+  command = plan
+
+  variables {
+    kms_key_arn    = "arn:aws:kms:eu-west-1:111122223333:key/1234abcd-12ab-34cd-56ef-1234567890ab"
+    s3_bucket_name = "securityhub-findings-manager-jira-lambda-routing"
+    rules_filepath = "examples/rules.yaml"
+
+    jira_integration = {
+      autoclose_enabled = true
+      routing_mode      = "lambda"
+
+      instances = {
+        prod = {
+          include_account_ids            = ["123456789000"]
+          project_key                    = "SEC"
+          credentials_secretsmanager_arn = "arn:aws:secretsmanager:eu-west-1:123456789012:secret:jira-creds"
+        }
+      }
+
+      security_group_egress_rules = [{
+        cidr_ipv4   = "0.0.0.0/0"
+        description = "Allow all outbound traffic"
+      }]
+    }
+  }
+
+  assert {
+    condition     = length(aws_sfn_state_machine.jira_orchestrator) == 0 && length(aws_cloudwatch_event_target.jira_orchestrator) == 0
+    error_message = "No Step Function should be created in lambda routing mode"
+  }
+
+  assert {
+    condition     = length(aws_cloudwatch_event_target.findings_manager_events_lambda) == 1 && length(aws_cloudwatch_event_target.findings_manager_events_lambda_resolved) == 1
+    error_message = "Both EventBridge rules should target the events lambda in lambda routing mode"
+  }
+
+  assert {
+    condition     = length(module.jira_lambda) == 1
+    error_message = "Jira lambda should be created in lambda routing mode"
+  }
+}
+
+run "jira_issue_claims" {
+  command = plan
+
+  variables {
+    kms_key_arn    = "arn:aws:kms:eu-west-1:111122223333:key/1234abcd-12ab-34cd-56ef-1234567890ab"
+    s3_bucket_name = "securityhub-findings-manager-jira-issue-claims"
+    rules_filepath = "examples/rules.yaml"
+
+    jira_integration = {
+      issue_claims = {
+        enabled = true
+      }
+
+      instances = {
+        prod = {
+          include_account_ids            = ["123456789000"]
+          project_key                    = "SEC"
+          credentials_secretsmanager_arn = "arn:aws:secretsmanager:eu-west-1:123456789012:secret:jira-creds"
+        }
+      }
+
+      security_group_egress_rules = [{
+        cidr_ipv4   = "0.0.0.0/0"
+        description = "Allow all outbound traffic"
+      }]
+    }
+  }
+
+  assert {
+    condition     = length(aws_dynamodb_table.jira_issue_claims) == 1
+    error_message = "Issue claims table should be created when issue claims are enabled"
+  }
+
+  assert {
+    condition     = strcontains(data.aws_iam_policy_document.jira_lambda_iam_role[0].json, "dynamodb:PutItem")
+    error_message = "Jira lambda should be allowed to take issue claims"
+  }
 }
 
 run "jira_multiple_instances" {
@@ -0,0 +1,69 @@
+"""Unit tests of the Lambda functions, run with "task test-lambdas", requires the Lambda requirements to be installed.
+
+The Lambdas import their modules from the root of their package, so the packages are put on the path like the build
+workflow zips them. The modules read their configuration at import time, so the environment is set up first.
+"""
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(os.path.dirname(TESTS_DIR))
+LAMBDA_ARTIFACTS_DIR = os.path.join(ROOT_DIR, "files", "lambda-artifacts")
+
+ENVIRONMENT = {
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_DEFAULT_REGION": "eu-west-1",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "EXCLUDE_ACCOUNT_FILTER": "[]",
+    "JIRA_INSTANCES_CONFIG": "{}",
+    "LOG_LEVEL": "ERROR",
+    "POWERTOOLS_METRICS_DISABLED": "true",
+    "POWERTOOLS_SERVICE_NAME": "securityhub-findings-manager-tests",
+    "S3_BUCKET_NAME": "securityhub-findings-manager-tests",
+    "S3_OBJECT_NAME": "rules.yaml",
+    "SQS_QUEUE_NAME": "SecurityHubFindingsManagerRuleQueue",
+}
+
+os.environ.update({key: os.environ.get(key, value) for key, value in ENVIRONMENT.items()})
+sys.path[:0] = [os.path.join(ROOT_DIR, "benchmarks")] + [
+    os.path.join(LAMBDA_ARTIFACTS_DIR, name) for name in ("securityhub-findings-manager", "findings-manager-jira", "shared")
+]
+
+from fake_aws import FakeAws  # noqa: E402
+from jira_stub import JiraStub  # noqa: E402
+
+FAKE_AWS = FakeAws()
+FAKE_AWS.install()
+
+
+class LambdaContext:
+    function_name = "securityhub-findings-manager-tests"
+    memory_limit_in_mb = 256
+    invoked_function_arn = "arn:aws:lambda:eu-west-1:100000000000:function:securityhub-findings-manager-tests"
+    aws_request_id = "tests"
+
+    @staticmethod
+    def get_remaining_time_in_millis() -> int:
+        return 60000
+
+
+@pytest.fixture
+def fake_aws() -> FakeAws:
+    """The in-memory stand-in for AWS of the benchmarks, every client of the default boto3 session uses it."""
+    FAKE_AWS.reset()
+    return FAKE_AWS
+
+
+@pytest.fixture(scope="session")
+def jira_server() -> JiraStub:
+    with JiraStub() as jira:
+        yield jira
+
+
+@pytest.fixture
+def jira(jira_server) -> JiraStub:
+    """The local stand-in for the Jira REST API of the benchmarks, emptied for every test."""
+    jira_server.reset()
+    return jira_server
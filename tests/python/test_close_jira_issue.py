@@ -0,0 +1,49 @@
+import jira_stub
+import pytest
+
+import helpers
+
+SECRET_ARN = "arn:aws:secretsmanager:eu-west-1:100000000000:secret:jira-tests"
+INSTANCE = {"credentials_secretsmanager_arn": SECRET_ARN, "project_key": "SEC"}
+
+
+@pytest.fixture
+def jira_client(fake_aws, jira):
+    helpers._jira_clients.clear()
+    helpers._transition_graphs.clear()
+    fake_aws.put_secret(SECRET_ARN, {"url": jira.url, "apiuser": "tests", "apikey": "tests"})
+    return helpers.get_instance_jira_client("tests", INSTANCE)
+
+
+def close(jira_client, key: str):
+    issue = jira_client.issue(key, fields=helpers.CLOSE_ISSUE_FIELDS)
+    helpers.close_jira_issue(jira_client, issue, "Done", "Resolved.", "Review", "tests")
+
+
+def test_a_warm_close_takes_its_transitions_from_the_cached_graph(jira, jira_client):
+    close(jira_client, jira.create_issue())
+    jira.calls.clear()
+    close(jira_client, jira.create_issue())
+    assert jira.issues["SEC-2"]["fields"]["status"]["name"] == "Done"
+    assert jira.calls["GET /rest/api/2/issue/{key}/transitions"] == 0
+
+
+def test_a_close_retries_with_live_transitions_after_the_workflow_changed(jira, jira_client, monkeypatch):
+    close(jira_client, jira.create_issue())
+    # The workflow is edited, its transitions get new ids
+    monkeypatch.setattr(jira_stub, "TRANSITIONS", {
+        "1": [{"id": "121", "name": "Review", "to": "3"}],
+        "3": [{"id": "131", "name": "Done", "to": "6"}],
+        "6": [],
+    })
+    jira.calls.clear()
+    close(jira_client, jira.create_issue())
+    assert jira.issues["SEC-2"]["fields"]["status"]["name"] == "Done"
+    assert jira.calls["GET /rest/api/2/issue/{key}/transitions"] == 2
+    assert jira.calls["POST /rest/api/2/issue/{key}/comment"] == 1
+    # The graph learned the new transitions
+    jira.calls.clear()
+    close(jira_client, jira.create_issue())
+    assert jira.issues["SEC-3"]["fields"]["status"]["name"] == "Done"
+    assert jira.calls["GET /rest/api/2/issue/{key}/transitions"] == 0
+
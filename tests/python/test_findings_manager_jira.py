@@ -0,0 +1,95 @@
+import json
+import logging
+import random
+
+import pytest
+import requests
+from conftest import LambdaContext
+from jira.exceptions import JIRAError
+
+import finding_fingerprint
+import findings_manager_jira
+import helpers
+import issue_claims
+import synthetic
+
+LOGGER = logging.getLogger(__name__)
+SECRET_ARN = "arn:aws:secretsmanager:eu-west-1:100000000000:secret:jira-tests"
+INSTANCES = {"tests": {"default_instance": True, "credentials_secretsmanager_arn": SECRET_ARN, "project_key": "SEC",
+                       "include_intermediate_transition": "Review"}}
+
+
+@pytest.fixture(autouse=True)
+def jira_lambda(fake_aws, jira):
+    """A cold Jira Lambda container, remembering fingerprints in memory, with a single Jira instance."""
+    helpers._jira_clients.clear()
+    helpers._transition_graphs.clear()
+    helpers._jira_resume_at.clear()
+    issue_claims._store = None
+    finding_fingerprint._STORE = finding_fingerprint.InMemoryFingerprintStore()
+    findings_manager_jira._jira_routing = helpers.build_jira_routing(INSTANCES, [])
+    fake_aws.put_secret(SECRET_ARN, {"url": jira.url, "apiuser": "tests", "apikey": "tests"})
+    yield
+    finding_fingerprint._STORE = None
+    findings_manager_jira._jira_routing = None
+
+
+def finding(workflow: str = "NEW", note: dict = None) -> dict:
+    finding = synthetic.generate_finding(1, 1, random.Random(0), workflow)
+    if note:
+        finding["Note"] = {"Text": json.dumps(note), "UpdatedBy": "tests", "UpdatedAt": finding["UpdatedAt"]}
+    return finding
+
+
+def invoke(*findings: dict):
+    return findings_manager_jira.lambda_handler({"detail": {"findings": list(findings)}}, LambdaContext())
+
+
+def remembered(finding: dict) -> bool:
+    return bool(finding_fingerprint.unchanged_findings(findings_manager_jira.FINGERPRINT_SCOPE, [finding], None))
+
+
+def test_creates_the_issue_of_a_new_finding_and_remembers_it(jira):
+    new = finding()
+    invoke(new)
+    assert list(jira.issues) == ["SEC-1"]
+    assert remembered(new)
+
+
+def test_closes_the_issue_of_a_resolved_finding_and_remembers_it(jira):
+    resolved = finding("RESOLVED", {"jiraIssue": jira.create_issue(), "jiraInstance": "tests"})
+    invoke(resolved)
+    assert jira.issues["SEC-1"]["fields"]["status"]["name"] == "Done"
+    assert remembered(resolved)
+
+
+def test_a_failed_close_is_not_remembered_so_the_next_event_retries_it(jira):
+    # The issue does not exist (yet), so Jira answers with a 404
+    resolved = finding("RESOLVED", {"jiraIssue": "SEC-1", "jiraInstance": "tests"})
+    invoke(resolved)
+    assert not remembered(resolved)
+
+    jira.create_issue()
+    invoke(resolved)
+    assert jira.issues["SEC-1"]["fields"]["status"]["name"] == "Done"
+    assert remembered(resolved)
+
+
+@pytest.mark.parametrize("error, released", [
+    (JIRAError("Bad request", status_code=400), True),
+    (JIRAError("Service unavailable", status_code=503), False),
+    (requests.exceptions.ReadTimeout("Read timed out"), False),
+])
+def test_a_failed_bulk_create_only_releases_its_claims_when_jira_rejected_it(monkeypatch, error, released):
+    def create_jira_issues(jira_client, field_list):
+        raise error
+
+    issue_claims._store = issue_claims.InMemoryClaimStore()
+    monkeypatch.setattr(issue_claims, "JIRA_CLAIM_STORE", "memory")
+    monkeypatch.setattr(helpers, "create_jira_issues", create_jira_issues)
+    new = finding()
+    message = ("message-1", new, {"findings": [new]})
+    results = findings_manager_jira.create_queued_issues("tests", INSTANCES["tests"], [message])
+    assert results == [(message, False)]
+    # A released claim lets the retry of the message create the issue
+    assert issue_claims.claim_issue(new, LOGGER) == released
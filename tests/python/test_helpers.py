@@ -0,0 +1,73 @@
+import pytest
+from jira.exceptions import JIRAError
+
+import helpers
+
+PROD = {"include_account_ids": ["111111111111"], "project_key": "PROD"}
+TEAM = {"include_account_ids": ["111111111111", "222222222222"], "project_key": "TEAM"}
+DEFAULT = {"default_instance": True, "project_key": "DEFAULT"}
+OTHER_DEFAULT = {"default_instance": True, "project_key": "OTHER"}
+SECRET_ARN = "arn:aws:secretsmanager:eu-west-1:100000000000:secret:jira-tests"
+INSTANCE = {"credentials_secretsmanager_arn": SECRET_ARN, "project_key": "SEC"}
+
+
+def test_routes_accounts_to_their_instance_or_the_default_instance():
+    routing = helpers.build_jira_routing({"prod": PROD, "default": DEFAULT}, [])
+    assert helpers.find_instance_for_account("111111111111", routing) == ("prod", PROD)
+    assert helpers.find_instance_for_account("333333333333", routing) == ("default", DEFAULT)
+    assert helpers.find_instance_for_account("333333333333", helpers.build_jira_routing({"prod": PROD}, [])) == (None, None)
+
+
+def test_skips_disabled_instances():
+    routing = helpers.build_jira_routing({"prod": {**PROD, "enabled": False}, "default": DEFAULT}, [])
+    assert helpers.find_instance_for_account("111111111111", routing) == ("default", DEFAULT)
+
+
+def test_an_account_of_several_instances_goes_to_the_first():
+    routing = helpers.build_jira_routing({"prod": PROD, "team": TEAM}, [])
+    assert helpers.find_instance_for_account("111111111111", routing) == ("prod", PROD)
+    assert helpers.find_instance_for_account("222222222222", routing) == ("team", TEAM)
+
+
+def test_the_first_of_several_default_instances_is_the_default():
+    routing = helpers.build_jira_routing({"default": DEFAULT, "other": OTHER_DEFAULT}, [])
+    assert routing.default_instance_name == "default"
+
+
+def test_an_excluded_account_stays_excluded():
+    routing = helpers.build_jira_routing({"prod": PROD, "default": DEFAULT}, ["111111111111"])
+    assert "111111111111" in routing.excluded_account_ids
+
+
+@pytest.fixture
+def rejected_credentials(fake_aws, jira):
+    """A function that Jira rejects the credentials of, recording the clients it was called with."""
+    helpers._jira_clients.clear()
+    fake_aws.put_secret(SECRET_ARN, {"url": jira.url, "apiuser": "tests", "apikey": "tests"})
+    clients = []
+
+    def func(jira_client):
+        clients.append(jira_client)
+        raise JIRAError("Unauthorized", status_code=401)
+
+    func.clients = clients
+    return func
+
+
+def test_retries_a_rejected_cached_client_with_a_new_client(rejected_credentials):
+    cached = helpers.get_instance_jira_client("tests", INSTANCE)
+    with pytest.raises(JIRAError):
+        helpers.call_with_instance_jira_client("tests", INSTANCE, rejected_credentials)
+    assert len(rejected_credentials.clients) == 2
+    assert rejected_credentials.clients[0] is cached and rejected_credentials.clients[1] is not cached
+
+
+@pytest.mark.parametrize("cache", ["empty", "expired"])
+def test_does_not_retry_a_rejected_new_client(rejected_credentials, cache):
+    if cache == "expired":
+        helpers.get_instance_jira_client("tests", INSTANCE)
+        helpers._jira_clients["tests"]["created_at"] -= helpers.JIRA_CLIENT_CACHE_TTL_SECONDS
+    with pytest.raises(JIRAError):
+        helpers.call_with_instance_jira_client("tests", INSTANCE, rejected_credentials)
+    assert len(rejected_credentials.clients) == 1
+    assert "tests" not in helpers._jira_clients
@@ -0,0 +1,59 @@
+import logging
+
+import pytest
+
+import issue_claims
+from issue_claims import DynamoDBClaimStore, InMemoryClaimStore
+
+LOGGER = logging.getLogger(__name__)
+FINDING = {"Id": "finding-1", "ProductArn": "arn:aws:securityhub:eu-west-1::product/aws/securityhub"}
+
+
+@pytest.fixture(params=["memory", "dynamodb"])
+def store(request, fake_aws):
+    return InMemoryClaimStore() if request.param == "memory" else DynamoDBClaimStore("jira-claims")
+
+
+def test_only_one_owner_holds_a_claim(store):
+    assert store.claim("key", "first", 60)
+    assert not store.claim("key", "second", 60)
+    assert not store.claim("key", "first", 60)
+    assert store.claim("other key", "second", 60)
+
+
+def test_only_the_owner_releases_its_claim(store):
+    store.claim("key", "first", 60)
+    store.release("key", "second")
+    assert not store.claim("key", "second", 60)
+    store.release("key", "first")
+    assert store.claim("key", "second", 60)
+
+
+def test_an_expired_claim_can_be_claimed_again(store):
+    assert store.claim("key", "first", 0)
+    assert store.claim("key", "second", 60)
+
+
+class FailingClaimStore(InMemoryClaimStore):
+    def claim(self, key: str, owner: str, ttl_seconds: int) -> bool:
+        raise RuntimeError("unavailable")
+
+    def release(self, key: str, owner: str):
+        raise RuntimeError("unavailable")
+
+
+@pytest.mark.parametrize("store", [None, FailingClaimStore()])
+def test_findings_are_claimed_when_the_claims_are_disabled_or_failing(monkeypatch, store):
+    monkeypatch.setattr(issue_claims, "get_claim_store", lambda: store)
+    assert issue_claims.claim_issue(FINDING, LOGGER)
+    assert issue_claims.claim_issue(FINDING, LOGGER)
+    issue_claims.release_issue_claim(FINDING, LOGGER)
+
+
+def test_a_released_finding_can_be_claimed_again(monkeypatch):
+    monkeypatch.setattr(issue_claims, "_store", InMemoryClaimStore())
+    monkeypatch.setattr(issue_claims, "JIRA_CLAIM_STORE", "memory")
+    assert issue_claims.claim_issue(FINDING, LOGGER)
+    assert not issue_claims.claim_issue(FINDING, LOGGER)
+    issue_claims.release_issue_claim(FINDING, LOGGER)
+    assert issue_claims.claim_issue(FINDING, LOGGER)
@@ -0,0 +1,35 @@
+import gzip
+import json
+import random
+
+import pytest
+
+import synthetic
+from issue_rendering import render_issue
+
+
+def event(vulnerabilities: int = 0, description: str = "Public access.") -> dict:
+    finding = synthetic.generate_finding(1, 1, random.Random(0))
+    finding["Description"] = description
+    return {"findings": [synthetic.add_vulnerabilities(finding, vulnerabilities) if vulnerabilities else finding]}
+
+
+@pytest.mark.parametrize("max_bytes", [2048, 4096, 16384, 32767])
+@pytest.mark.parametrize("vulnerabilities", [0, 5, 50, 500])
+@pytest.mark.parametrize("description", ["Public access.", "Öffentlicher Zugriff ✓ " * 40])
+def test_the_description_stays_within_its_budget(max_bytes, vulnerabilities, description):
+    rendered = render_issue(event(vulnerabilities, description), max_bytes)
+    assert len(rendered.description.encode("utf-8")) <= max_bytes
+
+
+def test_a_small_event_is_rendered_in_full():
+    rendered = render_issue(event(), 16384)
+    assert rendered.attachment is None
+    assert '"Id": "arn:aws:securityhub:' in rendered.description.split("Full finding:")[1]
+
+
+def test_a_large_event_is_attached_in_full():
+    large = event(500)
+    rendered = render_issue(large, 16384)
+    assert "The full finding is attached as finding.json.gz." in rendered.description
+    assert json.loads(gzip.decompress(rendered.attachment)) == large
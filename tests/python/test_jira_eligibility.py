@@ -0,0 +1,98 @@
+import json
+from itertools import product
+
+import pytest
+
+from jira_eligibility import (
+    RULE_PATH, EligibilitySettings, MissingPath, evaluate, is_new_finding, is_resolved_finding, jira_action, map_item,
+    render_rule
+)
+
+NOTE = '{"jiraIssue": "SEC-1", "jiraInstance": "prod"}'
+DEFAULT = EligibilitySettings()
+AUTOCLOSE = EligibilitySettings(jira_autoclose_enabled=True)
+AUTOCLOSE_SUPPRESSED = EligibilitySettings(jira_autoclose_enabled=True, jira_autoclose_suppressed_enabled=True)
+SECURITY_HUB_ONLY = EligibilitySettings(include_product_names=("Security Hub",))
+
+
+def finding(workflow="NEW", record="ACTIVE", severity=90, compliance="FAILED", note=None, product_name="Security Hub"):
+    finding = {"Id": "finding", "Workflow": {"Status": workflow}, "RecordState": record,
+               "Severity": {"Normalized": severity}, "ProductName": product_name}
+    if compliance:
+        finding["Compliance"] = {"Status": compliance}
+    if note:
+        finding["Note"] = {"Text": note}
+    return finding
+
+
+# The decisions of the Jira integration, as documented in the README
+DECISIONS = [
+    (finding(), DEFAULT, False, "create"),
+    (finding(compliance=None), DEFAULT, False, "create"),
+    (finding(compliance="WARNING"), DEFAULT, False, "create"),
+    (finding(severity=70), DEFAULT, False, "create"),
+    (finding(severity=69), DEFAULT, False, None),
+    (finding(), EligibilitySettings(finding_severity_normalized=95), False, None),
+    (finding(compliance="PASSED"), DEFAULT, False, None),
+    (finding(compliance="NOT_AVAILABLE"), DEFAULT, False, None),
+    (finding(record="ARCHIVED"), DEFAULT, False, None),
+    (finding(), DEFAULT, True, None),
+    (finding(note=NOTE), DEFAULT, False, None),
+    (finding(note='{"jiraClosedIssue": "SEC-1"}'), DEFAULT, False, "create"),
+    (finding(), SECURITY_HUB_ONLY, False, "create"),
+    (finding(product_name="Inspector"), SECURITY_HUB_ONLY, False, None),
+    (finding("RESOLVED", note=NOTE), DEFAULT, False, None),
+    (finding("RESOLVED", note=NOTE), AUTOCLOSE, False, "close"),
+    (finding("RESOLVED", note=NOTE, severity=0), AUTOCLOSE, False, "close"),
+    (finding("RESOLVED"), AUTOCLOSE, False, None),
+    (finding("RESOLVED", note=NOTE), AUTOCLOSE, True, None),
+    (finding("SUPPRESSED", note=NOTE), AUTOCLOSE, False, None),
+    (finding("SUPPRESSED", note=NOTE), AUTOCLOSE_SUPPRESSED, False, "close"),
+    (finding("NOTIFIED", note=NOTE), AUTOCLOSE, False, None),
+    (finding("NOTIFIED", note=NOTE, compliance="PASSED"), AUTOCLOSE, False, "close"),
+    (finding("NOTIFIED", note=NOTE, compliance="NOT_AVAILABLE"), AUTOCLOSE, False, "close"),
+    (finding("NOTIFIED", note=NOTE, compliance=None), AUTOCLOSE, False, None),
+    (finding("NOTIFIED", note=NOTE, record="ARCHIVED", compliance=None), AUTOCLOSE, False, "close"),
+    (finding("RESOLVED", note=NOTE, product_name="Inspector"), EligibilitySettings(
+        include_product_names=("Security Hub",), jira_autoclose_enabled=True), False, None),
+]
+
+
+def step_function_rule() -> dict:
+    # The rule as the Choice state of the Step Function uses it
+    with open(RULE_PATH) as file:
+        return json.load(file)
+
+
+def test_generated_rule_is_up_to_date():
+    with open(RULE_PATH) as file:
+        assert file.read() == render_rule(), "Run files/lambda-artifacts/shared/jira_eligibility.py to regenerate it."
+
+
+@pytest.mark.parametrize("finding, settings, suppressed, action", DECISIONS)
+def test_decisions(finding, settings, suppressed, action):
+    assert jira_action(finding, settings, suppressed) == action
+    assert evaluate(step_function_rule(), map_item(finding, settings, suppressed)) == (action is not None)
+
+
+@pytest.mark.parametrize("settings", [DEFAULT, AUTOCLOSE, AUTOCLOSE_SUPPRESSED, SECURITY_HUB_ONLY])
+def test_choice_state_never_fails_on_missing_fields(settings):
+    rule = step_function_rule()
+    for workflow, record, compliance, note, suppressed in product(
+        ("NEW", "NOTIFIED", "RESOLVED", "SUPPRESSED"), ("ACTIVE", "ARCHIVED"),
+        (None, "FAILED", "WARNING", "PASSED", "NOT_AVAILABLE"), (None, NOTE), (False, True)
+    ):
+        item = map_item(finding(workflow, record, compliance=compliance, note=note), settings, suppressed)
+        try:
+            decision = evaluate(rule, item)
+        except MissingPath as e:
+            pytest.fail(f"The Choice state fails on the missing {e} of {json.dumps(item)}")
+        assert decision == (jira_action(item["detail"]["findings"][0], settings, suppressed) is not None)
+
+
+def test_jira_lambda_states():
+    assert is_new_finding(finding(severity=0))
+    assert not is_new_finding(finding(compliance="PASSED"))
+    assert is_resolved_finding(finding("SUPPRESSED"))
+    assert is_resolved_finding(finding("NOTIFIED", compliance="PASSED"))
+    assert not is_resolved_finding(finding("NOTIFIED"))
@@ -0,0 +1,13 @@
+import pytest
+
+from jira_router import MAX_PAYLOAD_BYTES, SQS_MAX_BATCH_ENTRIES, _batches
+
+
+@pytest.mark.parametrize("body_bytes", [10, 30 * 1024, 240 * 1024])
+def test_batches_every_finding_once_within_the_batch_limits(body_bytes):
+    bodies = [f"{number:04d}".ljust(body_bytes, "x") for number in range(35)]
+    batches = _batches(bodies, SQS_MAX_BATCH_ENTRIES)
+    assert [body for batch in batches for body in batch] == bodies
+    for batch in batches:
+        assert len(batch) <= SQS_MAX_BATCH_ENTRIES
+        assert sum(len(body.encode()) for body in batch) <= MAX_PAYLOAD_BYTES
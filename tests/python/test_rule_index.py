@@ -0,0 +1,33 @@
+from awsfindingsmanagerlib import Finding, Rule
+
+import synthetic
+from rule_index import RuleIndex
+
+
+def rules() -> list:
+    # The synthetic rules mix security control ids with resource, region and tag filters
+    rules = synthetic.generate_rules(40, seed=1)
+    rules += [
+        {"note": "rule or control id", "action": "SUPPRESSED", "match_on": {"rule_or_control_id": synthetic.control_id(3)}},
+        {"note": "rule or control id in a region", "action": "SUPPRESSED",
+         "match_on": {"rule_or_control_id": synthetic.control_id(5), "regions": ["eu-west-1"]}},
+        {"note": "product", "action": "SUPPRESSED", "match_on": {"product_name": synthetic.PRODUCT_NAME,
+                                                                  "resource_id_regexps": ["^arn:aws:s3:::bucket-1.*$"]}},
+        {"note": "title", "action": "SUPPRESSED", "match_on": {"title": f"Benchmark control {synthetic.control_id(7)}"}},
+        {"note": "shadowed", "action": "SUPPRESSED", "match_on": {"security_control_id": synthetic.control_id(3)}},
+    ]
+    return [Rule(**rule) for rule in rules]
+
+
+def test_matching_rules_agrees_with_is_matching_rule():
+    registered = rules()
+    index = RuleIndex(registered)
+    matched = 0
+    for data in synthetic.generate_findings(500, 40, seed=2):
+        finding = Finding(data)
+        expected = [rule for rule in registered if finding.is_matching_rule(rule)]
+        assert list(index.matching_rules(finding)) == expected, finding.id
+        assert index.match(finding) == (expected[0] if expected else None)
+        matched += bool(expected)
+    # Both matching and non matching findings are compared
+    assert 0 < matched < 500
@@ -0,0 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import securityhub_client
+
+
+def test_counts_the_calls_of_concurrent_callers(fake_aws):
+    securityhub_client._CLIENTS.clear()
+    securityhub = securityhub_client.get_client("eu-west-1")
+    before = securityhub_client.securityhub_client_stats()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: securityhub.list_finding_aggregators(), range(40)))
+    after = securityhub_client.securityhub_client_stats()
+    assert after["calls"] - before["calls"] == 40 == fake_aws.calls["securityhub:ListFindingAggregators"]
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+import yaml
+from conftest import LambdaContext
+
+import securityhub_trigger
+import strategize_findings_manager
+from securityhub_trigger import SQS_MAX_BATCH_ENTRIES, SQS_MAX_PAYLOAD_BYTES, batch_messages, bundle_rules
+from strategize_findings_manager import S3_BUCKET_NAME, S3_MANIFEST_OBJECT_NAME, S3_OBJECT_NAME
+
+DEPLOY_EVENT = {"Records": [{"s3": {"bucket": {"name": S3_BUCKET_NAME}, "object": {"key": S3_OBJECT_NAME}}}]}
+
+
+def rule(number: int, note_bytes: int = 100) -> dict:
+    note = f"rule {number} ".ljust(note_bytes, "x")
+    return {"note": note, "action": "SUPPRESSED", "match_on": {"security_control_id": f"S3.{number}"}}
+
+
+def unbundled(bodies: list) -> tuple:
+    messages = [json.loads(body) for body in bodies]
+    return ([rule for message in messages for rule in message["rules"]],
+            [since for message in messages for since in message["updated_since"]],
+            [shard for message in messages for shard in message["shards"]])
+
+
+@pytest.mark.parametrize("rules_per_message", [1, 3, 1000])
+@pytest.mark.parametrize("note_bytes", [100, 70 * 1024])
+def test_bundles_every_rule_once_within_the_message_limits(monkeypatch, rules_per_message, note_bytes):
+    monkeypatch.setattr(securityhub_trigger, "SQS_RULES_PER_MESSAGE", rules_per_message)
+    rules = [rule(number, note_bytes) for number in range(25)]
+    updated_since = [None if number % 2 else "2024-01-01T00:00:00.000Z" for number in range(25)]
+    shards = [{"Region": [{"Value": "eu-west-1", "Comparison": "EQUALS"}]} if number % 3 else None for number in range(25)]
+    bodies = bundle_rules(rules, "version", "sweep", updated_since, shards)
+    assert unbundled(bodies) == (rules, updated_since, shards)
+    for body in bodies:
+        assert len(json.loads(body)["rules"]) <= rules_per_message
+        assert len(body.encode()) <= SQS_MAX_PAYLOAD_BYTES
+
+
+def test_a_bundle_fills_the_message_up_to_the_payload_limit(monkeypatch):
+    monkeypatch.setattr(securityhub_trigger, "SQS_RULES_PER_MESSAGE", 1000)
+    bodies = bundle_rules([rule(number, 1024) for number in range(1000)])
+    assert len(bodies) > 1
+    # Adding the first rule of the next message would have exceeded the limit
+    for body, next_body in zip(bodies, bodies[1:]):
+        assert len(body.encode()) + len(json.dumps(json.loads(next_body)["rules"][0]).encode()) > SQS_MAX_PAYLOAD_BYTES
+
+
+@pytest.mark.parametrize("body_bytes", [10, 30 * 1024, 100 * 1024, SQS_MAX_PAYLOAD_BYTES])
+def test_batches_every_message_once_within_the_batch_limits(body_bytes):
+    bodies = [f"{number:04d}".ljust(body_bytes, "x") for number in range(35)]
+    batches = batch_messages(bodies)
+    assert [entry["MessageBody"] for batch in batches for entry in batch] == bodies
+    for batch in batches:
+        assert len(batch) <= SQS_MAX_BATCH_ENTRIES
+        assert sum(len(entry["MessageBody"].encode()) for entry in batch) <= SQS_MAX_PAYLOAD_BYTES
+        # Entry ids only have to be unique within a batch
+        assert [entry["Id"] for entry in batch] == [str(index) for index in range(len(batch))]
+
+
+@pytest.fixture
+def trigger(fake_aws):
+    strategize_findings_manager._RULES_CACHE.update(etag=None, findings_manager=None, validated_at=0.0)
+    strategize_findings_manager._S3_CLIENT = None
+    return fake_aws
+
+
+def deploy(fake_aws, rules: list) -> list:
+    """Uploads the rules object and runs the trigger Lambda, returns the sorted notes of the rules it put on SQS."""
+    fake_aws.put_object(S3_BUCKET_NAME, S3_OBJECT_NAME, yaml.safe_dump({"Rules": rules}).encode())
+    securityhub_trigger.lambda_handler(DEPLOY_EVENT, LambdaContext())
+    rules, _, _ = unbundled([message["body"] for message in fake_aws.pop_messages()])
+    # Batches are sent concurrently, so the messages are not in the order of the rules
+    return sorted(rule["note"] for rule in rules)
+
+
+def test_a_deploy_only_sweeps_the_rules_added_or_changed_since_the_previous_deploy(trigger):
+    rules = [rule(number) for number in range(3)]
+    assert deploy(trigger, rules) == [rule["note"] for rule in rules]
+    assert deploy(trigger, rules) == []
+    rules[1]["match_on"]["regions"] = ["eu-west-1"]
+    assert deploy(trigger, rules + [rule(3)]) == [rules[1]["note"], rule(3)["note"]]
+
+
+def test_a_deploy_after_a_manifest_without_rule_hashes_sweeps_all_rules(trigger):
+    rules = [rule(number) for number in range(2)]
+    trigger.put_object(S3_BUCKET_NAME, S3_MANIFEST_OBJECT_NAME, json.dumps({"rules": rules}).encode())
+    assert len(deploy(trigger, rules)) == 2
+
+
+def test_a_deploy_sweeps_all_rules_unless_only_changed_rules_are_swept(trigger, monkeypatch):
+    monkeypatch.setattr(securityhub_trigger, "SWEEP_CHANGED_RULES_ONLY", False)
+    rules = [rule(number) for number in range(2)]
+    deploy(trigger, rules)
+    assert len(deploy(trigger, rules)) == 2
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+from conftest import LambdaContext
+
+import idempotency_store
+import securityhub_trigger_worker
+import strategize_findings_manager
+import synthetic
+
+TABLE_NAME = "securityhub-findings-manager-worker-idempotency"
+
+
+@pytest.fixture(autouse=True)
+def worker(fake_aws, monkeypatch):
+    monkeypatch.setattr(idempotency_store, "IDEMPOTENCY_TABLE_NAME", TABLE_NAME)
+    idempotency_store._DYNAMODB_CLIENT = None
+    strategize_findings_manager._S3_CLIENT = None
+    fake_aws.put_findings(synthetic.generate_findings(20, 2))
+
+
+def rule(number: int, action: str = "SUPPRESSED") -> dict:
+    return {"note": f"rule {number}", "action": action, "match_on": {"security_control_id": synthetic.control_id(number)}}
+
+
+def record(message_id: str, *rules: dict) -> dict:
+    body = {"rules_version": "version", "sweep_id": None, "updated_since": [], "shards": [], "rules": list(rules)}
+    return {"messageId": message_id, "body": json.dumps(body)}
+
+
+def invoke(*records: dict) -> list:
+    response = securityhub_trigger_worker.lambda_handler({"Records": list(records)}, LambdaContext())
+    return [failure["itemIdentifier"] for failure in response["batchItemFailures"]]
+
+
+def suppressed(fake_aws, number: int) -> bool:
+    findings = [finding for finding in fake_aws.findings.values()
+                if finding["Compliance"]["SecurityControlId"] == synthetic.control_id(number)]
+    assert findings
+    return all(finding["Workflow"]["Status"] == "SUPPRESSED" for finding in findings)
+
+
+def test_applies_the_rules_of_every_message(fake_aws):
+    assert invoke(record("first", rule(0)), record("second", rule(1))) == []
+    assert suppressed(fake_aws, 0) and suppressed(fake_aws, 1)
+
+
+def test_reports_an_unreadable_message_and_applies_the_others(fake_aws):
+    assert invoke({"messageId": "unreadable", "body": "{"}, record("second", rule(1))) == ["unreadable"]
+    assert suppressed(fake_aws, 1)
+
+
+def test_reports_only_the_messages_that_fail_on_their_own(fake_aws):
+    assert invoke(record("first", rule(0)), record("invalid", rule(1, "INVALID"))) == ["invalid"]
+    assert suppressed(fake_aws, 0)
+    assert not suppressed(fake_aws, 1)
+
+
+def test_skips_the_rules_a_redelivered_message_already_applied(fake_aws):
+    assert invoke(record("first", rule(0))) == []
+    fake_aws.calls.clear()
+    assert invoke(record("first", rule(0))) == []
+    assert fake_aws.calls["securityhub:GetFindings"] == 0
+
+
+def test_applies_redelivered_messages_again_without_the_idempotency_table(fake_aws, monkeypatch):
+    monkeypatch.setattr(idempotency_store, "IDEMPOTENCY_TABLE_NAME", "")
+    assert invoke(record("first", rule(0))) == []
+    fake_aws.calls.clear()
+    assert invoke(record("first", rule(0))) == []
+    assert fake_aws.calls["securityhub:GetFindings"] > 0
+    assert not any(call.startswith("dynamodb:") for call in fake_aws.calls)
@@ -0,0 +1,78 @@
+import logging
+
+import pytest
+import yaml
+from awsfindingsmanagerlib import Rule
+
+import strategize_findings_manager
+from rulebook import compile_rulebook, dump_rulebook
+from strategize_findings_manager import (
+    S3_BUCKET_NAME, S3_COMPILED_OBJECT_NAME, S3_OBJECT_NAME, compiled_rule, load_findings_manager
+)
+
+LOGGER = logging.getLogger(__name__)
+
+
+def rules_yaml(*notes: str) -> bytes:
+    rules = [{"note": note, "action": "SUPPRESSED", "match_on": {"security_control_id": "S3.20"}} for note in notes]
+    return yaml.safe_dump({"Rules": rules}).encode()
+
+
+def deploy(fake_aws, contents: bytes, compiled: bool = True):
+    # Uploads the rules object and, like the trigger Lambda, compiles it from the uploaded version
+    fake_aws.put_object(S3_BUCKET_NAME, S3_OBJECT_NAME, contents)
+    if compiled:
+        etag = fake_aws.objects[(S3_BUCKET_NAME, S3_OBJECT_NAME)][1]
+        fake_aws.put_object(S3_BUCKET_NAME, S3_COMPILED_OBJECT_NAME, dump_rulebook(compile_rulebook(contents, etag)))
+
+
+def loaded_notes() -> list:
+    return [rule.note for rule in load_findings_manager(LOGGER).ordered_rules]
+
+
+@pytest.fixture(autouse=True)
+def cold_container():
+    strategize_findings_manager._RULES_CACHE.update(etag=None, findings_manager=None, validated_at=0.0)
+    strategize_findings_manager._S3_CLIENT = None
+
+
+def test_loads_the_compiled_rulebook_of_the_rules_object(fake_aws):
+    deploy(fake_aws, rules_yaml("first", "second"))
+    assert loaded_notes() == ["first", "second"]
+    assert fake_aws.calls["s3:GetObject"] == 1
+
+
+def test_ignores_a_compiled_rulebook_of_another_rules_version(fake_aws):
+    deploy(fake_aws, rules_yaml("old"))
+    assert loaded_notes() == ["old"]
+    # Uploaded but not compiled yet, or rejected by the trigger Lambda
+    deploy(fake_aws, rules_yaml("new"), compiled=False)
+    assert loaded_notes() == ["new"]
+
+
+def test_revalidates_the_cached_rules_with_the_etag_of_the_rules_object(fake_aws):
+    deploy(fake_aws, rules_yaml("first"))
+    loaded_notes()
+    fake_aws.calls.clear()
+    assert loaded_notes() == ["first"]
+    assert dict(fake_aws.calls) == {"s3:HeadObject": 1}
+
+
+def test_compiled_rule_behaves_like_a_validated_rule():
+    rules = yaml.safe_dump({"Rules": [
+        {"note": "control", "action": "SUPPRESSED", "match_on": {"security_control_id": "S3.20"}},
+        {"note": "resources", "action": "SUPPRESSED", "match_on": {
+            "rule_or_control_id": "arn:aws:securityhub:::ruleset/cis-aws-foundations-benchmark/v/1.2.0/rule/1.14",
+            "resource_id_regexps": ["^arn:aws:s3:::bucket-.*$", "^arn:aws:iam::.*:role/admin$"],
+            "regions": ["eu-west-1", "eu-central-1"],
+        }},
+        {"note": "tags", "action": "SUPPRESSED", "match_on": {
+            "product_name": "Inspector", "title": "CVE-2024-0001", "tags": [{"key": "env", "value": "dev"}],
+        }},
+    ]}).encode()
+    for data in compile_rulebook(rules)["rules"]:
+        compiled, validated = compiled_rule(data), Rule(**data)
+        assert compiled == validated and hash(compiled) == hash(validated)
+        for attribute in ("data", "note", "action", "match_on", "product_name", "security_control_id",
+                          "rule_or_control_id", "resource_id_regexps", "title", "regions", "tags", "query_filter"):
+            assert getattr(compiled, attribute) == getattr(validated, attribute), attribute
@@ -1,9 +1,25 @@
+variable "finding_fingerprints" {
+  type = object({
+    enabled     = optional(bool, false)
+    store       = optional(string, "dynamodb")
+    ttl_seconds = optional(number, 604800)
+  })
+  default     = {}
+  description = "Skip re-imported findings that are unchanged since the events and Jira Lambdas last processed them, remembering their fingerprints in DynamoDB or in the memory of each Lambda container"
+
+  validation {
+    condition     = contains(["dynamodb", "memory"], var.finding_fingerprints.store)
+    error_message = "The 'store' must be either \"dynamodb\" or \"memory\"."
+  }
+}
+
 variable "findings_manager_events_lambda" {
   type = object({
-    name        = optional(string, "securityhub-findings-manager-events")
-    log_level   = optional(string, "ERROR")
-    memory_size = optional(number, 256)
-    timeout     = optional(number, 300)
+    name                    = optional(string, "securityhub-findings-manager-events")
+    log_level               = optional(string, "ERROR")
+    memory_size             = optional(number, 256)
+    rules_cache_ttl_seconds = optional(number, 0)
+    timeout                 = optional(number, 300)
 
     security_group_egress_rules = optional(list(object({
       cidr_ipv4                    = optional(string)
@@ -27,10 +43,20 @@ variable "findings_manager_events_lambda" {
 
 variable "findings_manager_trigger_lambda" {
   type = object({
-    name        = optional(string, "securityhub-findings-manager-trigger")
-    log_level   = optional(string, "ERROR")
-    memory_size = optional(number, 256)
-    timeout     = optional(number, 300)
+    name                        = optional(string, "securityhub-findings-manager-trigger")
+    full_sweep_interval_seconds = optional(number, 604800)
+    log_level                   = optional(string, "ERROR")
+    memory_size                 = optional(number, 256)
+    rules_per_message           = optional(number, 1)
+    sweep_changed_rules_only    = optional(bool, true)
+    sweep_schedule_expression   = optional(string)
+    timeout                     = optional(number, 300)
+    unsuppress_removed_rules    = optional(bool, false)
+
+    sweep_shards = optional(object({
+      account_ids = optional(list(string), [])
+      regions     = optional(list(string), [])
+    }))
 
     security_group_egress_rules = optional(list(object({
       cidr_ipv4                    = optional(string)
@@ -46,6 +72,11 @@ variable "findings_manager_trigger_lambda" {
   default     = {}
   description = "Findings Manager Lambda settings - Manage Security Hub findings in response to S3 file upload triggers"
 
+  validation {
+    condition     = var.findings_manager_trigger_lambda.rules_per_message >= 1
+    error_message = "The \"rules_per_message\" must be at least 1."
+  }
+
   validation {
     condition     = alltrue([for o in var.findings_manager_trigger_lambda.security_group_egress_rules : (o.cidr_ipv4 != null || o.cidr_ipv6 != null || o.prefix_list_id != null || o.referenced_security_group_id != null)])
     error_message = "Although \"cidr_ipv4\", \"cidr_ipv6\", \"prefix_list_id\", and \"referenced_security_group_id\" are all marked as optional, you must provide one of them in order to configure the destination of the traffic."
@@ -54,10 +85,14 @@ variable "findings_manager_trigger_lambda" {
 
 variable "findings_manager_worker_lambda" {
   type = object({
-    name        = optional(string, "securityhub-findings-manager-worker")
-    log_level   = optional(string, "ERROR")
-    memory_size = optional(number, 256)
-    timeout     = optional(number, 900)
+    name                    = optional(string, "securityhub-findings-manager-worker")
+    idempotency_enabled     = optional(bool, false)
+    idempotency_ttl_seconds = optional(number, 86400)
+    log_level               = optional(string, "ERROR")
+    maximum_concurrency     = optional(number, 4)
+    memory_size             = optional(number, 256)
+    stream_findings         = optional(bool, true)
+    timeout                 = optional(number, 900)
 
     security_group_egress_rules = optional(list(object({
       cidr_ipv4                    = optional(string)
@@ -73,6 +108,11 @@ variable "findings_manager_worker_lambda" {
   default     = {}
   description = "Findings Manager Lambda settings - Manage Security Hub findings in response to SQS trigger"
 
+  validation {
+    condition     = var.findings_manager_worker_lambda.maximum_concurrency >= 2 && var.findings_manager_worker_lambda.maximum_concurrency <= 1000
+    error_message = "The \"maximum_concurrency\" must be between 2 and 1000."
+  }
+
   validation {
     condition     = alltrue([for o in var.findings_manager_worker_lambda.security_group_egress_rules : (o.cidr_ipv4 != null || o.cidr_ipv6 != null || o.prefix_list_id != null || o.referenced_security_group_id != null)])
     error_message = "Although \"cidr_ipv4\", \"cidr_ipv6\", \"prefix_list_id\", and \"referenced_security_group_id\" are all marked as optional, you must provide one of them in order to configure the destination of the traffic."
@@ -95,6 +135,8 @@ variable "jira_integration" {
     exclude_account_ids                   = optional(list(string), [])
     finding_severity_normalized_threshold = optional(number, 70)
     include_product_names                 = optional(list(string), [])
+    issue_description_max_bytes           = optional(number, 16384)
+    routing_mode                          = optional(string, "step_function")
 
     security_group_egress_rules = optional(list(object({
       cidr_ipv4                    = optional(string)
@@ -107,11 +149,27 @@ variable "jira_integration" {
       to_port                      = optional(number, 0)
     })), [])
 
+    issue_claims = optional(object({
+      enabled     = optional(bool, false)
+      store       = optional(string, "dynamodb")
+      ttl_seconds = optional(number, 900)
+    }), {})
+
     lambda_settings = optional(object({
-      name        = optional(string, "securityhub-findings-manager-jira")
-      log_level   = optional(string, "ERROR")
-      memory_size = optional(number, 256)
-      timeout     = optional(number, 60)
+      name                         = optional(string, "securityhub-findings-manager-jira")
+      client_cache_ttl_seconds     = optional(number, 900)
+      log_level                    = optional(string, "ERROR")
+      memory_size                  = optional(number, 256)
+      timeout                      = optional(number, 60)
+      transition_cache_ttl_seconds = optional(number, 3600)
+    }), {})
+
+    queue = optional(object({
+      batch_size                      = optional(number, 50)
+      enabled                         = optional(bool, false)
+      max_concurrency_per_instance    = optional(number, 4)
+      maximum_batching_window_seconds = optional(number, 10)
+      maximum_concurrency             = optional(number, 2)
     }), {})
 
     step_function_settings = optional(object({
@@ -193,6 +251,37 @@ variable "jira_integration" {
     )
     error_message = "When 'autoclose_suppressed_findings' is set to true, 'autoclose_enabled' must also be set to true."
   }
+
+  validation {
+    condition = var.jira_integration == null || (
+      var.jira_integration.issue_description_max_bytes >= 4096 && var.jira_integration.issue_description_max_bytes <= 32767
+    )
+    error_message = "The 'issue_description_max_bytes' must be between 4096 and 32767, the size limit of a Jira text field."
+  }
+
+  validation {
+    condition     = var.jira_integration == null || contains(["dynamodb", "memory"], var.jira_integration.issue_claims.store)
+    error_message = "The 'issue_claims.store' must be either \"dynamodb\" or \"memory\"."
+  }
+
+  validation {
+    condition     = var.jira_integration == null || contains(["lambda", "step_function"], var.jira_integration.routing_mode)
+    error_message = "The 'routing_mode' must be either \"lambda\" or \"step_function\"."
+  }
+
+  validation {
+    condition = var.jira_integration == null || (
+      var.jira_integration.queue.batch_size >= 1 && var.jira_integration.queue.batch_size <= 10000 &&
+      var.jira_integration.queue.maximum_concurrency >= 2 && var.jira_integration.queue.maximum_concurrency <= 1000 &&
+      var.jira_integration.queue.max_concurrency_per_instance >= 1
+    )
+    error_message = "The Jira 'queue' needs a 'batch_size' between 1 and 10000, a 'maximum_concurrency' between 2 and 1000 and a 'max_concurrency_per_instance' of at least 1."
+  }
+
+  validation {
+    condition     = var.jira_integration == null || var.jira_integration.queue.batch_size <= 10 || var.jira_integration.queue.maximum_batching_window_seconds >= 1
+    error_message = "A Jira 'queue' with a 'batch_size' over 10 needs a 'maximum_batching_window_seconds' of at least 1, SQS event sources require a batching window for batches of more than 10 messages."
+  }
 }
 
 variable "jira_step_function_iam_role_name" {
@@ -217,6 +306,29 @@ variable "lambda_runtime" {
   }
 }
 
+variable "observability" {
+  type = object({
+    metrics_enabled         = optional(bool, false)
+    metrics_namespace       = optional(string, "SecurityHubFindingsManager")
+    payload_log_max_length  = optional(number, 2048)
+    payload_log_mode        = optional(string, "digest")
+    payload_log_sample_rate = optional(number, 1)
+    tracing_enabled         = optional(bool, false)
+  })
+  default     = {}
+  description = "CloudWatch metrics of the Lambdas, published as embedded metric format log lines, AWS X-Ray tracing of their Security Hub and Jira calls, and how they log events and rules below the DEBUG log level"
+
+  validation {
+    condition     = contains(["digest", "full", "off", "truncate"], var.observability.payload_log_mode)
+    error_message = "The 'payload_log_mode' must be one of \"digest\", \"full\", \"off\" or \"truncate\"."
+  }
+
+  validation {
+    condition     = var.observability.payload_log_sample_rate >= 0 && var.observability.payload_log_sample_rate <= 1
+    error_message = "The 'payload_log_sample_rate' must be between 0 and 1."
+  }
+}
+
 variable "region" {
   type        = string
   default     = null